@@ -0,0 +1,158 @@
+import brains.sweep as sweep
+
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import importlib
+import json
+import multiprocessing
+import resource
+import sys
+
+# Times display-less runs of each world on each execution type with a fixed seed. Every run
+# happens in a new process so peak memory belongs to that run alone.
+#
+# Results can be saved as a baseline and later runs compared against it. Comparing fails when
+# steps per second dropped by more than the allowed percentage for any world and execution
+# type found in both.
+
+# epochs run for each world by default. Enough to include several epoch updates while keeping
+# the python backend quick.
+WORLD_EPOCHS = {"parameter": 10,
+                "stdp": 20,
+                "easy": 20,
+                "handwriting": 10,
+                "mnist": 2}
+
+def available_execution_types():
+    execution_types = ["python", "numpy"]
+    try:
+        iron_brains = importlib.import_module("iron_brains")
+    except ImportError:
+        return execution_types
+    if hasattr(iron_brains, "create"):
+        execution_types.append("rust")
+    return execution_types
+
+def _measure(world, execution_type, epochs, seed):
+    result = sweep.run_world(["--world", world, "--execution_type", execution_type],
+                             {}, epochs, seed)
+    # kilobytes on linux
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+
+def run_benchmark(world, execution_type, epochs, seed=0):
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        try:
+            result = executor.submit(_measure, world, execution_type, epochs, seed).result()
+        except Exception as error:
+            return {"world": world, "execution_type": execution_type, "error": repr(error)}
+
+    return {"world": world,
+            "execution_type": execution_type,
+            "epochs": epochs,
+            "steps_per_second": result["steps_per_second"],
+            "seconds_per_epoch": result["wall_time"] / epochs,
+            "peak_rss_mb": result["peak_rss_mb"],
+            "accuracy": result["accuracy"]}
+
+def benchmark_key(result):
+    return f"{result['world']}/{result['execution_type']}"
+
+def compare(results, baseline, max_regression):
+    '''
+    Returns a message for every result whose steps per second is more than max_regression
+    percent below the baseline.
+    '''
+    regressions = []
+    for result in results:
+        key = benchmark_key(result)
+        if key not in baseline or "error" in result or "error" in baseline[key]:
+            continue
+
+        baseline_steps_per_second = baseline[key]["steps_per_second"]
+        change = 100 * (result["steps_per_second"] - baseline_steps_per_second) \
+            / baseline_steps_per_second
+        if change < -max_regression:
+            regressions.append(f"{key} {result['steps_per_second']:.0f} steps/sec is "
+                               f"{-change:.1f}% slower than baseline "
+                               f"{baseline_steps_per_second:.0f}")
+    return regressions
+
+def print_results(results):
+    print(f"{'benchmark':<24}{'steps/sec':>12}{'sec/epoch':>12}{'peak rss mb':>14}")
+    for result in results:
+        if "error" in result:
+            print(f"{benchmark_key(result):<24} failed {result['error']}")
+            continue
+        print(f"{benchmark_key(result):<24}{result['steps_per_second']:>12.0f}"
+              f"{result['seconds_per_epoch']:>12.4f}{result['peak_rss_mb']:>14.1f}")
+
+def create_args():
+    my_parser = argparse.ArgumentParser(description='Benchmark worlds on each execution type')
+    my_parser.add_argument('--worlds',
+                           type=str,
+                           nargs='+',
+                           choices=list(WORLD_EPOCHS.keys()),
+                           default=list(WORLD_EPOCHS.keys()),
+                           required=False,
+                           help='Worlds to benchmark.')
+    my_parser.add_argument('--execution_types',
+                           type=str,
+                           nargs='+',
+                           choices=["python", "numpy", "rust"],
+                           default=None,
+                           required=False,
+                           help='Execution types to benchmark. Defaults to every one that '\
+                           'can be loaded.')
+    my_parser.add_argument('--epoch_scale',
+                           type=float,
+                           default=1.0,
+                           required=False,
+                           help='Multiplies the number of epochs run for every world.')
+    my_parser.add_argument('--seed',
+                           type=int,
+                           default=0,
+                           required=False,
+                           help='Seed for every run.')
+    my_parser.add_argument('--save_baseline',
+                           type=str,
+                           default=None,
+                           required=False,
+                           help='Write results to this JSON file.')
+    my_parser.add_argument('--baseline',
+                           type=str,
+                           default=None,
+                           required=False,
+                           help='Compare results against this JSON file and exit with an '\
+                           'error if any got slower than allowed.')
+    my_parser.add_argument('--max_regression',
+                           type=float,
+                           default=10.0,
+                           required=False,
+                           help='Percent drop in steps per second allowed when comparing '\
+                           'against a baseline.')
+    return my_parser.parse_args()
+
+if __name__ == "__main__":
+    parameters = create_args()
+    execution_types = parameters.execution_types or available_execution_types()
+    results = []
+    for world in parameters.worlds:
+        epochs = max(1, round(WORLD_EPOCHS[world] * parameters.epoch_scale))
+        for execution_type in execution_types:
+            results.append(run_benchmark(world, execution_type, epochs, parameters.seed))
+    print_results(results)
+
+    if parameters.save_baseline:
+        with open(parameters.save_baseline, "w") as baseline_file:
+            json.dump({benchmark_key(result): result for result in results}, baseline_file,
+                      sort_keys=True, indent=4)
+
+    if parameters.baseline:
+        with open(parameters.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), parameters.max_regression)
+        for regression in regressions:
+            print(regression)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,23 @@
+import brains.benchmarks.run as run
+
+import unittest
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_compare(self):
+        baseline = {"easy/numpy": {"world": "easy", "execution_type": "numpy",
+                                   "steps_per_second": 1000.0},
+                    "stdp/numpy": {"world": "stdp", "execution_type": "numpy",
+                                   "steps_per_second": 1000.0}}
+        results = [{"world": "easy", "execution_type": "numpy", "steps_per_second": 850.0},
+                   {"world": "stdp", "execution_type": "numpy", "steps_per_second": 950.0},
+                   {"world": "stdp", "execution_type": "python", "steps_per_second": 1.0},
+                   {"world": "mnist", "execution_type": "numpy", "error": "failed"}]
+        regressions = run.compare(results, baseline, 10.0)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("easy/numpy"))
+        self.assertEqual(run.compare(results, baseline, 20.0), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+from brains.network import NetworkDefinition
+from brains.models.simple_model_builder import ModelParameters
+import brains.models.model_file as model_file
+
+from dataclasses import dataclass
+import dataclasses
+import importlib
+import json
+import numpy as np
+import os
+import random
+
+# Exports only keep synapse strengths so a run started from one has to wait for homeostasis
+# to settle again. A checkpoint keeps everything needed to carry on exactly where a run
+# stopped: the network and model parameters, all model state that changes as it runs, where
+# the environment is in its dataset with its ResultTracker, and the random state.
+#
+# Checkpoints are npz files. The synapses are stored as the same columns as binary model
+# files, model state arrays are stored as they are and everything else goes in a JSON header
+# stored as a byte array.
+
+VERSION = 1
+
+@dataclass
+class Checkpoint:
+    '''
+    step: first step to run after resuming
+    model_type: module of the model the checkpoint was taken from
+    '''
+    step: int
+    model_type: str
+    network_definition: NetworkDefinition
+    model_parameters: ModelParameters
+    model_state: dict
+    model_arrays: dict
+    environment_state: dict
+    random_state: list
+
+def save(file_path, step, model, environment):
+    '''
+    Saves model and environment as they are before step, which should be the first step of
+    an epoch. The file is replaced in one go so an interrupted save leaves the previous
+    checkpoint as it was.
+    '''
+    network_definition = model.network_definition
+    network_definition.assign_uuids()
+    columns, labels = model_file.synapse_columns(network_definition)
+    model_state, model_arrays = model.checkpoint_state()
+    header = {"version": VERSION,
+              "step": step,
+              "model_type": type(model).__module__,
+              "model_parameters": dataclasses.asdict(model.model_parameters),
+              "cell_definitions": [dataclasses.asdict(cell)
+                                   for cell in network_definition.cell_definitions],
+              "synapse_labels": labels,
+              "model_state": model_state,
+              "environment_state": environment.checkpoint_state(),
+              "random_state": random.getstate()}
+
+    arrays = {f"synapse_{name}": column for name, column in columns.items()}
+    arrays.update({f"model_{name}": array for name, array in model_arrays.items()})
+    encoded_header = np.frombuffer(json.dumps(header).encode("utf-8"), dtype=np.uint8)
+    temporary_path = f"{file_path}.tmp"
+    with open(temporary_path, "wb") as checkpoint_file:
+        np.savez(checkpoint_file, header=encoded_header, **arrays)
+    os.replace(temporary_path, file_path)
+
+def load(file_path):
+    with np.load(file_path) as checkpoint_file:
+        header = json.loads(checkpoint_file["header"].tobytes().decode("utf-8"))
+        if header["version"] != VERSION:
+            raise Exception(f"unsupported checkpoint version {header['version']}")
+        columns = {}
+        model_arrays = {}
+        for name in checkpoint_file.files:
+            if name.startswith("synapse_"):
+                columns[name[len("synapse_"):]] = checkpoint_file[name]
+            elif name.startswith("model_"):
+                model_arrays[name[len("model_"):]] = checkpoint_file[name]
+
+    network_definition = model_file.columns_network_definition(
+        header["cell_definitions"], columns, header["synapse_labels"])
+    return Checkpoint(header["step"], header["model_type"], network_definition,
+                      ModelParameters(**header["model_parameters"]),
+                      header["model_state"], model_arrays, header["environment_state"],
+                      header["random_state"])
+
+def restore(checkpoint, environment):
+    '''
+    A model of the same type as the one the checkpoint was taken from in the state it was
+    in. environment and random are put back the way they were.
+    '''
+    module = importlib.import_module(checkpoint.model_type)
+    model = module.SimpleModel(checkpoint.network_definition, checkpoint.model_parameters)
+    model.restore_state(checkpoint.model_state, checkpoint.model_arrays)
+    environment.restore_state(checkpoint.environment_state)
+    version, internal_state, gauss_next = checkpoint.random_state
+    random.setstate((version, tuple(internal_state), gauss_next))
+    return model
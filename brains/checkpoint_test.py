@@ -0,0 +1,54 @@
+import brains.checkpoint as checkpoint
+import brains.main as main
+import brains.models.integrate_model as integrate_model
+import brains.models.numpy_model as numpy_model
+import brains.models.simple_model_builder as simple_model_builder
+import brains.network_definitions as network_definitions
+from brains.environment.easy import EasyEnvironment
+
+import os
+import random
+import tempfile
+import unittest
+
+class TestCheckpoint(unittest.TestCase):
+
+    def run_easy_world(self, model_module, checkpoint_path, steps, checkpoint_step):
+        '''
+        Runs the easy world saving a checkpoint at checkpoint_step.
+        '''
+        model_parameters = simple_model_builder.handwriting_model_parameters()
+        model_parameters.synapse_type_parameters.max_strength = 0.4
+        network_definition = network_definitions.easy_layer_network()
+        random.seed(0)
+        model = model_module.SimpleModel(network_definition, model_parameters)
+        environment = EasyEnvironment(400, 50)
+
+        def epoch_ended(step):
+            if step == checkpoint_step:
+                checkpoint.save(checkpoint_path, step, model, environment)
+
+        main.run_compiled(model, environment, steps, True, epoch_ended=epoch_ended)
+        return environment._result_tracker, model.test_outputs()
+
+    def test_resume_matches_uninterrupted_run(self):
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint_path = os.path.join(directory, "checkpoint")
+            for model_module in [integrate_model, numpy_model]:
+                result_tracker, outputs = self.run_easy_world(model_module, checkpoint_path,
+                                                              6000, 2450)
+                self.assertGreater(result_tracker.rewarded, 0)
+
+                # nothing about the new environment or random carries over
+                random.seed(1)
+                environment = EasyEnvironment(400, 50)
+                saved = checkpoint.load(checkpoint_path)
+                self.assertEqual(saved.step, 2450)
+                self.assertEqual(saved.model_type, model_module.__name__)
+                model = checkpoint.restore(saved, environment)
+                main.run_compiled(model, environment, 6000, True, start_step=saved.step)
+                self.assertEqual(environment._result_tracker, result_tracker)
+                self.assertEqual(model.test_outputs(), outputs)
+
+if __name__ == '__main__':
+    unittest.main()
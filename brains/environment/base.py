@@ -1,4 +1,6 @@
+from brains.models.schedule import StepSchedule
 from dataclasses import dataclass
+import dataclasses
 from collections import defaultdict
 
 
@@ -70,6 +72,41 @@ class ResultTracker:
             self.accuracy = float(self.win) / float(self.win + self.fail)
 
 
+def epoch_bounds(step, epoch_length, input_delay):
+    '''
+    First step of the epoch step is in and the first step of the next one. Steps before
+    input_delay are in epochs starting before step 0.
+    '''
+    start_step = step - (step - input_delay) % epoch_length
+    return start_step, start_step + epoch_length
+
+class EpochSchedule(StepSchedule):
+    '''
+    Part of an epoch compiled ahead of time so a model can run through it with run_steps.
+
+    first_step: first step to run, end_step: first step of the next epoch
+    decision_step: step reward is decided on, None if there is none
+    reward: called with decision_step and the output ids fired since first_step, returns
+        whether to reward on decision_step
+    '''
+    def __init__(self, first_step, end_step, stimuli_by_step=None, active_steps=(),
+                 decision_step=None, reward=None):
+        super().__init__(stimuli_by_step, active_steps=active_steps)
+        self.first_step = first_step
+        self.end_step = end_step
+        self.decision_step = decision_step
+        self._reward = reward
+
+    def has_reward(self, step, output_events):
+        if step != self.decision_step or self._reward is None:
+            return False
+        return self._reward(step, [output_id for (_, output_id) in output_events])
+
+    def possible_reward_steps(self):
+        if self.decision_step is None or self._reward is None:
+            return set()
+        return {self.decision_step}
+
 class BaseEpochChallengeEnvironment():
     '''
     User is expected to implement:
@@ -81,6 +118,9 @@ class BaseEpochChallengeEnvironment():
     Class handles rewarding at the right time assuming that the correct output cell and only the
     current output cell must fire by half way through the epoch and that after that a reward should
     be given to the brain exactly one time.
+
+    Headless runs can use epoch_schedule instead of calling step, stimuli, active and
+    has_reward every step. The two should not be mixed in one run.
     '''
     def __init__(self, epoch_length, input_delay):
         self._epoch_length = epoch_length
@@ -120,6 +160,37 @@ class BaseEpochChallengeEnvironment():
             else:
                 self._success = False
                 
+    def epoch_schedule(self, step):
+        '''
+        EpochSchedule from step to the end of its epoch. Assumes stimuli and activity only
+        happen on the first step of an epoch, environments that do otherwise override this.
+        Must be called for each epoch in order. step is the first step of its epoch except
+        for the epoch step 0 falls in.
+        '''
+        start_step, end_step = epoch_bounds(step, self._epoch_length, self._input_delay)
+        stimuli_by_step = {}
+        active_steps = []
+        if start_step >= step:
+            # output ids are cleared at the start of an epoch so none need passing on
+            self.step(start_step, [])
+            stimuli_by_step[start_step] = self.stimuli(start_step)
+            if self.active(start_step):
+                active_steps.append(start_step)
+
+        decision_step = start_step + self._epoch_length//2
+        if decision_step < step:
+            decision_step = None
+        return EpochSchedule(step, end_step, stimuli_by_step, active_steps, decision_step,
+                             self._decide_reward)
+
+    def _decide_reward(self, step, output_ids):
+        '''
+        The step method on a decision step given all the output ids for the epoch at once.
+        '''
+        self._found_output_ids = list(output_ids)
+        self.step(step, [])
+        return self.has_reward()
+
     def has_success(self, desired_output_id):
         if desired_output_id is None:
             return False
@@ -137,6 +208,27 @@ class BaseEpochChallengeEnvironment():
             return True
         return False
 
+    def close(self):
+        '''
+        Called when a run is over. Dataset environments stop their pipeline's worker.
+        '''
+        pass
+
+    def checkpoint_state(self):
+        '''
+        JSON values for brains.checkpoint. Environments with more state add theirs to these.
+        '''
+        return {"found_output_ids": list(self._found_output_ids),
+                "success": self._success,
+                "reward_provided": self._reward_provided,
+                "result_tracker": dataclasses.asdict(self._result_tracker)}
+
+    def restore_state(self, state):
+        self._found_output_ids = list(state["found_output_ids"])
+        self._success = state["success"]
+        self._reward_provided = state["reward_provided"]
+        self._result_tracker = ResultTracker(**state["result_tracker"])
+
 class FakeEnvironment(BaseEpochChallengeEnvironment):
     def __init__(self, input_points, reward_ids, epoch_length, input_delay=0):
         super().__init__(epoch_length, input_delay)
@@ -163,3 +255,20 @@ class FakeEnvironment(BaseEpochChallengeEnvironment):
 
     def desired_output_id(self, step):
         return self._reward_id
+
+    def checkpoint_state(self):
+        state = super().checkpoint_state()
+        state["reward_id"] = self._reward_id
+        return state
+
+    def restore_state(self, state):
+        super().restore_state(state)
+        self._reward_id = state["reward_id"]
+
+    def epoch_schedule(self, step):
+        schedule = super().epoch_schedule(step)
+        for stimulus_step, stimuli in self._stimuli.items():
+            if schedule.first_step <= stimulus_step < schedule.end_step:
+                schedule.stimuli_by_step[stimulus_step] = stimuli
+                schedule.active_steps.add(stimulus_step)
+        return schedule
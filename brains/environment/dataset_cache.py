@@ -0,0 +1,53 @@
+from pathlib import Path
+import numpy as np
+
+# Arrays worked out from a dataset file are saved next to it so later runs can skip the
+# work. A cache is used until its dataset file changes size or modification time.
+#
+# Processes that create many environments, like sweep workers, can also keep the arrays in
+# memory so only their first environment reads the cache file.
+
+# arrays by cache path, size and modification time, None unless keep_loaded_arrays was called
+_loaded_arrays = None
+
+def keep_loaded_arrays():
+    '''
+    Keeps arrays in memory once loaded for the rest of the process. Kept arrays are shared
+    by every caller so they are made read only.
+    '''
+    global _loaded_arrays
+    if _loaded_arrays is None:
+        _loaded_arrays = {}
+
+def cached_arrays(dataset_path, cache_path, build):
+    '''
+    Dict of arrays from memory, the cache file or from build, which is called with no
+    arguments when there is no usable cache. A read only data directory only means building
+    every time.
+    '''
+    stat = Path(dataset_path).stat()
+    key = (str(cache_path), stat.st_size, stat.st_mtime_ns)
+    if _loaded_arrays is not None and key in _loaded_arrays:
+        return dict(_loaded_arrays[key])
+
+    arrays = _load_or_build(cache_path, stat, build)
+    if _loaded_arrays is not None:
+        for array in arrays.values():
+            array.setflags(write=False)
+        _loaded_arrays[key] = dict(arrays)
+    return arrays
+
+def _load_or_build(cache_path, stat, build):
+    if Path(cache_path).exists():
+        with np.load(cache_path) as cache:
+            if cache["size"] == stat.st_size and cache["mtime_ns"] == stat.st_mtime_ns:
+                return {name: cache[name] for name in cache.files
+                        if name not in ("size", "mtime_ns")}
+
+    arrays = build()
+    try:
+        with open(cache_path, "wb") as cache_file:
+            np.savez(cache_file, size=stat.st_size, mtime_ns=stat.st_mtime_ns, **arrays)
+    except OSError:
+        pass
+    return arrays
@@ -54,3 +54,16 @@ class EasyEnvironment(base.BaseEpochChallengeEnvironment):
             return 0
         else:
             return 1
+
+    def checkpoint_state(self):
+        state = super().checkpoint_state()
+        state["zero_stage"] = self._zero_stage
+        state["one_stage"] = self._one_stage
+        state["fire_the_random_input_cell"] = self._fire_the_random_input_cell
+        return state
+
+    def restore_state(self, state):
+        super().restore_state(state)
+        self._zero_stage = state["zero_stage"]
+        self._one_stage = state["one_stage"]
+        self._fire_the_random_input_cell = state["fire_the_random_input_cell"]
@@ -1,4 +1,22 @@
+from brains.environment.base import epoch_bounds
+import brains.environment.dataset_cache as dataset_cache
+from brains.environment.easy import EasyEnvironment
 from brains.environment.handwriting import HandwritingEnvironment
+import brains.environment.handwriting as handwriting
+from brains.environment.mnist import MnistEnvironment, read_idx
+from brains.environment.pipeline import ImagePipeline
+from brains.environment.stimulus_index import StimulusIndex, cached_stimulus_index, cache_path
+import brains.models.numpy_model as numpy_model
+import brains.models.simple_model_builder as simple_model_builder
+import brains.network_definitions as network_definitions
+import gc
+import json
+import numpy as np
+import os
+import random
+import tempfile
+import threading
+import time
 import unittest
 
 class TestHandwriting(unittest.TestCase):
@@ -18,8 +36,8 @@ class TestHandwriting(unittest.TestCase):
         # When not shuffled images are shown is alphabetical order.
         first_image_step = delay
         third_image_step = delay + frequency * 2
-        self.assertEqual(environment.stimuli(first_image_step), {(1, 0, 0.3), (0, 1, 0.3)})
-        self.assertEqual(environment.stimuli(third_image_step), {(1, 0, 0.3), (0, 1, 0.3), (1, 1, 0.3)})
+        self.assertEqual(environment.stimuli(first_image_step).as_tuples(), {(1, 0, 0.3), (0, 1, 0.3)})
+        self.assertEqual(environment.stimuli(third_image_step).as_tuples(), {(1, 0, 0.3), (0, 1, 0.3), (1, 1, 0.3)})
 
     def test_reward(self):
         # See comments in test_read_handwriting
@@ -54,5 +72,322 @@ class TestHandwriting(unittest.TestCase):
                 self.assertFalse(environment.has_reward())
             environment.step(i, output_ids)
 
+    def test_letter_subset(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "letters.csv")
+            with open(file_path, "w") as csv_file:
+                # a, o, x and o
+                csv_file.write("0,0,51,0,0\n14,0,51,51,0\n23,51,0,0,51\n14,51,51,0,0\n")
+            letter_numbers, images = handwriting.load_handwriting(file_path)
+            self.assertEqual(letter_numbers.tolist(), [0, 14, 23, 14])
+            self.assertEqual(images.shape, (4, 4))
+            self.assertTrue(handwriting.cache_path(file_path).exists())
+
+            environment = HandwritingEnvironment(100, 0, {'o': 0}, file_name=file_path)
+            self.assertEqual(environment.desired_output_id(0), 0)
+            self.assertEqual(environment.stimuli(100).as_tuples(), {(0, 0, 0.3), (1, 0, 0.3)})
+            self.assertEqual(environment.desired_output_id(100), 0)
+            # each image is only shown once
+            self.assertIsNone(environment.desired_output_id(200))
+            self.assertEqual(environment.stimuli(200), set())
+
+    def test_mismatched_rows(self):
+        # the values would divide evenly into two rows of three
+        with self.assertRaises(Exception):
+            handwriting.parse_lines(['0,1,2,3', '1,5'])
+        with self.assertRaises(Exception):
+            handwriting.parse_lines(['0,1,2', '1,5,6', '2,7'], lines_per_chunk=2)
+        letter_numbers, images = handwriting.parse_lines(['0,1,2', '1,5,6', '2,7,8'],
+                                                         lines_per_chunk=2)
+        self.assertEqual(letter_numbers.tolist(), [0, 1, 2])
+        self.assertEqual(images.tolist(), [[1, 2], [5, 6], [7, 8]])
+
+def write_idx(file_path, array):
+    with open(file_path, "wb") as idx_file:
+        idx_file.write(bytes([0, 0, 0x08, array.ndim]))
+        for size in array.shape:
+            idx_file.write(size.to_bytes(4, "big"))
+        idx_file.write(array.astype(np.uint8).tobytes())
+
+class TestMnist(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.image_file = os.path.join(self._directory.name, "images")
+        self.label_file = os.path.join(self._directory.name, "labels")
+        images = np.zeros((3, 28, 28), dtype=np.uint8)
+        images[0, 0, 1] = 200
+        images[1, 2, 3] = 51
+        images[2, 4, 5] = 50
+        write_idx(self.image_file, images)
+        write_idx(self.label_file, np.array([1, 7, 1]))
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_read_idx(self):
+        images = read_idx(self.image_file)
+        self.assertEqual(images.shape, (3, 28, 28))
+        self.assertEqual(images[1, 2, 3], 51)
+        self.assertEqual(read_idx(self.label_file).tolist(), [1, 7, 1])
+        with self.assertRaises(Exception):
+            read_idx(__file__)
+
+    def test_stimuli(self):
+        epoch_length = 100
+        environment = MnistEnvironment(epoch_length, shuffle=False,
+                                       number_of_possible_outputs=2,
+                                       files=(self.image_file, self.label_file))
+        self.assertEqual(environment.stimuli(0).as_tuples(), {(1, 0, 0.3)})
+        self.assertEqual(environment.stimuli(1), set())
+        # 50 is not bright enough to stimulate a cell
+        self.assertEqual(environment.stimuli(epoch_length).as_tuples(), set())
+        # label 7 is not a possible output so the two 1s and their negations are left
+        labels = [environment.desired_output_id(epoch * epoch_length) for epoch in range(1, 6)]
+        self.assertEqual(labels, [1, None, None, 1, 1])
+        with self.assertRaises(Exception):
+            environment.stimuli(0)
+
+        environment = MnistEnvironment(epoch_length, shuffle=False,
+                                       files=(self.image_file, self.label_file),
+                                       number_of_images=2)
+        # images in file order then their negations
+        self.assertEqual(environment.desired_output_id(0), 1)
+        self.assertEqual(environment.stimuli(epoch_length).as_tuples(), {(3, 2, 0.3)})
+        self.assertEqual(environment.desired_output_id(epoch_length), 7)
+        self.assertIsNone(environment.desired_output_id(2 * epoch_length))
+
+    def test_shuffled_passes(self):
+        epoch_length = 10
+        environment = MnistEnvironment(epoch_length, files=(self.image_file, self.label_file),
+                                       queue_size=2)
+        labels = [environment.desired_output_id(epoch * epoch_length) for epoch in range(60)]
+        # every pass shows each image and each negation once
+        for start in range(0, 60, 6):
+            self.assertEqual(sorted(labels[start:start + 6], key=str),
+                             sorted([1, 7, 1, None, None, None], key=str))
+
+    def negations(self, epochs, **options):
+        epoch_length = 10
+        environment = MnistEnvironment(epoch_length, shuffle=False,
+                                       files=(self.image_file, self.label_file), **options)
+        return [environment.stimuli(epoch * epoch_length).as_tuples()
+                for epoch in range(epochs) if epoch % 6 >= 3]
+
+    def test_negations(self):
+        # a seed gives the same negations and each showing is drawn anew
+        negations = self.negations(12, negative_seed=3, negative_density=0.5)
+        self.assertEqual(negations, self.negations(12, negative_seed=3, negative_density=0.5))
+        self.assertNotEqual(negations[:3], negations[3:])
+        pixels = [len(stimuli) for stimuli in negations]
+        self.assertTrue(all(250 < count < 540 for count in pixels))
+
+        # stored negations are the same every pass
+        negations = self.negations(12, negative_seed=3, stored_negatives=True)
+        self.assertEqual(negations[:3], negations[3:])
+        self.assertEqual(negations, self.negations(12, negative_seed=3,
+                                                   stored_negatives=True))
+        self.assertEqual(self.negations(6, negative_density=0), [set(), set(), set()])
+
+    def test_close(self):
+        threads = threading.active_count()
+        environments = [MnistEnvironment(10, files=(self.image_file, self.label_file),
+                                         queue_size=2) for _ in range(20)]
+        environments[0].stimuli(0)
+        for environment in environments:
+            environment.close()
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_resume(self):
+        epoch_length = 10
+        options = {"files": (self.image_file, self.label_file), "negative_density": 0.5}
+        def shown(environment, epochs):
+            return [(environment.desired_output_id(epoch * epoch_length),
+                     environment.stimuli(epoch * epoch_length).as_tuples())
+                    for epoch in epochs]
+
+        environment = MnistEnvironment(epoch_length, negative_seed=3, **options)
+        items = shown(environment, range(5))
+        state = json.loads(json.dumps(environment.checkpoint_state()))
+        items += shown(environment, range(5, 20))
+
+        # the image being shown is made again then the rest follow as before
+        resumed = MnistEnvironment(epoch_length, **options)
+        resumed.restore_state(state)
+        self.assertEqual(resumed.desired_output_id(4 * epoch_length), items[4][0])
+        self.assertEqual(shown(resumed, range(5, 20)), items[5:])
+
+class TestEpochSchedule(unittest.TestCase):
+    def test_epoch_bounds(self):
+        self.assertEqual(epoch_bounds(0, 400, 50), (-350, 50))
+        self.assertEqual(epoch_bounds(50, 400, 50), (50, 450))
+        self.assertEqual(epoch_bounds(449, 400, 50), (50, 450))
+
+    def test_possible_reward_steps(self):
+        environment = EasyEnvironment(400, 50)
+        # step 0 is past the decision step of the epoch before step 50
+        self.assertEqual(environment.epoch_schedule(0).possible_reward_steps(), set())
+        self.assertEqual(environment.epoch_schedule(50).possible_reward_steps(), {250})
+
+    def run_easy_world(self, compiled, steps):
+        model_parameters = simple_model_builder.handwriting_model_parameters()
+        model_parameters.synapse_type_parameters.max_strength = 0.4
+        network_definition = network_definitions.easy_layer_network()
+        random.seed(0)
+        model = numpy_model.SimpleModel(network_definition, model_parameters)
+        environment = EasyEnvironment(400, 50)
+        if compiled:
+            step = 0
+            while step < steps:
+                schedule = environment.epoch_schedule(step)
+                model.run_steps(step, min(schedule.end_step, steps) - step, schedule)
+                step = schedule.end_step
+        else:
+            output_ids = []
+            for i in range(steps):
+                environment.step(i, output_ids)
+                output_ids = model.step(i, environment.stimuli(i), environment.has_reward(),
+                                        environment.active(i))
+        return environment._result_tracker, model.test_outputs()
+
+    def test_matches_per_step(self):
+        result_tracker, outputs = self.run_easy_world(False, 6000)
+        self.assertGreater(result_tracker.rewarded, 0)
+        self.assertEqual(self.run_easy_world(True, 6000), (result_tracker, outputs))
+
+class TestStimulusIndex(unittest.TestCase):
+    def test_active_pixels(self):
+        stimulus_index = StimulusIndex.build(np.array([[0, 60, 70], [0, 0, 0], [51, 50, 0]]),
+                                             50)
+        self.assertEqual(len(stimulus_index), 3)
+        self.assertEqual(stimulus_index.active_pixels(0).tolist(), [1, 2])
+        self.assertEqual(stimulus_index.active_pixels(1).tolist(), [])
+        self.assertEqual(stimulus_index.active_pixels(2).tolist(), [0])
+
+        stimulus_index = StimulusIndex.concatenate(
+            [stimulus_index, StimulusIndex.build(np.array([[0, 0, 90]]), 50)])
+        self.assertEqual(len(stimulus_index), 4)
+        self.assertEqual(stimulus_index.active_pixels(0).tolist(), [1, 2])
+        self.assertEqual(stimulus_index.active_pixels(3).tolist(), [2])
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            dataset_path = os.path.join(directory, "images")
+            with open(dataset_path, "wb") as dataset_file:
+                dataset_file.write(b"dataset")
+            images = np.array([[0, 60], [60, 0]])
+            read_calls = []
+            def read_images():
+                read_calls.append(True)
+                return images
+
+            cached_stimulus_index(dataset_path, 50, read_images)
+            self.assertTrue(cache_path(dataset_path, 50).exists())
+            stimulus_index = cached_stimulus_index(dataset_path, 50, read_images)
+            self.assertEqual(len(read_calls), 1)
+            self.assertEqual(stimulus_index.active_pixels(1).tolist(), [0])
+
+            # a different threshold or a changed file builds the index again
+            cached_stimulus_index(dataset_path, 70, read_images)
+            self.assertEqual(len(read_calls), 2)
+            with open(dataset_path, "ab") as dataset_file:
+                dataset_file.write(b"more")
+            cached_stimulus_index(dataset_path, 50, read_images)
+            self.assertEqual(len(read_calls), 3)
+
+    def test_kept_arrays(self):
+        self.addCleanup(setattr, dataset_cache, "_loaded_arrays", None)
+        dataset_cache.keep_loaded_arrays()
+        with tempfile.TemporaryDirectory() as directory:
+            dataset_path = os.path.join(directory, "images")
+            with open(dataset_path, "wb") as dataset_file:
+                dataset_file.write(b"dataset")
+            read_calls = []
+            def read_images():
+                read_calls.append(True)
+                return np.array([[0, 60], [60, 0]])
+
+            cached_stimulus_index(dataset_path, 50, read_images)
+            # kept arrays are used without the cache file
+            os.remove(cache_path(dataset_path, 50))
+            stimulus_index = cached_stimulus_index(dataset_path, 50, read_images)
+            self.assertEqual(len(read_calls), 1)
+            self.assertEqual(stimulus_index.active_pixels(1).tolist(), [0])
+            self.assertFalse(stimulus_index.pixels.flags.writeable)
+
+            with open(dataset_path, "ab") as dataset_file:
+                dataset_file.write(b"more")
+            cached_stimulus_index(dataset_path, 50, read_images)
+            self.assertEqual(len(read_calls), 2)
+
+class TestImagePipeline(unittest.TestCase):
+    def test_order(self):
+        pipeline = ImagePipeline(5, lambda item_index, presentation: item_index, shuffle=False,
+                                 loop=False, queue_size=2)
+        self.assertEqual([pipeline.next() for _ in range(7)], [0, 1, 2, 3, 4, None, None])
+
+        pipeline = ImagePipeline(5, lambda item_index, presentation: item_index, seed=1)
+        first_pass = [pipeline.next() for _ in range(5)]
+        self.assertEqual(sorted(first_pass), [0, 1, 2, 3, 4])
+        self.assertEqual(sorted(pipeline.next() for _ in range(5)), [0, 1, 2, 3, 4])
+        pipeline.close()
+
+        pipeline = ImagePipeline(5, lambda item_index, presentation: item_index, seed=1)
+        self.assertEqual([pipeline.next() for _ in range(5)], first_pass)
+        pipeline.close()
+
+    def test_restart(self):
+        pipeline = ImagePipeline(5, lambda item_index, presentation: (item_index, presentation),
+                                 seed=1)
+        items = [pipeline.next() for _ in range(12)]
+        self.assertEqual([presentation for (_, presentation) in items], list(range(12)))
+
+        # a restarted pipeline carries on as if the skipped items had been given out
+        pipeline = pipeline.restarted(1, 7)
+        self.assertEqual([pipeline.next() for _ in range(5)], items[7:])
+        pipeline.close()
+
+        pipeline = ImagePipeline(3, lambda item_index, presentation: item_index, shuffle=False,
+                                 loop=False, start=2)
+        self.assertEqual([pipeline.next() for _ in range(2)], [2, None])
+        pipeline = pipeline.restarted(None, 3)
+        self.assertIsNone(pipeline.next())
+
+    def test_close(self):
+        threads = threading.active_count()
+        pipeline = ImagePipeline(5, lambda item_index, presentation: item_index, queue_size=2)
+        self.assertEqual(threading.active_count(), threads + 1)
+        # the worker is waiting on a full queue
+        time.sleep(0.05)
+        pipeline.close()
+        self.assertEqual(threading.active_count(), threads)
+        self.assertIsNone(pipeline.next())
+
+    def test_owner_dropped(self):
+        class Owner:
+            def __init__(self):
+                self.pipeline = ImagePipeline(5, self.load_item, queue_size=2)
+
+            def load_item(self, item_index, presentation):
+                return item_index
+
+        threads = threading.active_count()
+        owner = Owner()
+        self.assertIsNotNone(owner.pipeline.next())
+        # the worker does not keep the owner alive and stops once it is gone
+        del owner
+        gc.collect()
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_worker_failure(self):
+        def load_item(item_index, presentation):
+            if item_index == 1:
+                raise ValueError("bad image")
+            return item_index
+
+        pipeline = ImagePipeline(3, load_item, shuffle=False)
+        self.assertEqual(pipeline.next(), 0)
+        with self.assertRaises(ValueError):
+            pipeline.next()
+
 if __name__ == '__main__':
     unittest.main()
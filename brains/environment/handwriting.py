@@ -1,108 +1,157 @@
 import brains.utils as utils
 import brains.environment.base as base
+from brains.environment.dataset_cache import cached_arrays
+from brains.environment.stimulus_index import StimulusIndex, pixel_stimuli
+from brains.environment.stimulus_index import cached_stimulus_index
+from brains.environment.pipeline import ImagePipeline, PipelineCursor
 
+from pathlib import Path
+import itertools
+import numpy as np
 import string
-import random
-from collections import defaultdict
+
+ALPHABET = list(string.ascii_lowercase)
+STIMULUS_THRESHOLD = 50
+
+# Rows of the handwriting CSV files are a letter number, 0 for a, followed by the pixels of a
+# square image.
 
 class HandwritingEnvironment(base.BaseEpochChallengeEnvironment):
+    '''
+    Each image is shown once. Images are streamed from an ImagePipeline.
+
+    output_id_by_letter: letters to show and the output each should fire. Other letters in
+        the file are skipped.
+    queue_size: how many images the pipeline prepares ahead of time
+    '''
     def __init__(self, epoch_length, input_delay, output_id_by_letter,
-                 image_lines=None, shuffle=False, file_name=None):
+                 image_lines=None, shuffle=False, file_name=None, queue_size=64):
         super().__init__(epoch_length, input_delay)
         self._possible_outputs = range(len(output_id_by_letter))
 
-        self._image_width = None
         if (image_lines is None and file_name is None) or (image_lines and file_name):
             raise Exception("HandwrittenEnvironment contructor requires either a file_name or image_lines but not both")
-        
+
         if image_lines is None:
-            image_lines = self._get_image_lines_from_file(file_name)
-        
+            file_path = utils.data_dir_file_path(file_name)
+            letter_numbers, images = load_handwriting(file_path)
+            self._stimulus_index = cached_stimulus_index(file_path, STIMULUS_THRESHOLD,
+                                                         lambda: images)
+        else:
+            letter_numbers, images = parse_lines(image_lines)
+            self._stimulus_index = StimulusIndex.build(images, STIMULUS_THRESHOLD)
+
+        self._image_width = utils.newtons_square_root(images.shape[1])
+        if self._image_width**2 != images.shape[1]:
+            raise Exception("bad image size", images.shape[1])
+
         self._output_id_by_letter = output_id_by_letter
         wanted_letters = sorted(output_id_by_letter.keys())
-        self._images = self._load_handwriting(image_lines, wanted_letters, shuffle)
+        # rows of the images to show grouped by letter
+        self._rows = []
+        for letter in wanted_letters:
+            (rows,) = np.nonzero(letter_numbers == ALPHABET.index(letter))
+            self._rows += rows.tolist()
+        self._letter_numbers = letter_numbers
 
-    def desired_output_id(self, step):
-        real_step = step - self._input_delay
-        if real_step//self._epoch_length >= len(self._images):
-            return None
+        pipeline = ImagePipeline(len(self._rows), self._load_item, shuffle=shuffle,
+                                 loop=False, queue_size=queue_size)
+        self._cursor = PipelineCursor(pipeline, epoch_length, input_delay)
+
+    def _load_item(self, item_index, presentation):
+        row = self._rows[item_index]
+        letter = ALPHABET[self._letter_numbers[row]]
+        return letter, pixel_stimuli(self._stimulus_index.active_pixels(row),
+                                     self._image_width, 0.3)
 
-        if real_step < 0:
+    def desired_output_id(self, step):
+        item = self._cursor.item(step)
+        if item is None:
             return None
 
-        image_index = real_step//self._epoch_length
-        (letter, image) = self._images[image_index]
+        (letter, stimuli) = item
         return self._output_id_by_letter[letter]
-        
+
     def stimuli(self, step):
         real_step = step - self._input_delay
         is_correct_time = real_step % self._epoch_length == 0 and real_step >= 0
         if not is_correct_time:
             return set()
 
-        image_index = real_step//self._epoch_length
-        if image_index >= len(self._images):
+        item = self._cursor.item(step)
+        if item is None:
             #print("ran out of images to show network will continue running with no inputs")
             return set()
 
-        stimuli = set()
-        (letter, image) = self._images[image_index]
-        for i, pixel in enumerate(image):
-            if pixel > 50:
-                x = i % self._image_width
-                y = i // self._image_width
-                stimuli.add((x, y, 0.3,))
+        (letter, stimuli) = item
         return stimuli
 
-    def _get_image_lines_from_file(self, file_name):
-        file_path = utils.data_dir_file_path(file_name)
-        return open(file_path)
-        
-
-    def _load_handwriting(self, lines, wanted_letters, shuffle):
-        alphabet = list(string.ascii_lowercase)
-        images_by_letter = defaultdict(list)
-        for line in lines:
-            cells = line.split(",")
-            if cells[-1][-1] == '\n':
-                cells[-1] = cells[-1][:-1]
-            cells = [int(cell) for cell in cells if cell ]
-            image = cells[1:]
-            if self._image_width is None:
-                self._image_width = utils.newtons_square_root(len(image))
-            if self._image_width**2 != len(image):
-                # need to look up how exceptions work
-                raise Exception("bad image size", len(image))
-                
-            letter = alphabet[cells[0]]
-            images_by_letter[letter].append(image)
-
-        letter_image_pairs = []
-        for letter in wanted_letters:
-            for image in images_by_letter[letter]:
-                letter_image_pairs.append((letter, image,))
-        if shuffle:
-            random.shuffle(letter_image_pairs)
-        return letter_image_pairs
-
-def shorten_file():
-    input_file = open(utils.data_dir_file_path("A_Z Handwritten Data.csv"))
-    output_file = open(utils.data_dir_file_path("o_x_hand_written_all.csv"), 'w')
-
-    wanted_images_per_letter = 5000
-    wanted_letters = ['o', 'x']
-    letter_counts = {'o': 0, 'x': 0}
-    for line in input_file:
-        cells = line.split(",")
-        alphabet = list(string.ascii_lowercase)
-        letter = alphabet[int(cells[0])]
-        if letter in wanted_letters:
-            if letter_counts[letter] > wanted_images_per_letter:
-                continue
-            output_file.write(line)
-            letter_counts[letter] += 1
-    print(letter_counts)
+    def close(self):
+        self._cursor.close()
+
+    def checkpoint_state(self):
+        state = super().checkpoint_state()
+        state["pipeline"] = self._cursor.checkpoint_state()
+        return state
+
+    def restore_state(self, state):
+        super().restore_state(state)
+        self._cursor.restore_state(state["pipeline"])
+
+def parse_lines(lines, lines_per_chunk=10000):
+    '''
+    Letter numbers and images from CSV lines. Lines are parsed a chunk at a time with numpy
+    rather than one value at a time.
+    '''
+    lines = iter(lines)
+    letter_number_chunks = []
+    image_chunks = []
+    row_length = None
+    while True:
+        chunk = [line.strip().rstrip(",") for line in itertools.islice(lines, lines_per_chunk)]
+        chunk = [line for line in chunk if line]
+        if not chunk:
+            break
+        # every row is checked since rows of different lengths can still fill a whole chunk
+        row_lengths = np.char.count(np.array(chunk), ",") + 1
+        if row_length is None:
+            row_length = int(row_lengths[0])
+        if np.any(row_lengths != row_length):
+            raise Exception("handwriting rows have different lengths")
+        values = np.fromstring(",".join(chunk), dtype=np.int64, sep=",")
+        if len(values) != len(chunk) * row_length:
+            raise Exception("handwriting rows have missing values")
+        values = values.reshape(len(chunk), row_length)
+        if values.min() < 0 or values.max() > 255:
+            raise Exception("handwriting values must be between 0 and 255")
+        values = values.astype(np.uint8)
+        letter_number_chunks.append(values[:, 0])
+        image_chunks.append(values[:, 1:])
+
+    if not image_chunks:
+        raise Exception("no handwriting images")
+    return np.concatenate(letter_number_chunks), np.concatenate(image_chunks)
+
+def cache_path(file_path):
+    file_path = Path(file_path)
+    return file_path.with_name(f"{file_path.name}.npz")
+
+def load_handwriting(file_path):
+    '''
+    Letter numbers and images from a handwriting CSV. The parsed arrays are cached next to
+    the CSV so the file is only parsed again when it changes.
+    '''
+    def build():
+        with open(file_path) as csv_file:
+            letter_numbers, images = parse_lines(csv_file)
+        return {"letter_numbers": letter_numbers, "images": images}
+
+    arrays = cached_arrays(file_path, cache_path(file_path), build)
+    return arrays["letter_numbers"], arrays["images"]
 
 if __name__ == '__main__':
-    # read_handwriting()
-    shorten_file()
+    # parses the full kaggle dataset once so any letters can be picked from it quickly
+    letter_numbers, images = load_handwriting(
+        utils.data_dir_file_path("A_Z Handwritten Data.csv"))
+    print({ALPHABET[letter_number]: count for letter_number, count
+           in enumerate(np.bincount(letter_numbers, minlength=len(ALPHABET)).tolist())})
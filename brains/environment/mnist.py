@@ -1,32 +1,92 @@
 import brains.utils as utils
 import brains.environment.base as base
+from brains.environment.stimulus_index import (StimulusIndex, cached_stimulus_index,
+                                               pixel_stimuli)
+from brains.environment.pipeline import ImagePipeline, PipelineCursor
 from typing import Optional
-from collections import defaultdict
+import numpy as np
 import random
 
+STIMULUS_THRESHOLD = 50
+STIMULUS_CURRENT = 0.3
+NEGATIVE_DENSITY = 0.12
+
+MNIST_FILES = {"train": ("train-images.idx3-ubyte", "train-labels.idx1-ubyte"),
+               "test": ("t10k-images.idx3-ubyte", "t10k-labels.idx1-ubyte")}
+
 # copy paste of handwriting
 # magic numbers
 class MnistEnvironment(base.BaseEpochChallengeEnvironment):
+    '''
+    Every image with a wanted label is shown along with a negated copy labelled None. Images
+    are streamed from an ImagePipeline which reshuffles each pass through the dataset.
+
+    split: "train" for the 60k training images or "test" for the 10k test images
+    number_of_images: how many images from the start of the split to use or None for all
+    files: image and label file names to use instead of the split's
+    queue_size: how many images the pipeline prepares ahead of time
+    negative_density: chance each pixel of a negated image is kept
+    negative_seed: seeds the generator negated images are drawn from, taken from random
+        when not given
+    stored_negatives: draw every negated image once up front and show the same ones each
+        pass instead of drawing a new one each time a negation is shown
+    '''
     def __init__(self, epoch_length: int,
                  input_delay: int = 0, shuffle: bool = True,
-                 number_of_possible_outputs: int = 10):
+                 number_of_possible_outputs: int = 10,
+                 split: str = "train", number_of_images: Optional[int] = 10000,
+                 files: Optional[tuple] = None, queue_size: int = 64,
+                 negative_density: float = NEGATIVE_DENSITY,
+                 negative_seed: Optional[int] = None, stored_negatives: bool = False):
         super().__init__(epoch_length, input_delay)
         self._possible_outputs = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
         self._possible_outputs = self._possible_outputs[:number_of_possible_outputs]
-        
-        images_by_label = read_mnist(self._possible_outputs)
+
+        self._images, labels, self._stimulus_index = read_mnist(split, number_of_images,
+                                                                files)
         self._image_width = 28
-        self._labels_and_images = []
-        for label, images in images_by_label.items():
-            for image in images:
-                self._labels_and_images.append((label, image,))
-            
-        if shuffle:
-            random.shuffle(self._labels_and_images)
-
-    def _image_index_for_step(self, step):
-        real_step = step - self._input_delay
-        return (real_step//self._epoch_length) % len(self._labels_and_images)
+        (self._image_indexes,) = np.nonzero(np.isin(labels, self._possible_outputs))
+        self._labels = labels[self._image_indexes].tolist()
+        print(f"number of images: {2 * len(self._image_indexes)}")
+
+        if negative_seed is None:
+            negative_seed = random.getrandbits(64)
+        self._negative_density = negative_density
+        self._stored_negatives = stored_negatives
+        self._set_negative_seed(negative_seed)
+
+        pipeline = ImagePipeline(2 * len(self._image_indexes), self._load_item,
+                                 shuffle=shuffle, queue_size=queue_size)
+        self._cursor = PipelineCursor(pipeline, epoch_length, input_delay)
+
+    def _set_negative_seed(self, negative_seed):
+        self._negative_seed = negative_seed
+        self._negative_index = None
+        if self._stored_negatives:
+            self._negative_index = negated_stimulus_index(
+                self._images, self._image_indexes, self._negative_density,
+                np.random.default_rng(negative_seed))
+
+    def _load_item(self, item_index, presentation):
+        '''
+        Label and stimuli for item_index. Items past the wanted images are their negations.
+        Negations are drawn from a generator seeded by negative_seed and the presentation
+        so they are the same however the pipeline was started.
+        '''
+        number_of_images = len(self._image_indexes)
+        if item_index < number_of_images:
+            pixels = self._stimulus_index.active_pixels(self._image_indexes[item_index])
+            label = self._labels[item_index]
+        elif self._negative_index is not None:
+            pixels = self._negative_index.active_pixels(item_index - number_of_images)
+            label = None
+        else:
+            image_index = self._image_indexes[item_index - number_of_images]
+            rng = np.random.default_rng([self._negative_seed, presentation])
+            negated_image = negate(self._images[image_index], rng, self._negative_density)
+            (pixels,) = np.nonzero(negated_image > STIMULUS_THRESHOLD)
+            label = None
+        return label, pixel_stimuli(pixels, self._image_width, STIMULUS_CURRENT)
 
     def stimuli(self, step):
         real_step = step - self._input_delay
@@ -34,68 +94,102 @@ class MnistEnvironment(base.BaseEpochChallengeEnvironment):
         if not is_correct_time:
             return set()
 
-        image_index = self._image_index_for_step(step)
+        item = self._cursor.item(step)
+        if item is None:
+            return set()
 
-        stimuli = set()
-        (label, image) = self._labels_and_images[image_index]
-        for i, pixel in enumerate(image):
-            if pixel > 50:
-                x = i % self._image_width
-                y = i // self._image_width
-                stimuli.add((x, y, 0.3,))
+        (label, stimuli) = item
         return stimuli
 
     def desired_output_id(self, step):
-        real_step = step - self._input_delay
-        if real_step < 0:
+        item = self._cursor.item(step)
+        if item is None:
             return None
 
-        image_index = self._image_index_for_step(step)
-        (label, image) = self._labels_and_images[image_index]
+        (label, stimuli) = item
         return label
 
-def negate(image):
-    new_image = []
-    for pixel in image:
-        new_pixel = abs(pixel - 255)
-        if 0.12 >= random.random():
-            new_image.append(new_pixel)
-        else:
-            new_image.append(0.0)
-    return new_image
-
-def read(image_file_name, label_file_name,
-         number_of_images_to_read, possible_outputs):
-    label_file = open(utils.data_dir_file_path(label_file_name), "rb")
-    image_file = open(utils.data_dir_file_path(image_file_name), "rb")
-
-    # discard headers
-    image_file.read(16)   
-    label_file.read(8)
-
-    images_by_label: dict[Optional[int], list] = defaultdict(list)
-    for _ in range(number_of_images_to_read):
-        label = ord(label_file.read(1))
-        image = []
-        for _ in range(784):
-            value = ord(image_file.read(1))
-            image.append(value)
-        if label not in possible_outputs:
-            continue
-        images_by_label[label].append(image)
-        images_by_label[None].append(negate(image))
-    number_of_images = 0
-    for images in images_by_label.values():
-        number_of_images += len(images)
-    print(f"number of images: {number_of_images}")
-    image_file.close()
-    label_file.close()
-    return images_by_label
-
-def read_mnist(possible_outputs):
-    return read("train-images.idx3-ubyte", "train-labels.idx1-ubyte", 10000, possible_outputs)
+    def close(self):
+        self._cursor.close()
+
+    def checkpoint_state(self):
+        state = super().checkpoint_state()
+        state["negative_seed"] = self._negative_seed
+        state["pipeline"] = self._cursor.checkpoint_state()
+        return state
+
+    def restore_state(self, state):
+        super().restore_state(state)
+        if state["negative_seed"] != self._negative_seed:
+            self._set_negative_seed(state["negative_seed"])
+        self._cursor.restore_state(state["pipeline"])
+
+def negate(images, rng, density=NEGATIVE_DENSITY):
+    '''
+    Inverted images with only about density of their pixels kept. Works on one flattened
+    image or an array of them.
+    '''
+    images = np.asarray(images)
+    keep = rng.random(images.shape) <= density
+    return np.where(keep, 255 - images.astype(np.int16), 0)
+
+def negated_stimulus_index(images, image_indexes, density, rng, chunk_size=4096):
+    '''
+    StimulusIndex of a negation of each of images[image_indexes] in order. Images are
+    negated a chunk at a time so memory stays bounded for the full dataset.
+    '''
+    chunks = []
+    for start in range(0, len(image_indexes), chunk_size):
+        chunk = images[image_indexes[start:start + chunk_size]]
+        chunks.append(StimulusIndex.build(negate(chunk, rng, density), STIMULUS_THRESHOLD))
+    return StimulusIndex.concatenate(chunks)
+
+def read_idx(file_path):
+    '''
+    Read only memory mapped array of an IDX file. Nothing is read from disk until the
+    array is used.
+
+    The header is two zero bytes, a byte for the type, a byte for the number of dimensions
+    and then each dimension as a big endian 4 byte int. MNIST files are all unsigned bytes.
+    '''
+    with open(file_path, "rb") as idx_file:
+        header = idx_file.read(4)
+        if len(header) != 4 or header[:2] != b"\x00\x00" or header[2] != 0x08:
+            raise Exception(f"{file_path} is not an unsigned byte IDX file")
+        number_of_dimensions = header[3]
+        shape = tuple(int.from_bytes(idx_file.read(4), "big")
+                      for _ in range(number_of_dimensions))
+    return np.memmap(file_path, dtype=np.uint8, mode="r",
+                     offset=4 + 4 * number_of_dimensions, shape=shape)
+
+def read(image_file_name, label_file_name, number_of_images_to_read):
+    '''
+    Flattened images memory mapped from the image file, their labels and a StimulusIndex of
+    the whole image file cached next to it.
+    '''
+    image_file_path = utils.data_dir_file_path(image_file_name)
+    images = read_idx(image_file_path)
+    labels = read_idx(utils.data_dir_file_path(label_file_name))
+    if len(images) != len(labels):
+        raise Exception(f"{image_file_name} and {label_file_name} have different lengths")
+
+    images = images.reshape(len(images), -1)
+    stimulus_index = cached_stimulus_index(image_file_path, STIMULUS_THRESHOLD,
+                                           lambda: images)
+    if number_of_images_to_read is not None:
+        images = images[:number_of_images_to_read]
+        labels = labels[:number_of_images_to_read]
+    return images, labels, stimulus_index
+
+def read_mnist(split="train", number_of_images=10000, files=None):
+    if files is None:
+        if split not in MNIST_FILES:
+            raise Exception(f"unknown mnist split {split}")
+        files = MNIST_FILES[split]
+    image_file_name, label_file_name = files
+    return read(image_file_name, label_file_name, number_of_images)
 
 if __name__ == '__main__':
-    images_by_label = read_mnist([0, 1, 2])
-    print(images_by_label.keys())
-    print(images_by_label[0])
+    images, labels, stimulus_index = read_mnist()
+    print(np.bincount(labels))
+    print(images[0])
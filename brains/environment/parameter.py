@@ -1,3 +1,5 @@
+import brains.environment.base as base
+
 class ParameterTestEnvironment:
     '''
     Very basic environment that provides input to a brain but ignores output from the brain
@@ -30,5 +32,23 @@ class ParameterTestEnvironment:
     def step(self, step, output_ids):
         pass
 
+    def close(self):
+        pass
+
+    def checkpoint_state(self):
+        # nothing changes from epoch to epoch
+        return {}
+
+    def restore_state(self, state):
+        pass
+
+    def epoch_schedule(self, step):
+        start_step, end_step = base.epoch_bounds(step, self._epoch_length, self._input_delay)
+        stimuli_by_step = {}
+        if start_step >= step and start_step >= self._input_delay:
+            stimuli_by_step[start_step] = self.stimuli(start_step)
+        return base.EpochSchedule(step, end_step, stimuli_by_step,
+                                  active_steps=stimuli_by_step.keys())
+
     def video_output(self, step):
         return ["answer: none"]
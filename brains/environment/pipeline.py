@@ -0,0 +1,188 @@
+import inspect
+import numpy as np
+import queue
+import random
+import threading
+import weakref
+
+# Dataset environments show one image per epoch. Rather than building every image's stimuli
+# up front an ImagePipeline makes them a few at a time on a background thread and hands them
+# over through a bounded queue, so memory stays flat however big the dataset is and the
+# simulation thread only waits if it gets ahead of the worker.
+#
+# The worker only holds a weak reference to the object load_item belongs to, so an
+# environment that is dropped without being closed still stops its worker.
+
+_END = object()
+_OWNER_GONE = object()
+
+class _WorkerFailure:
+    def __init__(self, exception):
+        self.exception = exception
+
+class ImagePipeline:
+    '''
+    Yields load_item(item_index, presentation) for item indexes 0 to number_of_items - 1.
+
+    load_item: makes an item on the worker thread. presentation counts the items given out
+        before this one so items drawn at random, like negated images, can be seeded from
+        it and made again when a pipeline restarts part way through.
+    shuffle: items come in a new random order every pass through the dataset
+    loop: start another pass when one ends rather than running out
+    queue_size: most items made ahead of being asked for
+    seed: seeds the shuffled order, taken from random when not given
+    start: number of items to skip as if they had already been given out
+    '''
+    def __init__(self, number_of_items, load_item, shuffle=True, loop=True, queue_size=64,
+                 seed=None, start=0):
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.seed = seed
+        self._number_of_items = number_of_items
+        self._finalizer = None
+        if inspect.ismethod(load_item):
+            self._load_item = weakref.WeakMethod(load_item)
+            self._finalizer = weakref.finalize(load_item.__self__, self.close)
+            self._finalizer.atexit = False
+        else:
+            self._load_item = lambda: load_item
+        self._shuffle = shuffle
+        self._loop = loop
+        self._queue_size = queue_size
+        self._start = start
+        self._rng = np.random.default_rng(seed)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stopped = threading.Event()
+        self._finished = False
+        self._worker = threading.Thread(target=self._work, daemon=True)
+        self._worker.start()
+
+    def __len__(self):
+        return self._number_of_items
+
+    def next(self):
+        '''
+        The next item or None once every item has been given out without looping.
+        '''
+        if self._finished:
+            return None
+
+        item = self._queue.get()
+        if item is _END:
+            self._finished = True
+            return None
+        if isinstance(item, _WorkerFailure):
+            self._finished = True
+            raise item.exception
+        return item
+
+    def close(self):
+        '''
+        Stops the worker and drops any items it made ahead.
+        '''
+        self._stopped.set()
+        self._finished = True
+        if self._finalizer is not None:
+            self._finalizer.detach()
+        # a worker waiting on a full queue is woken by making room, it sees it has been
+        # stopped once its item is in
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        if threading.current_thread() is not self._worker:
+            self._worker.join()
+
+    def restarted(self, seed, start):
+        '''
+        A pipeline like this one but with seed and start. This one is closed.
+        '''
+        load_item = self._load_item()
+        self.close()
+        return ImagePipeline(self._number_of_items, load_item, shuffle=self._shuffle,
+                             loop=self._loop, queue_size=self._queue_size, seed=seed,
+                             start=start)
+
+    def _work(self):
+        try:
+            # passes with skipped items are still shuffled so later passes come in the same
+            # order as they would have without skipping
+            first_presentation = 0
+            while self._number_of_items > 0:
+                if self._shuffle:
+                    order = self._rng.permutation(self._number_of_items)
+                else:
+                    order = np.arange(self._number_of_items)
+                skip = max(self._start - first_presentation, 0)
+                for presentation, item_index in enumerate(order[skip:].tolist(),
+                                                          first_presentation + skip):
+                    item = self._make_item(item_index, presentation)
+                    if item is _OWNER_GONE or not self._put(item):
+                        return
+                first_presentation += self._number_of_items
+                if not self._loop:
+                    break
+            self._put(_END)
+        except Exception as exception:
+            self._put(_WorkerFailure(exception))
+
+    def _make_item(self, item_index, presentation):
+        # looked up for each item so the worker never keeps load_item's owner alive
+        load_item = self._load_item()
+        if load_item is None:
+            return _OWNER_GONE
+        return load_item(item_index, presentation)
+
+    def _put(self, item):
+        '''
+        Blocks until there is room for item. False once the pipeline has been closed.
+        '''
+        if self._stopped.is_set():
+            return False
+        self._queue.put(item)
+        return not self._stopped.is_set()
+
+class PipelineCursor:
+    '''
+    Item for the epoch a step is in. Steps may stay in the same epoch or move forward but
+    can't go back to an earlier image since the pipeline has moved past it.
+    '''
+    def __init__(self, pipeline, epoch_length, input_delay):
+        self._pipeline = pipeline
+        self._epoch_length = epoch_length
+        self._input_delay = input_delay
+        self._image_number = -1
+        self._item = None
+
+    def item(self, step):
+        '''
+        None before the first image and after the last when the pipeline does not loop.
+        '''
+        real_step = step - self._input_delay
+        if real_step < 0:
+            return None
+
+        image_number = real_step // self._epoch_length
+        if image_number < self._image_number:
+            raise Exception(f"image for step {step} has already been passed")
+        while self._image_number < image_number:
+            self._item = self._pipeline.next()
+            self._image_number += 1
+        return self._item
+
+    def close(self):
+        self._pipeline.close()
+
+    def checkpoint_state(self):
+        return {"seed": self._pipeline.seed, "image_number": self._image_number}
+
+    def restore_state(self, state):
+        '''
+        Restarts the pipeline at the image the cursor was on, which is made again the next
+        time it is asked for.
+        '''
+        start = max(state["image_number"], 0)
+        self._pipeline = self._pipeline.restarted(state["seed"], start)
+        self._image_number = start - 1
+        self._item = None
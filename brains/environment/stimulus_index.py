@@ -0,0 +1,75 @@
+from brains.stimuli import ArrayStimuli
+from brains.environment.dataset_cache import cached_arrays
+
+from pathlib import Path
+import numpy as np
+
+# The pixels bright enough to stimulate an input cell are found once per image instead of
+# every time the image is shown. Pixel indexes for every image are stored end to end in one
+# array with offsets marking where each image's pixels start, so showing an image is a slice.
+
+class StimulusIndex:
+    '''
+    offsets: image i's pixels are pixels[offsets[i]:offsets[i + 1]]
+    pixels: flattened pixel indexes, x = pixel % width and y = pixel // width
+    '''
+    def __init__(self, offsets, pixels):
+        self.offsets = offsets
+        self.pixels = pixels
+
+    @classmethod
+    def build(cls, images, threshold):
+        '''
+        images: array with one flattened image per row
+        threshold: pixels must be brighter than this to be active
+        '''
+        images = np.asarray(images).reshape(len(images), -1)
+        image_indexes, pixels = np.nonzero(images > threshold)
+        offsets = np.zeros(len(images) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(image_indexes, minlength=len(images)), out=offsets[1:])
+        return cls(offsets, pixels.astype(np.int32))
+
+    @classmethod
+    def concatenate(cls, stimulus_indexes):
+        '''
+        One StimulusIndex with the images of each given index in order.
+        '''
+        offsets = [np.zeros(1, dtype=np.int64)]
+        number_of_pixels = 0
+        for stimulus_index in stimulus_indexes:
+            offsets.append(stimulus_index.offsets[1:] + number_of_pixels)
+            number_of_pixels += int(stimulus_index.offsets[-1])
+        pixels = [np.zeros(0, dtype=np.int32)]
+        pixels.extend(stimulus_index.pixels for stimulus_index in stimulus_indexes)
+        return cls(np.concatenate(offsets), np.concatenate(pixels))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def active_pixels(self, image_index):
+        return self.pixels[self.offsets[image_index]:self.offsets[image_index + 1]]
+
+def pixel_stimuli(pixels, image_width, current):
+    '''
+    ArrayStimuli giving current to the input cells of active pixels from a StimulusIndex.
+    '''
+    return ArrayStimuli(pixels % image_width, pixels // image_width,
+                        np.full(len(pixels), current))
+
+def cache_path(dataset_path, threshold):
+    dataset_path = Path(dataset_path)
+    return dataset_path.with_name(f"{dataset_path.name}.stimuli_{threshold}.npz")
+
+def cached_stimulus_index(dataset_path, threshold, read_images):
+    '''
+    StimulusIndex for every image in a dataset file. It is saved next to the file and
+    reused until the file changes.
+
+    read_images: called with no arguments to get the images when there is no usable cache
+    '''
+    def build():
+        stimulus_index = StimulusIndex.build(read_images(), threshold)
+        return {"offsets": stimulus_index.offsets, "pixels": stimulus_index.pixels}
+
+    arrays = cached_arrays(dataset_path, cache_path(dataset_path, threshold), build)
+    return StimulusIndex(arrays["offsets"], arrays["pixels"])
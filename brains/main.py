@@ -1,6 +1,8 @@
 import brains.models.spirit_model as spirit_model
 import brains.models.example_model as example_model
 import brains.models.simple_model_builder as simple_model_builder
+import brains.models.model_file as model_file
+import brains.checkpoint as checkpoint
 import brains.network_definitions as network_definitions
 import brains.utils as utils
 
@@ -26,6 +28,11 @@ def integrate_module(execution_type):
             print("loaded rust integrate module")
             return model
 
+    if execution_type == "numpy":
+        import brains.models.numpy_model as model
+        print("loaded numpy integrate module")
+        return model
+
     if execution_type == "auto" or execution_type == "python":
         import brains.models.integrate_model as model
         print("loaded python integrate modulel")
@@ -34,49 +41,79 @@ def integrate_module(execution_type):
     print("failed to load any version of integrate module")
     sys.exit(1)
 
-def integrate_model(network_definition, model_parameters, execution_type):
+def integrate_model(network_definition, model_parameters, execution_type, overrides=None):
+    '''
+    overrides: brains.sweep overrides applied to copies of network_definition and
+        model_parameters before the model is built
+    '''
+    if overrides:
+        import brains.sweep as sweep
+        network_definition, model_parameters = sweep.apply_overrides(
+            network_definition, model_parameters, overrides)
     module = integrate_module(execution_type)
     return module.SimpleModel(network_definition, model_parameters)
 
-def parameter_test_world(parameters):
+def parameter_test_world(parameters, model_overrides=None):
     model_parameters = simple_model_builder.ModelParameters(starting_dopamine=0.0)
     network_definition = network_definitions.parameter_test_network()
-    model = integrate_model(network_definition, model_parameters, parameters.execution_type)
+    model = integrate_model(network_definition, model_parameters, parameters.execution_type,
+                            model_overrides)
     return model, ParameterTestEnvironment()
 
-def stdp_world(parameters):
+def stdp_world(parameters, model_overrides=None):
     model_parameters = simple_model_builder.ModelParameters(epoch_length=parameters.epoch_length)
     model_parameters.synapse_type_parameters.max_strength = 0.4
     network_definition = network_definitions.stdp_test_network()
-    model = integrate_model(network_definition, model_parameters, parameters.execution_type)
+    model = integrate_model(network_definition, model_parameters, parameters.execution_type,
+                            model_overrides)
     return model, STDPTestEnvironment()
 
-def handwriting_world(parameters):
+def output_id_by_letter(letters):
+    return {letter: output_id for output_id, letter in enumerate(letters)}
+
+def handwriting_world(parameters, model_overrides=None):
     model_parameters = simple_model_builder.handwriting_model_parameters(
         epoch_length=parameters.epoch_length,
         epoch_delay=parameters.epoch_delay)
-    network_definition = network_definitions.layer_based_default_network()
+    network_definition = network_definitions.layer_based_default_network(
+        number_of_outputs=len(parameters.handwritten_letters))
     environment = HandwritingEnvironment(
-        parameters.epoch_length, parameters.input_delay, {'o': 0, 'x': 1},
+        parameters.epoch_length, parameters.input_delay,
+        output_id_by_letter(parameters.handwritten_letters),
         image_lines=None, shuffle=True,
         file_name=parameters.handwritten_file_name)
 
-    model = integrate_model(network_definition, model_parameters, parameters.execution_type)
+    model = integrate_model(network_definition, model_parameters, parameters.execution_type,
+                            model_overrides)
     return model, environment
 
-def mnist_world(parameters):
+def mnist_number_of_images(parameters):
+    if parameters.mnist_number_of_images == 0:
+        return None
+    return parameters.mnist_number_of_images
+
+def mnist_negative_options(parameters):
+    return {"negative_density": parameters.mnist_negative_density,
+            "negative_seed": parameters.mnist_negative_seed,
+            "stored_negatives": parameters.mnist_stored_negatives}
+
+def mnist_world(parameters, model_overrides=None):
     model_parameters = simple_model_builder.handwriting_model_parameters(
         epoch_length=parameters.epoch_length,
         epoch_delay=parameters.epoch_delay)
     network_definition = network_definitions.mnist_network(
         number_of_outputs=parameters.mnist_number_of_outputs)
     environment = MnistEnvironment(parameters.epoch_length, parameters.input_delay,
-                                   number_of_possible_outputs=parameters.mnist_number_of_outputs)
-    model = integrate_model(network_definition, model_parameters, parameters.execution_type)
+                                   number_of_possible_outputs=parameters.mnist_number_of_outputs,
+                                   split=parameters.mnist_split,
+                                   number_of_images=mnist_number_of_images(parameters),
+                                   **mnist_negative_options(parameters))
+    model = integrate_model(network_definition, model_parameters, parameters.execution_type,
+                            model_overrides)
     return model, environment
 
 
-def easy_world(parameters):
+def easy_world(parameters, model_overrides=None):
     model_parameters = simple_model_builder.handwriting_model_parameters(
         epoch_length=parameters.epoch_length,
         epoch_delay=parameters.epoch_delay)
@@ -85,23 +122,33 @@ def easy_world(parameters):
     # need like some kind of average starting connection strength thing
     network_definition = network_definitions.easy_layer_network()
     easy_environment = EasyEnvironment(parameters.epoch_length, parameters.input_delay)
-    model = integrate_model(network_definition, model_parameters, parameters.execution_type)
+    model = integrate_model(network_definition, model_parameters, parameters.execution_type,
+                            model_overrides)
     return model, easy_environment
 
-def user_specified_world(parameters):
+def user_specified_world(parameters, model_overrides=None):
     file_path = utils.data_dir_file_path(parameters.import_name)
-    model_file = open(file_path)
-    blob = json.load(model_file)
-    model = simple_model_builder.import_model(blob, integrate_module(parameters.execution_type))
+    if model_file.is_model_file(file_path):
+        network_definition, model_parameters = model_file.load(file_path)
+    else:
+        with open(file_path) as json_file:
+            blob = json.load(json_file)
+        network_definition, model_parameters = simple_model_builder.import_definitions(blob)
+    model = integrate_model(network_definition, model_parameters, parameters.execution_type,
+                            model_overrides)
     if parameters.environment_type == 'handwriting':
         model_environment = HandwritingEnvironment(
-            model.epoch_length, parameters.input_delay, {'o': 0, 'x': 1},
+            model.epoch_length, parameters.input_delay,
+            output_id_by_letter(parameters.handwritten_letters),
             image_lines=None, shuffle=True,
             file_name=parameters.handwritten_file_name)
     elif parameters.environment_type == 'mnist':
         model_environment = MnistEnvironment(
             model.epoch_length, parameters.input_delay,
-            number_of_possible_outputs=parameters.mnist_number_of_outputs)
+            number_of_possible_outputs=parameters.mnist_number_of_outputs,
+            split=parameters.mnist_split,
+            number_of_images=mnist_number_of_images(parameters),
+            **mnist_negative_options(parameters))
     elif parameters.environment_type == 'easy':
         model_environment = EasyEnvironment(model.epoch_length, parameters.input_delay)
     elif parameters.environment_type == 'stdp':
@@ -110,33 +157,35 @@ def user_specified_world(parameters):
         model_environment = ParameterTestEnvironment(model.epoch_length)
     return model, model_environment
 
-def create_world(parameters):
-    
+def create_world(parameters, model_overrides=None):
+    '''
+    model_overrides: brains.sweep overrides for the model's network and parameters
+    '''
     if parameters.world_type and parameters.environment_type:
         raise Exception("User should either create world with(import_name and environment) or " \
                         "provide world_type")
 
     if parameters.import_name and parameters.environment_type:
-        return user_specified_world(parameters)
+        return user_specified_world(parameters, model_overrides)
     elif parameters.import_name and parameters.world_type:
         parameters.environment_type = parameters.world_type
-        return user_specified_world(parameters)
+        return user_specified_world(parameters, model_overrides)
     
     if parameters.world_type:
         if parameters.world_type == "parameter":
-            return parameter_test_world(parameters)
+            return parameter_test_world(parameters, model_overrides)
         elif parameters.world_type == "stdp":
-            return stdp_world(parameters)
+            return stdp_world(parameters, model_overrides)
         elif parameters.world_type == "easy":
-            return easy_world(parameters)
+            return easy_world(parameters, model_overrides)
         elif parameters.world_type == "spirit":
             return World(spirit_model.default_model(), None)
         elif parameters.world_type == "example":
             return World(example_model.ExampleModel(), None)
         elif parameters.world_type == "handwriting":
-            return handwriting_world(parameters)
+            return handwriting_world(parameters, model_overrides)
         elif parameters.world_type == "mnist":
-            return mnist_world(parameters)
+            return mnist_world(parameters, model_overrides)
 
     print("Not enough information provided. Either supply a world argument or both " \
           "a import_name and an environment to run it in")
@@ -154,14 +203,18 @@ def create_display(display_type, model, environment=None):
     return display
 
 
-def export(brain, export_name):
-    blob = brain.export()
+def export(brain, export_name, export_format="json"):
     base_path = Path(__file__).parent / "data"
     file_path = (base_path / export_name).resolve()
+    if export_format == "binary":
+        model_file.save(file_path, brain.export_network_definition(), brain.model_parameters)
+        return
+
+    blob = brain.export()
     output_file = open(file_path, 'w')
     json.dump(blob, output_file, sort_keys=True, indent=4)
 
-def create_args():
+def create_args(args=None):
     my_parser = argparse.ArgumentParser(description='Run brains')
     my_parser.add_argument('--display_type', '--display',
                            type=str,
@@ -200,6 +253,14 @@ def create_args():
                            type=str,
                            required=False,
                            help='Export model to at the end of a run. Just provide a name it will be added to the data directory.')
+    my_parser.add_argument('--export_format',
+                           type=str,
+                           choices=["json", "binary"],
+                           default="json",
+                           required=False,
+                           help='binary files are much smaller and faster to export and '\
+                           'import for large networks. json is readable and can be edited. '\
+                           'Either can be imported.')
     
     # Create your own world by combining an imported model(network + parameters) and a selected
     # environment. For convenience, if world is supplied but not environment, the environment for that
@@ -218,6 +279,12 @@ def create_args():
                            type=str,
                            required=False,
                            help='Images to use for handwriting environment.')
+    my_parser.add_argument('--handwritten_letters',
+                           default="ox",
+                           type=str,
+                           required=False,
+                           help='Letters from the handwriting file to show. Each gets its ' \
+                           'own output cell in the order given.')
     my_parser.add_argument('--profile',
                            default=False,
                            type=bool,
@@ -228,38 +295,156 @@ def create_args():
                            type=int,
                            required=False,
                            help='Number of outputs of mnist network.')
+    my_parser.add_argument('--mnist_split',
+                           default="train",
+                           choices=["train", "test"],
+                           required=False,
+                           help='Use the 60k mnist training images or the 10k test images.')
+    my_parser.add_argument('--mnist_number_of_images',
+                           default=10000,
+                           type=int,
+                           required=False,
+                           help='Number of mnist images to use from the start of the split. ' \
+                           '0 uses them all.')
+    my_parser.add_argument('--mnist_negative_density',
+                           default=0.12,
+                           type=float,
+                           required=False,
+                           help='Chance each pixel of a negated mnist image is kept.')
+    my_parser.add_argument('--mnist_negative_seed',
+                           default=None,
+                           type=int,
+                           required=False,
+                           help='Seed for drawing negated mnist images. Taken from the run\'s ' \
+                           'random state when not given.')
+    my_parser.add_argument('--mnist_stored_negatives',
+                           default=False,
+                           type=bool,
+                           required=False,
+                           help='Draw every negated mnist image once up front instead of ' \
+                           'drawing a new one each time one is shown.')
     my_parser.add_argument('--attempt_warp',
                            default=False,
                            type=bool,
                            required=False,
-                           help="Warp to speed up code when possible may contain errors " \
-                           "with unsupervised learning")
+                           help="Skip simulating steps where nothing happens. Cells are " \
+                           "brought up to date exactly and warping stops at the next step a " \
+                           "cell is predicted to fire. Ignored while a display is active.")
+    my_parser.add_argument('--checkpoint_name',
+                           type=str,
+                           required=False,
+                           help='Save the whole state of the run, model, environment and ' \
+                           'random state, to this file in the data directory every ' \
+                           'checkpoint_epochs epochs and at the end of the run.')
+    my_parser.add_argument('--checkpoint_epochs',
+                           type=int,
+                           default=100,
+                           required=False,
+                           help='Number of epochs between checkpoints.')
+    my_parser.add_argument('--resume',
+                           default=False,
+                           type=bool,
+                           required=False,
+                           help='Carry on from the checkpoint in checkpoint_name. The world ' \
+                           'is created from the other arguments then given the ' \
+                           'checkpoint\'s state so they should match the original run. ' \
+                           'The model runs with the execution type it was saved from and ' \
+                           'epochs still counts from the start of the original run.')
     my_parser.add_argument('--execution_type',
                            default="auto",
-                           choices=["auto", "python", "rust"],
+                           choices=["auto", "python", "numpy", "rust"],
                            type=str,
                            required=False,
-                           help="Run integration model using python or rust. If auto will attempt " \
-                           " to use rust if it finds it. If rust selected and not binary can be " \
-                           "found gives an error.")
-    return my_parser.parse_args()
-
+                           help="Run integration model using python, numpy or rust. If auto will " \
+                           "attempt to use rust if it finds it. If rust selected and not binary " \
+                           "can be found gives an error. numpy keeps cell and synapse state in " \
+                           "arrays which is much faster than python for large networks.")
+    return my_parser.parse_args(args)
+
+
+def run_compiled(brain, environment, steps, warp_allowed=False, start_step=0,
+                 epoch_ended=None):
+    '''
+    Headless runs go an epoch at a time through the environment's compiled schedules so
+    the environment is only consulted on the steps where something happens. Text output
+    is printed at the end of each epoch rather than after its first step.
+
+    epoch_ended: called with the first step of the next epoch after each epoch
+    '''
+    step = start_step
+    while step < steps:
+        schedule = environment.epoch_schedule(step)
+        number_of_steps = min(schedule.end_step, steps) - step
+        brain.run_steps(step, number_of_steps, schedule, warp_allowed=warp_allowed)
+        step += number_of_steps
+        if step == schedule.end_step:
+            for text in brain.text_output():
+                print(text)
+            if epoch_ended is not None:
+                epoch_ended(step)
+
+def close_environment(environment):
+    '''
+    Dataset environments keep a worker thread running until they are closed.
+    '''
+    if environment is not None:
+        environment.close()
+
+def is_checkpoint_step(parameters, step):
+    epoch, step_in_epoch = divmod(step - parameters.input_delay, parameters.epoch_length)
+    return step_in_epoch == 0 and epoch > 0 and epoch % parameters.checkpoint_epochs == 0
+
+def save_checkpoint(parameters, brain, environment, step):
+    if parameters.checkpoint_name:
+        checkpoint.save(utils.data_dir_file_path(parameters.checkpoint_name), step, brain,
+                        environment)
+
+def resume_world(parameters, environment):
+    '''
+    Model from the checkpoint and the step to carry on from. environment and random are
+    put back the way they were.
+    '''
+    if not parameters.checkpoint_name:
+        raise Exception("resume requires a checkpoint_name")
+    saved = checkpoint.load(utils.data_dir_file_path(parameters.checkpoint_name))
+    return checkpoint.restore(saved, environment), saved.step
 
 def main(parameters):
     brain, environment = create_world(parameters)
+    start_step = 0
+    if parameters.resume:
+        brain, start_step = resume_world(parameters, environment)
     
     def exit_handler(signum, frame):
         if parameters.export_name:
-            export(brain, parameters.export_name)
+            export(brain, parameters.export_name, parameters.export_format)
+        close_environment(environment)
         sys.exit(0)
     signal.signal(signal.SIGINT, exit_handler)
 
     # display really should not take brain and environment as parameters either
     display = create_display(parameters.display_type, brain, environment=environment)
     display_active = display is not None
+    if display is None and hasattr(environment, "epoch_schedule") \
+       and hasattr(brain, "run_steps"):
+        def epoch_ended(step):
+            if is_checkpoint_step(parameters, step):
+                save_checkpoint(parameters, brain, environment, step)
+
+        run_compiled(brain, environment, parameters.steps, parameters.attempt_warp,
+                     start_step, epoch_ended)
+        save_checkpoint(parameters, brain, environment, parameters.steps)
+        if parameters.export_name:
+            export(brain, parameters.export_name, parameters.export_format)
+        close_environment(environment)
+        return
+
     brain_output_ids = []
     should_exit = False
-    for i in range(parameters.steps):
+    for i in range(start_step, parameters.steps):
+        # output ids from the last step of an epoch are cleared so none are lost
+        if i > start_step and is_checkpoint_step(parameters, i):
+            save_checkpoint(parameters, brain, environment, i)
         environment.step(i, brain_output_ids)
         warp_allowed = parameters.attempt_warp and not display_active
         brain_output_ids = brain.step(i,
@@ -280,14 +465,17 @@ def main(parameters):
             
             if should_exit:
                 if parameters.export_name:
-                    export(brain, parameters.export_name)
+                    export(brain, parameters.export_name, parameters.export_format)
+                close_environment(environment)
                 sys.exit(0)
 
     if display is not None:
         display.final_output()
 
+    save_checkpoint(parameters, brain, environment, parameters.steps)
     if parameters.export_name:
-        export(brain, parameters.export_name)
+        export(brain, parameters.export_name, parameters.export_format)
+    close_environment(environment)
   
 
 if __name__ == "__main__" :
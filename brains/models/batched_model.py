@@ -0,0 +1,549 @@
+from brains.network import SynapseDefinition, NetworkDefinition, CellType
+from brains.stimuli import ArrayStimuli, InputMapping
+from brains.models.synapse_index import SynapseIndex
+from brains.models.dopamine import BatchedDopamineHistory
+from brains.models.fire_counts import FireCounts
+import brains.models.homeostasis as homeostasis
+import brains.models.schedule as step_schedule
+
+from collections import defaultdict
+import dataclasses
+import numpy as np
+import random
+
+# Runs several copies of numpy_model.SimpleModel in lockstep. Every copy, called an instance,
+# has the same network topology and starting strengths but its own ModelParameters, state,
+# rewards and environment. State arrays have shape (instances, cells) or
+# (instances, synapses). Spikes, rewards and balancing work on flat views of those arrays
+# where instance i's cells and synapses come after those of instance i - 1, so the batch is
+# handled like one large network made of unconnected copies.
+
+class BatchedModel:
+    def __init__(self, network_definition, model_parameters_list, seeds=None):
+        '''
+        Instances must agree on step_size, epoch_length and epoch_delay so they can share
+        one clock. Anything else in the ModelParameters can differ.
+
+        seeds: one noise seed or numpy Generator per instance, each seed drawn from random
+            like numpy_model.SimpleModel's by default
+        '''
+        self.name = "Batched Model"
+        self.network_definition = network_definition
+        self.model_parameters_list = model_parameters_list
+        self.batch_size = len(model_parameters_list)
+
+        first_parameters = model_parameters_list[0]
+        for model_parameters in model_parameters_list:
+            if (model_parameters.step_size != first_parameters.step_size
+                or model_parameters.epoch_length != first_parameters.epoch_length
+                or model_parameters.epoch_delay != first_parameters.epoch_delay):
+                raise Exception("batched model instances must share step_size, epoch_length "
+                                "and epoch_delay")
+        self._step_size = first_parameters.step_size
+        self.epoch_length = first_parameters.epoch_length
+        self._epoch_delay = first_parameters.epoch_delay
+
+        self._dopamine = np.array([model_parameters.starting_dopamine
+                                   for model_parameters in model_parameters_list], dtype=float)
+        self._dopamine_decay = np.array([model_parameters.dopamine_decay
+                                         for model_parameters in model_parameters_list],
+                                        dtype=float)
+        self._dopamine_history = BatchedDopamineHistory(self._dopamine_decay, self._step_size)
+        if seeds is None:
+            seeds = [random.getrandbits(64) for _ in model_parameters_list]
+        if len(seeds) != self.batch_size:
+            raise Exception("batched model needs one seed per instance")
+        # each instance draws its noise from its own generator so an instance seeded like a
+        # numpy model gets the same noise as that model whatever else is in the batch
+        self._randoms = [np.random.default_rng(seed) for seed in seeds]
+
+        self._fire_rate_balance_scalar = 0.01
+        self._fire_history_length = 20
+        self._input_balance_scalar = 1.0
+
+        self._build_network(network_definition)
+        self.cell_indexes_by_input_position = self._cell_indexes_by_input_position()
+        self._input_mapping = InputMapping(network_definition.cell_definitions)
+
+    @classmethod
+    def from_models(cls, models):
+        '''
+        Batches numpy_model.SimpleModels that share a network and have not run yet. Each
+        instance takes over its model's noise generator so it runs like its model would.
+        '''
+        return cls(models[0].network_definition,
+                   [model.model_parameters for model in models],
+                   [model._random for model in models])
+
+    def _instance_parameters(self, parameter, number_per_instance, dtype=float):
+        '''
+        One value for each of an instance's cells or synapses laid out in flat order.
+        '''
+        values = np.array([parameter(model_parameters)
+                           for model_parameters in self.model_parameters_list], dtype=dtype)
+        return np.repeat(values, number_per_instance)
+
+    def _cell_indexes_by_input_position(self):
+        cell_indexes_by_input_position = defaultdict(lambda: defaultdict(list))
+        for index, cell_definition in enumerate(self.network_definition.cell_definitions):
+            if cell_definition.is_input_cell:
+                x_input_position = cell_definition.x_input_position
+                y_input_position = cell_definition.y_input_position
+                cell_indexes_by_input_position[x_input_position][y_input_position].append(index)
+        return cell_indexes_by_input_position
+
+    def _apply_stimuli(self, stimuli_list):
+        for instance, stimuli in enumerate(stimuli_list):
+            if stimuli is None:
+                continue
+
+            input_current = self._input_current[instance]
+            if isinstance(stimuli, ArrayStimuli):
+                cell_indexes, currents = self._input_mapping.resolve(stimuli)
+                np.add.at(input_current, cell_indexes, currents)
+                continue
+
+            for stimulus in stimuli:
+                x_input_position = stimulus[0]
+                y_input_position = stimulus[1]
+                outside_current = stimulus[2]
+                indexes = self.cell_indexes_by_input_position[x_input_position][y_input_position]
+                input_current[indexes] += outside_current
+
+    def _epoch_updates(self, step):
+        # this step's reward updates would have come after the epoch updates
+        self._settle_synapses(step=step - 1)
+
+        # bad hack(means messing with input delays breaks things
+        self._s_tag[:] = 0.0
+        self._pre_cell_synapses_to_update[:] = False
+        self._post_cell_synapses_to_update[:] = False
+
+        self._output_balance()
+        self._fire_rate_balance(step)
+
+    def step(self, step, stimuli_list, has_reward_list, active_environment_list,
+             warp_allowed=False):
+        '''
+        Takes and returns one entry per instance. Warping is not supported.
+        '''
+        self._update_dopamine(step, np.array(has_reward_list, dtype=bool))
+
+        # We need a seperate epoch variable for the model
+        real_step = step - self._epoch_delay
+        if real_step % self.epoch_length == 0:
+            self._epoch_updates(step)
+
+        # fires on the step of the epoch updates still count towards the epoch just balanced
+        if (real_step - 1) % self.epoch_length == 0:
+            self._fire_counts.advance()
+
+        self._apply_stimuli(stimuli_list)
+        self._update_cells()
+
+        fired_indexes = np.flatnonzero(self._fired)
+        fire_trace = self._fire_trace.reshape(-1)
+        fire_trace[fire_trace > 0] -= 1
+        fire_trace[fired_indexes] = 100
+        self._apply_fire(step, fired_indexes)
+
+        output_ids_list = [[] for _ in range(self.batch_size)]
+        number_of_cells = self._voltage.shape[1]
+        for index in fired_indexes[self._is_output_cell_flat[fired_indexes]]:
+            instance, cell_index = divmod(int(index), number_of_cells)
+            output_ids_list[instance].append(self._output_ids[cell_index])
+        return output_ids_list
+
+    def run_steps(self, step, number_of_steps, schedules):
+        '''
+        Steps through one StepSchedule per instance in one call. Returns an array of
+        (step, output_id) events for each instance.
+        '''
+        output_events_list = [[] for _ in range(self.batch_size)]
+        for current_step in range(step, step + number_of_steps):
+            stimuli_list = []
+            has_reward_list = []
+            active_environment_list = []
+            for schedule, output_events in zip(schedules, output_events_list):
+                stimuli_list.append(schedule.stimuli(current_step))
+                has_reward_list.append(schedule.has_reward(current_step, output_events))
+                active_environment_list.append(schedule.active(current_step))
+            output_ids_list = self.step(current_step, stimuli_list, has_reward_list,
+                                        active_environment_list)
+            for output_ids, output_events in zip(output_ids_list, output_events_list):
+                output_events.extend((current_step, output_id) for output_id in output_ids)
+        return [step_schedule.events_array(output_events)
+                for output_events in output_events_list]
+
+    def run_epoch(self, step, schedules):
+        return self.run_steps(step, self.epoch_length, schedules)
+
+    def _update_cells(self):
+        '''
+        Vectorized CellMembrane.update from integrate_model.
+        '''
+        voltage_before_update = self._voltage.copy()
+        np.greater(self._voltage, self._max_voltage, out=self._fired)
+        self._voltage[self._fired] = np.broadcast_to(self._voltage_reset,
+                                                     self._voltage.shape)[self._fired]
+        self._calcium += self._fired * self._calcium_increment
+        reset_input_current = self._fired & self._reset_input_current
+        self._input_current[reset_input_current] = np.broadcast_to(
+            self._input_current_reset, self._input_current.shape)[reset_input_current]
+
+        self._voltage *= self._voltage_factor
+        self._voltage += self._input_current * self._step_size
+        self._input_current *= self._current_factor
+        self._calcium *= self._calcium_factor
+
+        self._active = (self._voltage > 0) & (voltage_before_update < self._voltage)
+
+    def _decay_s_tags(self, step, synapse_indexes):
+        s_tag = self._s_tag.reshape(-1)
+        last_stag_decay = self._last_stag_decay.reshape(-1)
+        steps_since_last_decay = step - last_stag_decay[synapse_indexes]
+        s_tag[synapse_indexes] *= (
+            1 - self._s_tag_decay_rate_flat[synapse_indexes])**steps_since_last_decay
+        last_stag_decay[synapse_indexes] = step
+
+    def _settle_synapses(self, synapse_indexes=None, step=None, instances=None):
+        '''
+        See numpy_model.SimpleModel._settle_synapses. Indexes are flat synapse indexes.
+        When settling every queued synapse instances can limit it to some of the batch.
+        '''
+        if step is None:
+            step = self._dopamine_history.step
+        if step is None:
+            return
+
+        times_queued = (self._pre_cell_synapses_to_update.astype(np.int64)
+                        + self._post_cell_synapses_to_update)
+        if instances is not None:
+            times_queued[~instances] = 0
+        times_queued = times_queued.reshape(-1)
+        last_stag_decay = self._last_stag_decay.reshape(-1)
+        if synapse_indexes is None:
+            synapse_indexes = np.flatnonzero(times_queued)
+        synapse_indexes = synapse_indexes[(times_queued[synapse_indexes] > 0)
+                                          & (last_stag_decay[synapse_indexes] < step)]
+        if len(synapse_indexes) == 0:
+            return
+
+        number_of_synapses = self._strength.shape[1]
+        from_steps = last_stag_decay[synapse_indexes]
+        s_tags = self._s_tag.reshape(-1)[synapse_indexes]
+        s_tag_decay_rates = self._s_tag_decay_rate_flat[synapse_indexes]
+        unsupervised_stdp = self._unsupervised_stdp_flat[synapse_indexes]
+        reward_scalars = self._reward_scalar_flat[synapse_indexes]
+        synapse_instances = synapse_indexes // number_of_synapses
+        first_rewards = reward_scalars * self._dopamine_history.rewards(
+            s_tags, s_tag_decay_rates, from_steps, from_steps + 1, unsupervised_stdp,
+            synapse_instances)
+        total_rewards = reward_scalars * self._dopamine_history.rewards(
+            s_tags, s_tag_decay_rates, from_steps, step, unsupervised_stdp, synapse_instances)
+
+        strength = self._strength.reshape(-1)
+        self._decay_s_tags(step, synapse_indexes)
+        strength[synapse_indexes] += first_rewards
+        self._cap_synapses(synapse_indexes)
+        strength[synapse_indexes] += (total_rewards * times_queued[synapse_indexes]
+                                      - first_rewards)
+        self._cap_synapses(synapse_indexes)
+
+    def _apply_fire(self, step, fired_indexes):
+        if len(fired_indexes) == 0:
+            return
+
+        self._fire_counts.record(fired_indexes)
+
+        output_indexes = self._outgoing.gather(fired_indexes)
+        input_indexes = self._incoming.gather(fired_indexes)
+        self._settle_synapses(output_indexes)
+        self._settle_synapses(input_indexes)
+
+        input_current = self._input_current.reshape(-1)
+        calcium = self._calcium.reshape(-1)
+        s_tag = self._s_tag.reshape(-1)
+
+        # Synapse.pre_fire
+        inhibitory_indexes = output_indexes[self._inhibitory_flat[output_indexes]]
+        input_current -= np.bincount(
+            self._post_cell_indexes_flat[inhibitory_indexes],
+            weights=self._inhibitory_strength.reshape(-1)[inhibitory_indexes],
+            minlength=len(input_current))
+
+        excitatory_indexes = output_indexes[self._excitatory_flat[output_indexes]]
+        self._decay_s_tags(step, excitatory_indexes)
+        post_cell_indexes = self._post_cell_indexes_flat[excitatory_indexes]
+        s_tag[excitatory_indexes] -= (self._stdp_scalar_flat[excitatory_indexes]
+                                      * calcium[post_cell_indexes])
+        strength = self._strength.reshape(-1)[excitatory_indexes]
+        noise_factor = self._noise_factor_flat[excitatory_indexes]
+        if (noise_factor > 0).any():
+            noise = noise_factor * self._uniform_noise(excitatory_indexes) * strength
+            strength = strength + noise
+        input_current += np.bincount(post_cell_indexes, weights=strength,
+                                     minlength=len(input_current))
+
+        # Synapse.post_fire
+        post_fire_indexes = input_indexes[self._excitatory_flat[input_indexes]]
+        self._decay_s_tags(step, post_fire_indexes)
+        pre_cell_indexes = self._pre_cell_indexes_flat[post_fire_indexes]
+        s_tag[post_fire_indexes] += (self._stdp_scalar_flat[post_fire_indexes]
+                                     * calcium[pre_cell_indexes])
+
+        self._queue_synapses(step, output_indexes,
+                             self._pre_cell_synapses_to_update.reshape(-1))
+        self._queue_synapses(step, input_indexes,
+                             self._post_cell_synapses_to_update.reshape(-1))
+
+    def _uniform_noise(self, synapse_indexes):
+        '''
+        A draw from [-1, 1) for each flat synapse index taken from its instance's generator
+        in the order numpy_model.SimpleModel takes them. Instances without noise draw
+        nothing.
+        '''
+        instances = synapse_indexes // self._strength.shape[1]
+        uniform = np.zeros(len(synapse_indexes))
+        for instance in np.unique(instances):
+            if self.model_parameters_list[instance].synapse_type_parameters.noise_factor > 0:
+                in_instance = instances == instance
+                uniform[in_instance] = self._randoms[instance].uniform(
+                    -1, 1, np.count_nonzero(in_instance))
+        return uniform
+
+    def _queue_synapses(self, step, synapse_indexes, synapses_to_update):
+        s_tag = self._s_tag.reshape(-1)
+        synapse_indexes = synapse_indexes[(s_tag[synapse_indexes] != 0)
+                                          & ~synapses_to_update[synapse_indexes]]
+        self._decay_s_tags(step, synapse_indexes)
+        synapses_to_update[synapse_indexes] = True
+
+    def _cap_synapses(self, synapse_indexes):
+        min_strength = self._min_strength_flat[synapse_indexes]
+        max_strength = self._max_strength_flat[synapse_indexes]
+        strength = self._strength.reshape(-1)
+        inhibitory_strength = self._inhibitory_strength.reshape(-1)
+        strength[synapse_indexes] = np.clip(strength[synapse_indexes],
+                                            min_strength, max_strength)
+        inhibitory_strength[synapse_indexes] = np.clip(inhibitory_strength[synapse_indexes],
+                                                       min_strength, max_strength)
+
+    def _output_balance(self):
+        enabled = self._output_balance_enabled
+        homeostasis.output_balance(
+            self._strength.reshape(-1), self._inhibitory_strength.reshape(-1),
+            self._pre_cell_indexes_flat, self._post_cell_indexes_flat,
+            self._target_input.reshape(-1),
+            enabled & self._excitatory_cells,
+            enabled & self._inhibitory_cells & ~self._lock_inhibition_strength)
+
+    def _fire_rate_balance(self, step):
+        '''
+        See numpy_model.SimpleModel._fire_rate_balance
+        '''
+        cells = self._input_balance
+        target_input = self._target_input.reshape(-1)
+        if not homeostasis.update_target_input(
+                target_input, cells, self._fire_counts.recent_fires,
+                self._target_fire_rate_per_epoch, step, self.epoch_length,
+                self._fire_history_length, self._fire_rate_balance_scalar):
+            return
+
+        homeostasis.input_balance(self._strength.reshape(-1),
+                                  self._inhibitory_strength.reshape(-1),
+                                  self._post_cell_indexes_flat, target_input,
+                                  cells, self._lock_inhibition_strength,
+                                  self._min_strength_flat, self._max_strength_flat,
+                                  self._input_balance_scalar)
+
+    def _update_dopamine(self, step, has_reward):
+        self._dopamine = self._dopamine * (1 - self._dopamine_decay)**self._step_size
+        if has_reward.any():
+            # the dopamine history only covers steps since the last reward
+            self._settle_synapses(step=step - 1, instances=has_reward)
+            self._dopamine[has_reward] = 1
+        self._dopamine_history.record(step, self._dopamine, has_reward)
+
+    def export(self, instance):
+        '''
+        Blob for one instance that can be imported as any SimpleModel.
+        '''
+        self._settle_synapses()
+        updated_synapse_definitions = []
+        for index, (pre_cell_index, post_cell_index, strength, inhibitory_strength) in enumerate(
+                zip(self._pre_cell_indexes.tolist(), self._post_cell_indexes.tolist(),
+                    self._strength[instance].tolist(),
+                    self._inhibitory_strength[instance].tolist())):
+            definition = SynapseDefinition(
+                pre_cell_index,
+                post_cell_index,
+                strength,
+                inhibitory_strength,
+                label=self._synapse_labels.get(index))
+            updated_synapse_definitions.append(definition)
+
+        updated_network_definition = NetworkDefinition(
+            self.network_definition.cell_definitions,
+            updated_synapse_definitions)
+        updated_network_definition.assign_uuids()
+
+        model_parameters = self.model_parameters_list[instance]
+        blob = {"model_parameters": dataclasses.asdict(model_parameters),
+                "network_definition": dataclasses.asdict(updated_network_definition),
+                "version": "2"
+                }
+        return blob
+
+    def test_outputs(self, instance):
+        self._settle_synapses()
+        outputs = {}
+        cell_definitions = self.network_definition.cell_definitions
+        for index, cell_definition in enumerate(cell_definitions):
+            outputs[cell_definition.label] = float(self._voltage[instance, index])
+
+        for index in range(self._strength.shape[1]):
+            pre_cell = cell_definitions[self._pre_cell_indexes[index]]
+            post_cell = cell_definitions[self._post_cell_indexes[index]]
+            outputs[f"{pre_cell.label}_to_{post_cell.label}"] = float(
+                self._strength[instance, index])
+        return outputs
+
+    def _build_network(self, network_definition):
+        cell_definitions = network_definition.cell_definitions
+        synapse_arrays = network_definition.synapse_arrays()
+        batch_size = self.batch_size
+        number_of_cells = len(cell_definitions)
+        number_of_synapses = len(synapse_arrays)
+        cell_shape = (batch_size, number_of_cells)
+        synapse_shape = (batch_size, number_of_synapses)
+
+        def cell_parameter(name, dtype=float):
+            return self._instance_parameters(
+                lambda model_parameters: getattr(model_parameters.cell_type_parameters, name),
+                number_of_cells, dtype).reshape(cell_shape)
+
+        def synapse_parameter(name):
+            return self._instance_parameters(
+                lambda model_parameters: getattr(model_parameters.synapse_type_parameters,
+                                                 name),
+                number_of_synapses)
+
+        self._voltage = cell_parameter("starting_membrane_voltage")
+        self._input_current = cell_parameter("starting_input_current")
+        self._calcium = cell_parameter("starting_calcium")
+        self._voltage_factor = (1 - cell_parameter("voltage_decay"))**self._step_size
+        self._current_factor = (1 - cell_parameter("current_decay"))**self._step_size
+        self._calcium_factor = (1 - cell_parameter("calcium_decay"))**self._step_size
+        self._max_voltage = cell_parameter("max_voltage")
+        self._voltage_reset = cell_parameter("voltage_reset")
+        self._calcium_increment = cell_parameter("calcium_increment")
+        self._input_current_reset = cell_parameter("input_current_reset")
+        self._reset_input_current = cell_parameter("reset_input_current", bool)
+        self._fired = np.zeros(cell_shape, dtype=bool)
+        self._active = np.ones(cell_shape, dtype=bool)
+        self._fire_trace = np.zeros(cell_shape, dtype=np.int64)
+        self._fire_counts = FireCounts(batch_size * number_of_cells, self._fire_history_length)
+
+        def cell_flags(flag, dtype=bool):
+            return np.tile(np.array([flag(cell) for cell in cell_definitions], dtype=dtype),
+                           batch_size)
+
+        cell_types = cell_flags(lambda cell: cell.cell_type, np.int64)
+        self._output_ids = [cell.output_id for cell in cell_definitions]
+        self._is_output_cell_flat = cell_flags(lambda cell: cell.is_output_cell)
+        self._input_balance = cell_flags(lambda cell: cell.input_balance)
+        self._output_balance_enabled = cell_flags(lambda cell: cell.output_balance)
+        self._lock_inhibition_strength = cell_flags(lambda cell: cell.lock_inhibition_strength)
+        self._target_fire_rate_per_epoch = cell_flags(
+            lambda cell: cell.target_fire_rate_per_epoch, float)
+        self._excitatory_cells = ((cell_types == CellType.EXCITATORY)
+                                  | (cell_types == CellType.MIXED))
+        self._inhibitory_cells = ((cell_types == CellType.INHIBITORY)
+                                  | (cell_types == CellType.MIXED))
+
+        # only labels that are not the default pre_to_post
+        self._synapse_labels = dict(synapse_arrays.labels)
+        self._pre_cell_indexes = synapse_arrays.pre_cell_index.astype(np.int64)
+        self._post_cell_indexes = synapse_arrays.post_cell_index.astype(np.int64)
+        cell_offsets = np.repeat(np.arange(batch_size) * number_of_cells, number_of_synapses)
+        self._pre_cell_indexes_flat = np.tile(self._pre_cell_indexes, batch_size) + cell_offsets
+        self._post_cell_indexes_flat = (np.tile(self._post_cell_indexes, batch_size)
+                                        + cell_offsets)
+
+        def synapse_values(column, dtype=float):
+            return np.tile(column.astype(dtype), batch_size)
+
+        self._strength = synapse_values(
+            synapse_arrays.starting_strength).reshape(synapse_shape)
+        self._inhibitory_strength = synapse_values(
+            synapse_arrays.starting_inhibitory_strength).reshape(synapse_shape)
+        self._unsupervised_stdp_flat = synapse_values(synapse_arrays.unsupervised_stdp, bool)
+        self._reward_scalar_flat = synapse_values(synapse_arrays.reward_scalar)
+        self._s_tag_decay_rate_flat = synapse_values(synapse_arrays.s_tag_decay_rate)
+        self._stdp_scalar_flat = synapse_parameter("stdp_scalar")
+        self._max_strength_flat = synapse_parameter("max_strength")
+        self._min_strength_flat = synapse_parameter("min_strength")
+        self._noise_factor_flat = synapse_parameter("noise_factor")
+
+        # can be though of as recording the firing pattern correlation
+        self._s_tag = synapse_parameter("starting_s_tag").reshape(synapse_shape)
+        self._last_stag_decay = np.zeros(synapse_shape, dtype=np.int64)
+        self._pre_cell_synapses_to_update = np.zeros(synapse_shape, dtype=bool)
+        self._post_cell_synapses_to_update = np.zeros(synapse_shape, dtype=bool)
+
+        self._excitatory_flat = self._excitatory_cells[self._pre_cell_indexes_flat]
+        self._inhibitory_flat = self._inhibitory_cells[self._pre_cell_indexes_flat]
+
+        self._outgoing = SynapseIndex(self._pre_cell_indexes_flat, batch_size * number_of_cells)
+        self._incoming = SynapseIndex(self._post_cell_indexes_flat,
+                                      batch_size * number_of_cells)
+
+        self._target_input = np.bincount(self._post_cell_indexes_flat,
+                                         weights=self._strength.reshape(-1),
+                                         minlength=batch_size * number_of_cells).reshape(
+                                             cell_shape)
+
+def run_batch(model, environments, steps):
+    '''
+    Steps a BatchedModel with one environment per instance the same way main runs a single
+    model. Returns each environment's ResultTracker.
+    '''
+    output_ids_list = [[] for _ in environments]
+    for i in range(steps):
+        stimuli_list = []
+        has_reward_list = []
+        active_environment_list = []
+        for environment, output_ids in zip(environments, output_ids_list):
+            environment.step(i, output_ids)
+            stimuli_list.append(environment.stimuli(i))
+            has_reward_list.append(environment.has_reward())
+            active_environment_list.append(environment.active(i))
+        output_ids_list = model.step(i, stimuli_list, has_reward_list, active_environment_list)
+    return [environment._result_tracker for environment in environments]
+
+def run_compiled_batch(model, environments, steps, random_states=None):
+    '''
+    main.run_compiled for a BatchedModel with one environment per instance. Environments
+    must agree on where epochs start and end. Returns each environment's ResultTracker.
+
+    random_states: one random state per environment, swapped in while the environment
+        schedules an epoch so environments that draw from random draw what they would
+        running alone. Updated in place.
+    '''
+    step = 0
+    while step < steps:
+        schedules = []
+        for index, environment in enumerate(environments):
+            if random_states is not None:
+                random.setstate(random_states[index])
+            schedules.append(environment.epoch_schedule(step))
+            if random_states is not None:
+                random_states[index] = random.getstate()
+        end_step = schedules[0].end_step
+        if any(schedule.end_step != end_step for schedule in schedules):
+            raise Exception("batched environments must share epochs")
+        number_of_steps = min(end_step, steps) - step
+        model.run_steps(step, number_of_steps, schedules)
+        step += number_of_steps
+    return [environment._result_tracker for environment in environments]
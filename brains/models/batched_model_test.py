@@ -0,0 +1,86 @@
+import brains.models.batched_model as batched_model
+import brains.models.numpy_model as numpy_model
+import brains.models.simple_model_builder as simple_model_builder
+import brains.network_definitions as network_definitions
+from brains.models.numpy_model_test import run_model, choice_network, easy_fake_environment
+
+import random
+import unittest
+
+class TestBatchedModel(unittest.TestCase):
+
+    def test_instances_match_separate_models(self):
+        network_definition = choice_network()
+        model_parameters_list = []
+        for max_strength, dopamine_decay in ((0.4, 0.1), (0.3, 0.05), (0.4, 0.2)):
+            model_parameters = simple_model_builder.handwriting_model_parameters()
+            model_parameters.dopamine_decay = dopamine_decay
+            model_parameters.synapse_type_parameters.max_strength = max_strength
+            model_parameters.synapse_type_parameters.noise_factor = 0.0
+            model_parameters_list.append(model_parameters)
+        model_parameters_list[2].cell_type_parameters.voltage_decay = 0.02
+
+        epochs = 20
+        steps = epochs * 400
+        model = batched_model.BatchedModel(network_definition, model_parameters_list)
+        environments = [easy_fake_environment(epochs, 400, 50)
+                        for _ in model_parameters_list]
+        result_trackers = batched_model.run_batch(model, environments, steps)
+
+        for instance, model_parameters in enumerate(model_parameters_list):
+            single_model = numpy_model.SimpleModel(network_definition, model_parameters)
+            environment = easy_fake_environment(epochs, 400, 50)
+            run_model(single_model, environment, steps)
+            self.assertEqual(environment._result_tracker, result_trackers[instance])
+
+            single_outputs = single_model.test_outputs()
+            batched_outputs = model.test_outputs(instance)
+            for label, value in single_outputs.items():
+                self.assertAlmostEqual(value, batched_outputs[label], places=9)
+
+        self.assertGreater(result_trackers[0].rewarded, 0)
+
+    def test_seeded_instances_match_seeded_models(self):
+        '''
+        Instances that differ only in their seed get the same noise as numpy models seeded
+        the same way.
+        '''
+        network_definition = choice_network()
+        model_parameters = simple_model_builder.handwriting_model_parameters()
+        model_parameters.synapse_type_parameters.max_strength = 0.4
+        random_seeds = [0, 1, 2]
+        seeds = []
+        for random_seed in random_seeds:
+            random.seed(random_seed)
+            seeds.append(random.getrandbits(64))
+
+        epochs = 20
+        steps = epochs * 400
+        model = batched_model.BatchedModel(network_definition,
+                                           [model_parameters] * len(seeds), seeds)
+        environments = [easy_fake_environment(epochs, 400, 50) for _ in seeds]
+        result_trackers = batched_model.run_batch(model, environments, steps)
+
+        for instance, random_seed in enumerate(random_seeds):
+            random.seed(random_seed)
+            single_model = numpy_model.SimpleModel(network_definition, model_parameters)
+            environment = easy_fake_environment(epochs, 400, 50)
+            run_model(single_model, environment, steps)
+            self.assertEqual(environment._result_tracker, result_trackers[instance])
+
+            single_outputs = single_model.test_outputs()
+            batched_outputs = model.test_outputs(instance)
+            for label, value in single_outputs.items():
+                self.assertAlmostEqual(value, batched_outputs[label], places=9)
+
+        self.assertNotEqual(model.test_outputs(0), model.test_outputs(1))
+
+    def test_instances_must_share_epochs(self):
+        network_definition = network_definitions.easy_layer_network()
+        model_parameters_list = [simple_model_builder.ModelParameters(epoch_length=400),
+                                 simple_model_builder.ModelParameters(epoch_length=200)]
+        with self.assertRaises(Exception):
+            batched_model.BatchedModel(network_definition, model_parameters_list)
+
+if __name__ == '__main__':
+    unittest.main()
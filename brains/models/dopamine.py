@@ -0,0 +1,97 @@
+from brains.utils import geometric_series
+
+import numpy as np
+
+class DopamineHistory:
+    '''
+    Between rewards dopamine decays by the same factor every step so its value at any step
+    since the last reward is known without storing it. Synapses waiting on reward use this
+    to add up what the per step update would have given them over any number of steps at
+    once.
+
+    Models must bring every waiting synapse up to date before recording a reward because
+    the history only covers steps since the last one.
+    '''
+    def __init__(self, dopamine_decay, step_size):
+        self.step = None
+        self._decay_factor = (1 - dopamine_decay)**step_size
+        self._start_step = None
+        self._start_dopamine = 0.0
+
+    def record(self, step, dopamine, rewarded):
+        if rewarded or self._start_step is None:
+            self._start_step = step
+            self._start_dopamine = dopamine
+        self.step = step
+
+    def _dopamine_at(self, step):
+        return self._start_dopamine * self._decay_factor**(step - self._start_step)
+
+    def checkpoint_state(self):
+        return {"step": self.step, "start_step": self._start_step,
+                "start_dopamine": self._start_dopamine}
+
+    def restore_state(self, state):
+        self.step = state["step"]
+        self._start_step = state["start_step"]
+        self._start_dopamine = state["start_dopamine"]
+
+    def reward(self, s_tag, s_tag_decay_rate, from_step, to_step, unsupervised_stdp):
+        '''
+        Sum of s_tag * dopamine over the updates after from_step up to and including to_step
+        where s_tag was last decayed at from_step. Unsupervised synapses ignore dopamine.
+        '''
+        steps = to_step - from_step
+        s_tag_factor = 1 - s_tag_decay_rate
+        if unsupervised_stdp:
+            return s_tag * s_tag_factor * geometric_series(s_tag_factor, steps)
+
+        return (s_tag * s_tag_factor * self._dopamine_at(from_step + 1)
+                * geometric_series(s_tag_factor * self._decay_factor, steps))
+
+    def rewards(self, s_tags, s_tag_decay_rates, from_steps, to_step, unsupervised_stdp):
+        '''
+        Vectorized reward for arrays of synapses.
+        '''
+        return _rewards(s_tags, s_tag_decay_rates, from_steps, to_step, unsupervised_stdp,
+                        self._decay_factor, self._dopamine_at(from_steps + 1))
+
+class BatchedDopamineHistory:
+    '''
+    DopamineHistory for a batch of models that each have their own dopamine decay and
+    rewards. Synapses say which model they belong to by instance index.
+    '''
+    def __init__(self, dopamine_decays, step_size):
+        self.step = None
+        self._decay_factor = (1 - np.asarray(dopamine_decays, dtype=float))**step_size
+        self._start_step = np.zeros(len(self._decay_factor), dtype=np.int64)
+        self._start_dopamine = np.zeros(len(self._decay_factor))
+
+    def record(self, step, dopamine, rewarded):
+        if self.step is None:
+            rewarded = True
+        self._start_step = np.where(rewarded, step, self._start_step)
+        self._start_dopamine = np.where(rewarded, dopamine, self._start_dopamine)
+        self.step = step
+
+    def rewards(self, s_tags, s_tag_decay_rates, from_steps, to_step, unsupervised_stdp,
+                instances):
+        decay_factor = self._decay_factor[instances]
+        dopamine = (self._start_dopamine[instances]
+                    * decay_factor**(from_steps + 1 - self._start_step[instances]))
+        return _rewards(s_tags, s_tag_decay_rates, from_steps, to_step, unsupervised_stdp,
+                        decay_factor, dopamine)
+
+def _rewards(s_tags, s_tag_decay_rates, from_steps, to_step, unsupervised_stdp,
+             decay_factor, dopamine):
+    '''
+    Sum of s_tag * dopamine for arrays of synapses where dopamine is its value the step
+    after from_steps.
+    '''
+    steps = to_step - from_steps
+    s_tag_factors = 1 - s_tag_decay_rates
+    ratios = np.where(unsupervised_stdp, s_tag_factors, s_tag_factors * decay_factor)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        series = np.where(ratios == 1, steps, (1 - ratios**steps) / (1 - ratios))
+    dopamine = np.where(unsupervised_stdp, 1.0, dopamine)
+    return s_tags * s_tag_factors * dopamine * series
@@ -0,0 +1,49 @@
+from brains.models.dopamine import DopamineHistory
+from brains.utils import decay
+
+import numpy as np
+import unittest
+
+def per_step_reward(s_tag, s_tag_decay_rate, dopamine, dopamine_decay, steps,
+                    unsupervised_stdp):
+    total = 0.0
+    for _ in range(steps):
+        s_tag = s_tag * (1 - s_tag_decay_rate)
+        dopamine = decay(dopamine, dopamine_decay, 1)
+        total += s_tag if unsupervised_stdp else s_tag * dopamine
+    return total
+
+class TestDopamineHistory(unittest.TestCase):
+
+    def test_reward_matches_per_step_updates(self):
+        history = DopamineHistory(0.05, 1)
+        history.record(10, 1.0, True)
+        for step in range(11, 40):
+            history.record(step, 0.0, False)
+
+        # s_tag last decayed at step 15, dopamine then is 0.95**5
+        for unsupervised_stdp in (False, True):
+            expected = per_step_reward(0.3, 0.1, 0.95**5, 0.05, 20, unsupervised_stdp)
+            reward = history.reward(0.3, 0.1, 15, 35, unsupervised_stdp)
+            self.assertAlmostEqual(reward, expected, places=12)
+
+        # s_tag and dopamine decaying at the same rate
+        expected = per_step_reward(0.3, 0.05, 1.0, 0.05, 7, False)
+        self.assertAlmostEqual(history.reward(0.3, 0.05, 10, 17, False), expected, places=12)
+
+    def test_rewards_matches_reward(self):
+        history = DopamineHistory(0.05, 1)
+        history.record(0, 1.0, True)
+        s_tags = np.array([0.3, -0.2, 0.1])
+        s_tag_decay_rates = np.array([0.1, 0.05, 0.2])
+        from_steps = np.array([0, 3, 8])
+        unsupervised_stdp = np.array([False, False, True])
+        rewards = history.rewards(s_tags, s_tag_decay_rates, from_steps, 12, unsupervised_stdp)
+        for i in range(3):
+            self.assertAlmostEqual(rewards[i],
+                                   history.reward(s_tags[i], s_tag_decay_rates[i],
+                                                  from_steps[i], 12, unsupervised_stdp[i]),
+                                   places=12)
+
+if __name__ == '__main__':
+    unittest.main()
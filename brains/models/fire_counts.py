@@ -0,0 +1,34 @@
+import numpy as np
+
+class FireCounts:
+    '''
+    Spikes per cell over the last history_length epochs, used for fire rate balancing. Each
+    epoch gets a row of per cell counts in a ring buffer. The total over the ring is kept up
+    to date as cells fire so nothing needs recounting when balancing.
+    '''
+    def __init__(self, number_of_cells, history_length):
+        self.counts = np.zeros((history_length, number_of_cells), dtype=np.int64)
+        self.recent_fires = np.zeros(number_of_cells, dtype=np.int64)
+        self.position = 0
+
+    def record(self, cell_indexes):
+        self.counts[self.position, cell_indexes] += 1
+        self.recent_fires[cell_indexes] += 1
+
+    def record_many(self, cell_indexes):
+        '''
+        record for fires from several steps of the same epoch, a cell can be in cell_indexes
+        more than once.
+        '''
+        fires = np.bincount(np.asarray(cell_indexes, dtype=np.int64),
+                            minlength=self.counts.shape[1])
+        self.counts[self.position] += fires
+        self.recent_fires += fires
+
+    def advance(self):
+        '''
+        Starts counting a new epoch and forgets the oldest one.
+        '''
+        self.position = (self.position + 1) % len(self.counts)
+        self.recent_fires -= self.counts[self.position]
+        self.counts[self.position] = 0
@@ -0,0 +1,32 @@
+from brains.models.fire_counts import FireCounts
+
+import numpy as np
+import unittest
+
+class TestFireCounts(unittest.TestCase):
+
+    def test_counts_last_epochs(self):
+        fire_counts = FireCounts(3, 2)
+        fire_counts.record(np.array([0, 2]))
+        fire_counts.record(np.array([0]))
+        self.assertEqual(list(fire_counts.recent_fires), [2, 0, 1])
+
+        fire_counts.advance()
+        fire_counts.record(np.array([1]))
+        self.assertEqual(list(fire_counts.recent_fires), [2, 1, 1])
+
+        # first epoch drops out
+        fire_counts.advance()
+        self.assertEqual(list(fire_counts.recent_fires), [0, 1, 0])
+        fire_counts.advance()
+        self.assertEqual(list(fire_counts.recent_fires), [0, 0, 0])
+
+    def test_record_many_counts_repeats(self):
+        fire_counts = FireCounts(3, 2)
+        fire_counts.record_many(np.array([2, 0, 2, 2]))
+        self.assertEqual(list(fire_counts.recent_fires), [1, 0, 3])
+        fire_counts.record_many(np.array([], dtype=int))
+        self.assertEqual(list(fire_counts.recent_fires), [1, 0, 3])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import numpy as np
+
+# Epoch balancing from integrate_model.Cell done for every cell at once. Synapse arrays are
+# grouped by their pre cell for output balancing and by their post cell for input balancing.
+# Each synapse has one pre and one post cell so the per cell updates never touch the same
+# synapse and can all happen together.
+
+def segment_sums(values, segment_indexes, number_of_segments):
+    '''
+    Sum of values for each segment. Values are added one at a time in order so the sums
+    come out exactly as the per cell loops add them up.
+    '''
+    return np.bincount(segment_indexes, weights=values, minlength=number_of_segments)
+
+def output_balance(strength, inhibitory_strength, pre_cell_indexes, post_cell_indexes,
+                   target_input, excitatory_cells, inhibitory_cells):
+    '''
+    Cell.output_balance for the excitatory_cells and inhibitory_cells masks. A mixed cell
+    wanting both is in both masks. Strength arrays are changed in place.
+    '''
+    number_of_cells = len(target_input)
+    post_cell_targets = target_input[post_cell_indexes]
+    total_post_cell_strength = segment_sums(post_cell_targets, pre_cell_indexes,
+                                            number_of_cells)
+    num_cells = np.bincount(pre_cell_indexes[post_cell_targets > 0], minlength=number_of_cells)
+    output_counts = np.bincount(pre_cell_indexes, minlength=number_of_cells)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        average_post_cell_strength = total_post_cell_strength / num_cells
+
+    excitatory_cells = excitatory_cells & (num_cells > 0)
+    positive_output_strength = segment_sums(strength, pre_cell_indexes, number_of_cells)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        reset = average_post_cell_strength / output_counts
+        scale = average_post_cell_strength / positive_output_strength
+
+    reset_synapses = (excitatory_cells & (positive_output_strength == 0))[pre_cell_indexes]
+    strength[reset_synapses] = reset[pre_cell_indexes[reset_synapses]]
+    scale_synapses = (excitatory_cells & (positive_output_strength != 0))[pre_cell_indexes]
+    strength[scale_synapses] *= scale[pre_cell_indexes[scale_synapses]]
+
+    inhibitory_cells = inhibitory_cells & (num_cells > 0)
+    negative_output_strength = segment_sums(inhibitory_strength, pre_cell_indexes,
+                                            number_of_cells)
+    if (negative_output_strength[inhibitory_cells] == 0).any():
+        raise ZeroDivisionError("float division by zero")
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n_scale = average_post_cell_strength / negative_output_strength
+    n_scale_synapses = inhibitory_cells[pre_cell_indexes]
+    inhibitory_strength[n_scale_synapses] *= n_scale[pre_cell_indexes[n_scale_synapses]]
+
+def update_target_input(target_input, balanced_cells, recent_fires, target_fire_rate_per_epoch,
+                        step, epoch_length, fire_history_length, fire_rate_balance_scalar):
+    '''
+    The part of Cell.fire_rate_balance that moves target_input towards the target fire rate.
+    target_input is changed in place. Returns False when there is nothing to balance yet.
+    '''
+    if not balanced_cells.any():
+        return False
+
+    target_fire_rate = target_fire_rate_per_epoch / epoch_length
+    if (target_fire_rate[balanced_cells] == 0).any():
+        raise Exception("target fire rate should be greater than 0 with input balancing")
+
+    if step == 0:
+        return False
+
+    if step > epoch_length * fire_history_length:
+        running_fire_rate = recent_fires / (epoch_length * fire_history_length)
+    else:
+        running_fire_rate = recent_fires / step
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate_based_down_scale_factor = target_fire_rate/running_fire_rate
+        rate_based_up_scale_factor = np.where(running_fire_rate == 0, 2.0,
+                                              target_fire_rate/running_fire_rate)
+        down_change = target_input - target_input * rate_based_down_scale_factor
+        up_change = target_input * rate_based_up_scale_factor - target_input
+    down = running_fire_rate > target_fire_rate
+    new_target_input = np.where(
+        down,
+        target_input - fire_rate_balance_scalar * down_change,
+        target_input + fire_rate_balance_scalar * up_change)
+    target_input[balanced_cells] = new_target_input[balanced_cells]
+    return True
+
+def input_balance(strength, inhibitory_strength, post_cell_indexes, target_input,
+                  balanced_cells, lock_inhibition_strength,
+                  min_strength, max_strength, input_balance_scalar):
+    '''
+    The part of Cell.fire_rate_balance that scales input strengths towards target_input
+    once the new targets are known. Strength arrays are changed in place. min_strength and
+    max_strength are either floats or arrays with a value for every synapse.
+    '''
+    def apply_positive(cells, targets):
+        return _apply_input_balance(strength, post_cell_indexes, cells, targets,
+                                    min_strength, max_strength, input_balance_scalar)
+
+    def apply_negative(cells, targets):
+        real_negative_strength = _apply_input_balance(
+            inhibitory_strength, post_cell_indexes, cells, targets,
+            min_strength, max_strength, input_balance_scalar)
+        # Synapse.cap also caps strength though it was already capped above
+        synapses = cells[post_cell_indexes]
+        strength[synapses] = np.clip(strength[synapses], _select(min_strength, synapses),
+                                     _select(max_strength, synapses))
+        return real_negative_strength
+
+    real_positive_strength = apply_positive(balanced_cells, target_input)
+    negative_cells = balanced_cells & ~lock_inhibition_strength
+    real_negative_strength = apply_negative(negative_cells, target_input)
+
+    negative_cells = negative_cells & (real_negative_strength != 0.0)
+    use_positive = real_positive_strength < real_negative_strength
+    targets = np.where(use_positive, real_positive_strength, real_negative_strength)
+    real_positive_strength = apply_positive(negative_cells, targets)
+    targets = np.where(use_positive, real_positive_strength, real_negative_strength)
+    apply_negative(negative_cells, targets)
+
+def _apply_input_balance(values, post_cell_indexes, cells, targets,
+                         min_strength, max_strength, input_balance_scalar):
+    number_of_cells = len(cells)
+    current_strength = segment_sums(values, post_cell_indexes, number_of_cells)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale_factor = np.where(current_strength > 0.0, targets / current_strength, 1.0)
+
+    change_factor = scale_factor * input_balance_scalar
+    keep_factor = 1 - input_balance_scalar
+    synapses = cells[post_cell_indexes]
+    synapse_values = values[synapses]
+    synapse_change_factor = change_factor[post_cell_indexes[synapses]]
+    values[synapses] = np.clip((synapse_values * synapse_change_factor)
+                               + (synapse_values * keep_factor),
+                               _select(min_strength, synapses), _select(max_strength, synapses))
+    return segment_sums(values, post_cell_indexes, number_of_cells)
+
+def _select(value, indexes):
+    if np.ndim(value) == 0:
+        return value
+    return value[indexes]
@@ -0,0 +1,63 @@
+import brains.models.integrate_model as integrate_model
+import brains.models.numpy_model as numpy_model
+import brains.models.simple_model_builder as simple_model_builder
+import brains.network_definitions as network_definitions
+
+import random
+import unittest
+
+class TestHomeostasis(unittest.TestCase):
+
+    def balance_side_by_side(self, network_definition, step):
+        '''
+        Gives both models the same random strengths and fire history then checks the bulk
+        epoch balancing of the numpy model matches the python model balancing cell by cell.
+        '''
+        model_parameters = simple_model_builder.ModelParameters()
+        python_model = integrate_model.SimpleModel(network_definition, model_parameters)
+        numpy_model_ = numpy_model.SimpleModel(network_definition, model_parameters)
+
+        random.seed(0)
+        for python_synapse, numpy_synapse in zip(python_model.synapses, numpy_model_.synapses):
+            strength = random.uniform(0.0, 0.3)
+            inhibitory_strength = random.choice([0.0, random.uniform(0.0, 0.3)])
+            python_synapse.strength = strength
+            python_synapse.inhibitory_strength = inhibitory_strength
+            numpy_synapse.strength = strength
+            numpy_synapse.inhibitory_strength = inhibitory_strength
+
+        for index, cell in enumerate(python_model._cells):
+            cell._recent_fires = random.randint(0, 5)
+            numpy_model_._fire_counts.recent_fires[index] = cell._recent_fires
+            cell._target_input = random.choice([0.0, random.uniform(0.0, 0.5)])
+            numpy_model_._target_input[index] = cell._target_input
+
+        for cell in python_model._cells:
+            cell.output_balance()
+        for cell in python_model._cells:
+            cell.fire_rate_balance(step, python_model.epoch_length)
+        numpy_model_._output_balance()
+        numpy_model_._fire_rate_balance(step)
+
+        for python_synapse, numpy_synapse in zip(python_model.synapses, numpy_model_.synapses):
+            self.assertAlmostEqual(python_synapse.strength, numpy_synapse.strength, places=12)
+            self.assertAlmostEqual(python_synapse.inhibitory_strength,
+                                   numpy_synapse.inhibitory_strength, places=12)
+        for index, cell in enumerate(python_model._cells):
+            self.assertAlmostEqual(cell._target_input, numpy_model_._target_input[index],
+                                   places=12)
+
+    def test_matches_per_cell_balancing(self):
+        self.balance_side_by_side(network_definitions.easy_layer_network(), 3000)
+
+    def test_matches_per_cell_balancing_early(self):
+        self.balance_side_by_side(network_definitions.easy_layer_network(), 200)
+
+    def test_matches_per_cell_balancing_locked_inhibition(self):
+        network_definition = network_definitions.easy_layer_network()
+        for cell_definition in network_definition.cell_definitions:
+            cell_definition.lock_inhibition_strength = cell_definition.layer_id in ("i", "b")
+        self.balance_side_by_side(network_definition, 3000)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,25 +1,30 @@
-from brains.utils import decay
+from brains.utils import decay, integrate_voltage, steps_until_voltage_exceeds
 from brains.network import SynapseDefinition, NetworkDefinition, CellType
+from brains.stimuli import ArrayStimuli, InputMapping
+from brains.models.dopamine import DopamineHistory
+import brains.models.schedule as step_schedule
 
 from collections import defaultdict
 import random
 import dataclasses
+import numpy as np
 
 class Synapse:
     def __init__(self, pre_cell, post_cell,
                  synapse_definition, step_size,
-                 synapse_type_parameters):
+                 synapse_type_parameters, dopamine_history):
         
         self._step_size = step_size
+        self._dopamine_history = dopamine_history
         self.pre_cell = pre_cell
         self._pre_cell_type = pre_cell.cell_type
         self.post_cell = post_cell
         
         self._unsupervised_stdp = synapse_definition.unsupervised_stdp
         self._reward_scalar = synapse_definition.reward_scalar
-        self.strength = synapse_definition.starting_strength
+        self._strength = synapse_definition.starting_strength
         self.inhibitory_strength = synapse_definition.starting_inhibitory_strength
-        self.label = synapse_definition.label
+        self._label = synapse_definition.label
         self._s_tag_decay_rate = synapse_definition.s_tag_decay_rate
 
         # can be though of as recording the firing pattern correlation
@@ -34,12 +39,31 @@ class Synapse:
         self._post_cell_fired = False
         self._last_stag_decay = 0
 
+        # number of cells waiting on reward for this synapse, each one updates it every step
+        self._times_queued = 0
+
+    @property
+    def label(self):
+        if self._label is not None:
+            return self._label
+        return f"{self.pre_cell.label}_to_{self.post_cell.label}"
+
+    @property
+    def strength(self):
+        self.settle()
+        return self._strength
+
+    @strength.setter
+    def strength(self, value):
+        self.settle()
+        self._strength = value
+
     def cap(self):
-        if self.strength >= self._max_strength:
-            self.strength = self._max_strength
+        if self._strength >= self._max_strength:
+            self._strength = self._max_strength
         
-        if self.strength < self._min_strength:
-            self.strength = self._min_strength
+        if self._strength < self._min_strength:
+            self._strength = self._min_strength
 
         if self.inhibitory_strength >= self._max_strength:
             self.inhibitory_strength = self._max_strength
@@ -52,22 +76,56 @@ class Synapse:
         self._last_stag_decay = step
         self._s_tag = self._s_tag * (1 - self._s_tag_decay_rate)**steps_sense_last_stag_decay
 
-    def update(self, step, dopamine):
+    def queue(self, step):
+        '''
+        Called when a cell starts waiting on reward for this synapse.
+        '''
+        self.settle()
         self._decay_s_tag(step)
-        if self._unsupervised_stdp:
-            self.strength += self._s_tag * self._reward_scalar
-        else:
-            self.strength += self._s_tag * dopamine * self._reward_scalar
+        self._times_queued += 1
+
+    def settle(self, step=None):
+        '''
+        Applies every update the queued synapse has been owed up to and including step in
+        one go. Same as calling update each step for each cell the synapse is queued on.
+
+        Within the steps being settled the s_tag and dopamine only decay so every update
+        moves strength the same direction. After the first capped update capping the total
+        is the same as capping each update.
+        '''
+        if self._times_queued == 0:
+            return
+
+        if step is None:
+            step = self._dopamine_history.step
+        from_step = self._last_stag_decay
+        if step <= from_step:
+            return
+
+        first_reward = self._reward_scalar * self._dopamine_history.reward(
+            self._s_tag, self._s_tag_decay_rate, from_step, from_step + 1,
+            self._unsupervised_stdp)
+        total_reward = self._reward_scalar * self._dopamine_history.reward(
+            self._s_tag, self._s_tag_decay_rate, from_step, step, self._unsupervised_stdp)
+        self._decay_s_tag(step)
+        self._strength += first_reward
+        self.cap()
+        self._strength += total_reward * self._times_queued - first_reward
         self.cap()
 
     def post_fire(self, step):
         if self._pre_cell_type == CellType.INHIBITORY:
             return
 
+        self.settle()
+        self.pre_cell.catch_up(step)
+
         self._decay_s_tag(step)
         self._s_tag += self._stdp_scalar * self.pre_cell.calcium()
 
     def pre_fire(self, step):
+        self.settle()
+        self.post_cell.catch_up(step)
         if self._pre_cell_type == CellType.INHIBITORY or self._pre_cell_type == CellType.MIXED:
             self.post_cell.receive_fire(self.inhibitory_strength * -1.0)
 
@@ -112,13 +170,29 @@ class CellMembrane:
         self._input_current += strength
 
     def warp(self, time_steps):
+        '''
+        Exactly the same as calling update time_steps times as long as the cell does not
+        fire in that time. See steps_until_fire.
+        '''
         self.active = True
-        self._voltage = self._voltage * (1 - self._voltage_decay)**time_steps
-        
-        # Figure out integral. 
-        # self._voltage += self._input_current * time_steps
-        self._input_current = self._input_current * (1 - self._current_decay)**time_steps
-        self._calcium = self._calcium * (1 - self._calcium_decay)**time_steps
+        self.fired = False
+        voltage_factor = (1 - self._voltage_decay)**self._step_size
+        current_factor = (1 - self._current_decay)**self._step_size
+        self._voltage = integrate_voltage(self._voltage, self._input_current,
+                                          voltage_factor, current_factor,
+                                          self._step_size, time_steps)
+        self._input_current = self._input_current * current_factor**time_steps
+        self._calcium = self._calcium * ((1 - self._calcium_decay)**self._step_size)**time_steps
+
+    def steps_until_fire(self):
+        '''
+        Number of updates that can happen before the update where the cell fires. 0 means the
+        next update fires. None means the cell will not fire without more input.
+        '''
+        return steps_until_voltage_exceeds(self._voltage, self._input_current,
+                                           (1 - self._voltage_decay)**self._step_size,
+                                           (1 - self._current_decay)**self._step_size,
+                                           self._step_size, self._max_voltage)
 
     def update(self):
         '''
@@ -153,8 +227,9 @@ class CellMembrane:
 
 
 class Cell:
-    def __init__(self, cell_definition, cell_membrane):
-        self.uuid = cell_definition.uuid
+    def __init__(self, cell_definition, cell_membrane, index):
+        self._cell_definition = cell_definition
+        self.index = index
         self.label = cell_definition.label
         self.layer_id = cell_definition.layer_id
         
@@ -178,7 +253,6 @@ class Cell:
         self.output_synapses = []
         self._target_input = 0.0
         
-        self._fire_history = []
         self._target_fire_rate_per_epoch = cell_definition.target_fire_rate_per_epoch
         self._input_balance = cell_definition.input_balance
         self._output_balance = cell_definition.output_balance
@@ -189,6 +263,20 @@ class Cell:
         self._input_balance_scalar = 1.0
         self.synapses_to_update = {}
 
+        # fires in each of the last _fire_history_length epochs as a ring buffer
+        self._fire_counts = [0] * self._fire_history_length
+        self._fire_count_index = 0
+        self._recent_fires = 0
+
+        # dormant cells are skipped by the model's updates until they get input, see
+        # SimpleModel._update_awake_cells
+        self.dormant = False
+        self._updated_step = -1
+
+    @property
+    def uuid(self):
+        return self._cell_definition.get_uuid()
+
     def weight_totals(self):
         (positive_in, negative_in, positive_out, negative_out,) = (0.0, 0.0, 0.0, 0.0,)
         for synapse in self.input_synapses:
@@ -201,9 +289,9 @@ class Cell:
 
     def attach_synapses(self, synapses):
         for synapse in synapses:
-            if synapse.pre_cell.uuid == self.uuid:
+            if synapse.pre_cell is self:
                 self.output_synapses.append(synapse)
-            elif synapse.post_cell.uuid == self.uuid:
+            elif synapse.post_cell is self:
                 self.input_synapses.append(synapse)
             else:
                 raise Exception("Attempted to attach synapse to cell "\
@@ -243,12 +331,12 @@ class Cell:
             synapse.strength = (synapse.strength * change_factor) + (synapse.strength * keep_factor)
 
             # avoid expensive cap call
-            if synapse.strength >= synapse._max_strength:
-                synapse.strength = synapse._max_strength
-            elif synapse.strength < synapse._min_strength:
-                synapse.strength = synapse._min_strength
+            if synapse._strength >= synapse._max_strength:
+                synapse._strength = synapse._max_strength
+            elif synapse._strength < synapse._min_strength:
+                synapse._strength = synapse._min_strength
 
-            real_positive_input_strength += synapse.strength
+            real_positive_input_strength += synapse._strength
         return real_positive_input_strength
 
     def output_balance(self):
@@ -305,19 +393,11 @@ class Cell:
         if step == 0:
             return
 
-        new_fire_history = []
-        fires = 0
-        for fire_time in self._fire_history:
-            if fire_time > step  - (epoch_length * self._fire_history_length):
-                new_fire_history.append(fire_time)
-                fires += 1
-
+        fires = self._recent_fires
         if step > epoch_length * self._fire_history_length:
             running_fire_rate = fires / (epoch_length * self._fire_history_length)
         else:
             running_fire_rate = fires / step
-            
-        self._fire_history = new_fire_history
 
         if running_fire_rate > target_fire_rate:
             rate_based_down_scale_factor = target_fire_rate/running_fire_rate
@@ -400,25 +480,58 @@ class Cell:
     def receive_fire(self, strength):
         self._cell_membrane.receive_input(strength)
 
+    def advance_fire_counts(self):
+        self._fire_count_index = (self._fire_count_index + 1) % self._fire_history_length
+        self._recent_fires -= self._fire_counts[self._fire_count_index]
+        self._fire_counts[self._fire_count_index] = 0
+
     def apply_fire(self, step):
-        self._fire_history.append(step)
+        self._fire_counts[self._fire_count_index] += 1
+        self._recent_fires += 1
         for synapse in self.output_synapses:
             synapse.pre_fire(step)
             #this could be improved
-            if synapse._s_tag != 0:
-                self.synapses_to_update[synapse.label] = synapse
+            if synapse._s_tag != 0 and synapse not in self.synapses_to_update:
+                self.synapses_to_update[synapse] = synapse
+                synapse.queue(step)
 
         for synapse in self.input_synapses:
             synapse.post_fire(step)
             #this could be improved
-            if synapse._s_tag != 0:
-                self.synapses_to_update[synapse.label] = synapse
+            if synapse._s_tag != 0 and synapse not in self.synapses_to_update:
+                self.synapses_to_update[synapse] = synapse
+                synapse.queue(step)
   
     def warp(self, time_steps):
         self._cell_membrane.warp(time_steps)
+        self._updated_step += time_steps
+
+    def catch_up(self, step):
+        '''
+        Brings a cell that has not been updated since an earlier step up to the end of step
+        in one go. Only exact for cells that would not have fired in between.
+        '''
+        time_steps = step - self._updated_step
+        if time_steps <= 0:
+            return
+        self.warp(time_steps)
+        self.fire_trace = max(self.fire_trace - time_steps, 0)
+
+    def can_sleep(self):
+        '''
+        Cells that did not just fire and will not fire without more input can stop being
+        updated each step.
+        '''
+        if self._cell_membrane.fired or self._cell_membrane.active:
+            return False
+        return self.steps_until_fire() is None
+
+    def steps_until_fire(self):
+        return self._cell_membrane.steps_until_fire()
 
     def update(self, step, stimuli=None):
         self._cell_membrane.update()
+        self._updated_step = step
 
     def active(self):
         return self._cell_membrane.active
@@ -476,14 +589,20 @@ class SimpleModel:
         self._dopamine = model_parameters.starting_dopamine
         self._dopamine_decay = model_parameters.dopamine_decay
         self._step_size = model_parameters.step_size
+        self._dopamine_history = DopamineHistory(self._dopamine_decay, self._step_size)
         self._cells, self.synapses = self._build_network(
             model_parameters.cell_type_parameters,
             model_parameters.synapse_type_parameters,
             network_definition,
-            self._step_size)
+            self._step_size,
+            self._dopamine_history)
         self._warping = False
         self._last_active = 0
-        self._warp_timer = 0
+        self._warp_until = 0
+
+        # cells updated every step in index order, the rest are dormant
+        self._awake_cells = list(self._cells)
+        self._woken_cells = []
 
         self.epoch_length = model_parameters.epoch_length
         self._epoch_delay = model_parameters.epoch_delay
@@ -495,6 +614,7 @@ class SimpleModel:
                 self.rewarded_synapses.append(synapse)
 
         self.cells_by_input_position = self._cells_by_input_position()
+        self._input_mapping = InputMapping(network_definition.cell_definitions)
 
     def _cells_by_input_position(self):
         cells_by_input_position = defaultdict(lambda: defaultdict(list))
@@ -503,46 +623,122 @@ class SimpleModel:
                 cells_by_input_position[cell._x_input_position][cell._y_input_position].append(cell)
         return cells_by_input_position
 
-    def _apply_stimuli(self, stimuli):
+    def _apply_stimuli(self, step, stimuli):
         if stimuli is None:
             return
-        
+
+        # stimuli come before this step's update so cells are woken up to the previous step
+        if isinstance(stimuli, ArrayStimuli):
+            cell_indexes, currents = self._input_mapping.resolve(stimuli)
+            for cell_index, current in zip(cell_indexes.tolist(), currents.tolist()):
+                cell = self._cells[cell_index]
+                self._wake(cell, step - 1)
+                cell._cell_membrane.receive_input(current)
+            return
+
         for stimulus in stimuli:
             x_input_position = stimulus[0]
             y_input_position = stimulus[1]
             outside_current = stimulus[2]
             cells = self.cells_by_input_position[x_input_position][y_input_position]
             for cell in cells:
+                self._wake(cell, step - 1)
                 cell._cell_membrane.receive_input(outside_current)
 
+    def _wake(self, cell, step):
+        cell.catch_up(step)
+        if cell.dormant:
+            cell.dormant = False
+            self._woken_cells.append(cell)
+
+    def _catch_up_dormant_cells(self, step):
+        for cell in self._cells:
+            if cell.dormant:
+                cell.catch_up(step)
+
+    def _update_awake_cells(self, step):
+        '''
+        Most cells sit near rest for most of an epoch. Only awake cells are updated. A cell
+        goes dormant once it will not fire without more input and is woken when it gets
+        input, catching up on the steps it missed in closed form. Anything reading a dormant
+        cell catches it up first. Unlike warping this helps while part of the network is
+        busy.
+
+        Returns the output ids of cells that fired.
+        '''
+        if self._woken_cells:
+            self._awake_cells = sorted(self._awake_cells + self._woken_cells,
+                                       key=lambda cell: cell.index)
+            self._woken_cells = []
+
+        for cell in self._awake_cells:
+            cell.update(step)
+
+        output_ids = []
+        for cell in self._awake_cells:
+            if cell.fired():
+                cell.fire_trace = 100
+                cell.apply_fire(step)
+                for synapse in cell.output_synapses:
+                    self._wake(synapse.post_cell, step)
+                if cell.is_output_cell:
+                    output_ids.append(cell.output_id)
+            else:
+                if cell.fire_trace > 0:
+                    cell.fire_trace -= 1
+
+        awake_cells = []
+        for cell in self._awake_cells:
+            if cell.can_sleep():
+                cell.dormant = True
+            else:
+                awake_cells.append(cell)
+        self._awake_cells = awake_cells
+        return output_ids
+
     def _maybe_start_warp(self, step, active_environment, warp_allowed):
+        '''
+        Warping skips updating cells until the next step a cell is predicted to fire. Cells
+        are brought up to date exactly when the warp ends. Warping waits until dopamine has
+        decayed away and no synapse is waiting on reward.
+        '''
         if not warp_allowed:
             return
-        
-        active = False
+
+        if active_environment or self._dopamine > 0.0001:
+            return
+
         for cell in self._cells:
-            if cell.active() or len(cell.synapses_to_update) > 0:
-                active = True
-                    
-        if self._dopamine > 0.0001:
-            active = True
+            if len(cell.synapses_to_update) > 0:
+                return
 
-        if active_environment:
-            active = True
+        self._catch_up_dormant_cells(step - 1)
+        warp_until = None
+        for cell in self._cells:
+            steps_until_fire = cell.steps_until_fire()
+            if steps_until_fire is None:
+                continue
+            if steps_until_fire == 0:
+                return
+            if warp_until is None or step + steps_until_fire < warp_until:
+                warp_until = step + steps_until_fire
 
-        if active:
-            self._warp_timer = 0
-            return
+        self._warping = True
+        self._warp_until = warp_until
 
-        self._warp_timer += 1
-        if self._warp_timer >= 10:
-            self._warping = True
-            self._warp_timer = 0
+    def _settle_synapses(self, step):
+        for cell in self._cells:
+            for synapse in cell.synapses_to_update.values():
+                synapse.settle(step)
 
     def _epoch_updates(self, step):
+        # this step's reward updates would have come after the epoch updates
+        self._settle_synapses(step - 1)
+
         # bad hack(means messing with input delays breaks things
         for synapse in self.synapses:
             synapse._s_tag = 0.0
+            synapse._times_queued = 0
 
         for cell in self._cells:
             cell.output_balance()
@@ -561,68 +757,159 @@ class SimpleModel:
         if real_step % self.epoch_length == 0:
             self._epoch_updates(step)
 
+        # fires on the step of the epoch updates still count towards the epoch just balanced
+        if (real_step - 1) % self.epoch_length == 0:
+            for cell in self._cells:
+                cell.advance_fire_counts()
+
         if self._warping:
-            if not active_environment and self._dopamine <= 0.0001 and warp_allowed:
+            next_fire = self._warp_until is not None and step >= self._warp_until
+            if not active_environment and self._dopamine <= 0.0001 and warp_allowed \
+               and not next_fire:
                 # continue warping
                 return
 
-            #come out of warp
+            #come out of warp, cells are brought up to the end of the previous step
             for cell in self._cells:
-                cell.warp(step - self._last_active)
+                cell.catch_up(step - 1)
             self._warping = False
         else:
             self._maybe_start_warp(step, active_environment, warp_allowed)
             if self._warping:
                 return
             
-        #if self._dopamine > 0.0001:
-        # for synapse in self.rewarded_synapses:
-        #     synapse.update(self._dopamine)
-        for cell in self._cells:
-            for synapse in cell.synapses_to_update.values():
-                synapse.update(step, self._dopamine)
-        
+        # synapses waiting on reward are updated lazily when next used, see Synapse.settle
         self._last_active = step
-        self._apply_stimuli(stimuli)
-        for cell in self._cells:
-            cell.update(step)
+        self._apply_stimuli(step, stimuli)
+        return self._update_awake_cells(step)
 
-        output_ids = []
-        for cell in self._cells:
-            if cell.fired():
-                cell.fire_trace = 100
-                cell.apply_fire(step)
-                if cell.is_output_cell:
-                    output_ids.append(cell.output_id)
-            else:
-                if cell.fire_trace > 0:
-                    cell.fire_trace -= 1
+    def run_steps(self, step, number_of_steps, schedule, warp_allowed=False):
+        '''
+        Steps through a StepSchedule in one call, see schedule.run_steps.
+        '''
+        return step_schedule.run_steps(self, step, number_of_steps, schedule, warp_allowed)
 
-        return output_ids
+    def run_epoch(self, step, schedule, warp_allowed=False):
+        return self.run_steps(step, self.epoch_length, schedule, warp_allowed)
 
     def update_dopamine(self, step, has_reward):
         self._dopamine = decay(self._dopamine, self._dopamine_decay, self._step_size)
         if has_reward:
+            # the dopamine history only covers steps since the last reward
+            self._settle_synapses(step - 1)
             self._dopamine = 1
+        self._dopamine_history.record(step, self._dopamine, has_reward)
 
-    def export(self):
+    def export_network_definition(self):
+        '''
+        The network definition with synapse strengths as they are now.
+        '''
         updated_synapse_definitions = []
         for synapse in self.synapses:
             definition = SynapseDefinition(
-                synapse.label,
-                synapse.pre_cell.uuid,
-                synapse.post_cell.uuid,
+                synapse.pre_cell.index,
+                synapse.post_cell.index,
                 synapse.strength,
-                synapse.inhibitory_strength)
+                synapse.inhibitory_strength,
+                label=synapse._label)
             updated_synapse_definitions.append(definition)
         
-        updated_network_definition = NetworkDefinition(
+        return NetworkDefinition(
             self.network_definition.cell_definitions,
             updated_synapse_definitions)
-                                                               
+
+    def checkpoint_state(self):
+        '''
+        Everything that changes as the model runs as a dict of JSON values and a dict of
+        arrays, see brains.checkpoint. Unlike exporting nothing is settled. Noise comes from
+        random which brains.checkpoint saves itself.
+        '''
+        state = {"dopamine": self._dopamine,
+                 "dopamine_history": self._dopamine_history.checkpoint_state(),
+                 "warping": self._warping,
+                 "last_active": self._last_active,
+                 "warp_until": self._warp_until}
+
+        membranes = [cell._cell_membrane for cell in self._cells]
+        arrays = {"voltage": np.array([membrane._voltage for membrane in membranes]),
+                  "input_current": np.array([membrane._input_current
+                                             for membrane in membranes]),
+                  "calcium": np.array([membrane._calcium for membrane in membranes]),
+                  "fired": np.array([membrane.fired for membrane in membranes], dtype=bool),
+                  "active": np.array([membrane.active for membrane in membranes], dtype=bool),
+                  "fire_trace": np.array([cell.fire_trace for cell in self._cells],
+                                         dtype=np.int64),
+                  "target_input": np.array([cell._target_input for cell in self._cells]),
+                  "fire_counts": np.array([cell._fire_counts for cell in self._cells],
+                                          dtype=np.int64).reshape(len(self._cells), -1),
+                  "fire_count_index": np.array([cell._fire_count_index
+                                                for cell in self._cells], dtype=np.int64),
+                  "recent_fires": np.array([cell._recent_fires for cell in self._cells],
+                                           dtype=np.int64),
+                  "dormant": np.array([cell.dormant for cell in self._cells], dtype=bool),
+                  "updated_step": np.array([cell._updated_step for cell in self._cells],
+                                           dtype=np.int64),
+                  "strength": np.array([synapse._strength for synapse in self.synapses]),
+                  "inhibitory_strength": np.array([synapse.inhibitory_strength
+                                                   for synapse in self.synapses]),
+                  "s_tag": np.array([synapse._s_tag for synapse in self.synapses]),
+                  "last_stag_decay": np.array([synapse._last_stag_decay
+                                               for synapse in self.synapses], dtype=np.int64),
+                  "times_queued": np.array([synapse._times_queued
+                                            for synapse in self.synapses], dtype=np.int64)}
+
+        # each cell's synapses waiting on reward as (cell index, synapse index) pairs
+        synapse_indexes = {synapse: index for index, synapse in enumerate(self.synapses)}
+        queued = [(cell.index, synapse_indexes[synapse])
+                  for cell in self._cells for synapse in cell.synapses_to_update]
+        arrays["synapses_to_update"] = np.array(queued, dtype=np.int64).reshape(-1, 2)
+        return state, arrays
+
+    def restore_state(self, state, arrays):
+        self._dopamine = state["dopamine"]
+        self._dopamine_history.restore_state(state["dopamine_history"])
+        self._warping = state["warping"]
+        self._last_active = state["last_active"]
+        self._warp_until = state["warp_until"]
+
+        for index, cell in enumerate(self._cells):
+            membrane = cell._cell_membrane
+            membrane._voltage = float(arrays["voltage"][index])
+            membrane._input_current = float(arrays["input_current"][index])
+            membrane._calcium = float(arrays["calcium"][index])
+            membrane.fired = bool(arrays["fired"][index])
+            membrane.active = bool(arrays["active"][index])
+            cell.fire_trace = int(arrays["fire_trace"][index])
+            cell._target_input = float(arrays["target_input"][index])
+            cell._fire_counts = arrays["fire_counts"][index].tolist()
+            cell._fire_count_index = int(arrays["fire_count_index"][index])
+            cell._recent_fires = int(arrays["recent_fires"][index])
+            cell.dormant = bool(arrays["dormant"][index])
+            cell._updated_step = int(arrays["updated_step"][index])
+            cell.synapses_to_update = {}
+
+        for index, synapse in enumerate(self.synapses):
+            synapse._strength = float(arrays["strength"][index])
+            synapse.inhibitory_strength = float(arrays["inhibitory_strength"][index])
+            synapse._s_tag = float(arrays["s_tag"][index])
+            synapse._last_stag_decay = int(arrays["last_stag_decay"][index])
+            synapse._times_queued = int(arrays["times_queued"][index])
+
+        for cell_index, synapse_index in arrays["synapses_to_update"].tolist():
+            synapse = self.synapses[synapse_index]
+            self._cells[cell_index].synapses_to_update[synapse] = synapse
+
+        # cells woken since the last update join the awake ones early, they would have been
+        # merged in before the next update anyway
+        self._awake_cells = [cell for cell in self._cells if not cell.dormant]
+        self._woken_cells = []
+
+    def export(self):
+        updated_network_definition = self.export_network_definition()
+        updated_network_definition.assign_uuids()
         blob = {"model_parameters": dataclasses.asdict(self.model_parameters),
                 "network_definition": dataclasses.asdict(updated_network_definition),
-                "version": "1"
+                "version": "2"
                 }
         return blob
 
@@ -630,6 +917,7 @@ class SimpleModel:
         '''
         Used by pygame
         '''
+        self._catch_up_dormant_cells(self._last_active)
         texts = ["dopamine: " + str(round(self._dopamine, 5))]
         drawables = []
         for cell in self._cells:
@@ -664,13 +952,14 @@ class SimpleModel:
             # Print information for one cell in the middle layer and one cell in the output layer.
             if (cell.layer_id == 'b' or cell.layer_id == 'c') and cell.output_id == 0:
                 texts.append(f"layer_id {cell.layer_id} " \
-                    f"running_rate {len(cell._fire_history) / cell._fire_history_length} " \
+                    f"running_rate {cell._recent_fires / cell._fire_history_length} " \
                     f"target_rate {cell._target_fire_rate_per_epoch} " \
-                    f"fires {len(cell._fire_history)} " \
+                    f"fires {cell._recent_fires} " \
                     f"target_input {cell._target_input}")
         return texts
 
     def test_outputs(self):
+        self._catch_up_dormant_cells(self._last_active)
         outputs = {}
         for cell in self._cells:
             outputs[cell.label] = cell.membrane_voltage()
@@ -712,30 +1001,29 @@ class SimpleModel:
     def _build_network(self, cell_type_parameters,
                        synapse_type_parameters,
                        network_definition,
-                       step_size):
-        cells_by_id = {}
+                       step_size,
+                       dopamine_history):
         cells = []
-        for cell_definition in network_definition.cell_definitions:
+        for index, cell_definition in enumerate(network_definition.cell_definitions):
             cell_membrane = CellMembrane(cell_type_parameters, step_size)
-            cell = Cell(cell_definition, cell_membrane)
-            cells_by_id[cell.uuid] = cell
+            cell = Cell(cell_definition, cell_membrane, index)
             cells.append(cell)
 
         synapses = []
-        synapses_by_cell_id = defaultdict(list)
+        synapses_by_cell_index = defaultdict(list)
         for synapse_definition in network_definition.synapse_definitions:
-            pre_cell = cells_by_id[synapse_definition.pre_cell_id]
-            post_cell = cells_by_id[synapse_definition.post_cell_id]
+            pre_cell = cells[synapse_definition.pre_cell_index]
+            post_cell = cells[synapse_definition.post_cell_index]
             synapse = Synapse(pre_cell, post_cell,
                               synapse_definition,
                               step_size,
-                              synapse_type_parameters)
+                              synapse_type_parameters,
+                              dopamine_history)
             synapses.append(synapse)
-            synapses_by_cell_id[synapse_definition.pre_cell_id].append(synapse)
-            synapses_by_cell_id[synapse_definition.post_cell_id].append(synapse)
+            synapses_by_cell_index[synapse_definition.pre_cell_index].append(synapse)
+            synapses_by_cell_index[synapse_definition.post_cell_index].append(synapse)
 
-        for cell_id, cell_synapses in synapses_by_cell_id.items():
-            cell = cells_by_id[cell_id]
-            cell.attach_synapses(cell_synapses)
+        for cell_index, cell_synapses in synapses_by_cell_index.items():
+            cells[cell_index].attach_synapses(cell_synapses)
 
         return cells, synapses
@@ -1,7 +1,9 @@
 import brains.models.integrate_model as simple_model
+import brains.models.numpy_model as numpy_model
 import brains.models.simple_model_builder as simple_model_builder
 from brains.environment.base import FakeEnvironment
 from brains.environment.stdp import STDPTestEnvironment
+from brains.environment.parameter import ParameterTestEnvironment
 import brains.network as network
 import brains.network_definitions as network_definitions
 from brains.network import CellType, CellDefinition
@@ -42,6 +44,47 @@ class TestCellMembrane(unittest.TestCase):
         membrane.update()
         self.assertFalse(membrane.fired)
 
+    def test_warp_matches_updates(self):
+        '''
+        Warping should give the same membrane as updating step by step while nothing fires.
+        '''
+        cell_type_parameters = simple_model_builder.CellTypeParameters(starting_membrane_voltage=0.2)
+        step_size = 1
+        updated_membrane = simple_model.CellMembrane(cell_type_parameters, step_size)
+        warped_membrane = simple_model.CellMembrane(cell_type_parameters, step_size)
+        updated_membrane.receive_input(0.01)
+        warped_membrane.receive_input(0.01)
+        for _ in range(37):
+            updated_membrane.update()
+            self.assertFalse(updated_membrane.fired)
+        warped_membrane.warp(37)
+        self.assertAlmostEqual(updated_membrane.voltage(), warped_membrane.voltage(), places=12)
+        self.assertAlmostEqual(updated_membrane.input_current(), warped_membrane.input_current(),
+                               places=12)
+        self.assertAlmostEqual(updated_membrane.calcium(), warped_membrane.calcium(), places=12)
+
+    def test_steps_until_fire(self):
+        '''
+        Prediction should point at exactly the update where the cell fires.
+        '''
+        cell_type_parameters = simple_model_builder.CellTypeParameters()
+        step_size = 1
+        membrane = simple_model.CellMembrane(cell_type_parameters, step_size)
+        self.assertIsNone(membrane.steps_until_fire())
+        membrane.receive_input(0.1)
+        steps_until_fire = membrane.steps_until_fire()
+        self.assertIsNotNone(steps_until_fire)
+        for _ in range(steps_until_fire):
+            membrane.update()
+            self.assertFalse(membrane.fired)
+        self.assertEqual(membrane.steps_until_fire(), 0)
+        membrane.update()
+        self.assertTrue(membrane.fired)
+
+        membrane = simple_model.CellMembrane(cell_type_parameters, step_size)
+        membrane.receive_input(0.01)
+        self.assertIsNone(membrane.steps_until_fire())
+
 class TestModel(unittest.TestCase):
     def two_cell_network(self, starting_synapse_strength):
 
@@ -267,6 +310,59 @@ class TestModel(unittest.TestCase):
 
         self.assertTrue(synapse_late_input.strength > synapse_early_input.strength)
 
+    def test_warp_matches_no_warp(self):
+        '''
+        Warping through quiet steps should leave the model exactly where stepping would.
+        '''
+        outputs_by_warp = {}
+        for warp_allowed in [False, True]:
+            model_parameters = simple_model_builder.ModelParameters(starting_dopamine=0.0)
+            network_definition = network_definitions.parameter_test_network()
+            model = simple_model.SimpleModel(network_definition, model_parameters)
+            test_environment = ParameterTestEnvironment()
+            outputs = []
+            warped_steps = 0
+            for i in range(1300):
+                model.step(i, test_environment.stimuli(i), test_environment.has_reward(),
+                           test_environment.active(i), warp_allowed=warp_allowed)
+                if model._warping:
+                    warped_steps += 1
+                if test_environment.active(i):
+                    outputs.append(model.test_outputs())
+            outputs_by_warp[warp_allowed] = outputs
+            if warp_allowed:
+                self.assertGreater(warped_steps, 1000)
+
+        for outputs, warped_outputs in zip(outputs_by_warp[False], outputs_by_warp[True]):
+            for label, value in outputs.items():
+                self.assertAlmostEqual(value, warped_outputs[label], places=9)
+
+    def test_dormant_cells_match_every_step_update(self):
+        '''
+        Cells that go dormant should read the same as the numpy model's cells, which are
+        updated every step. Every cell in the stdp network fires so cells are woken by
+        stimuli and by fires.
+        '''
+        model_parameters = simple_model_builder.ModelParameters()
+        network_definition = network_definitions.stdp_test_network()
+        model = simple_model.SimpleModel(network_definition, model_parameters)
+        every_step_model = numpy_model.SimpleModel(network_definition, model_parameters)
+        test_environment = STDPTestEnvironment()
+        dormant_steps = 0
+        for i in range(2000):
+            stimuli = test_environment.stimuli(i)
+            active = test_environment.active(i)
+            output_ids = model.step(i, stimuli, False, active)
+            self.assertEqual(output_ids, every_step_model.step(i, stimuli, False, active))
+            if len(model._awake_cells) < len(model._cells):
+                dormant_steps += 1
+            if i % 50 == 0:
+                outputs = model.test_outputs()
+                for label, value in every_step_model.test_outputs().items():
+                    self.assertAlmostEqual(value, outputs[label], places=9)
+        self.assertGreater(dormant_steps, 1000)
+        self.assertTrue(all(sum(cell._fire_counts) > 0 for cell in model._cells))
+
     def test_unchanged_export_import(self):
         '''
         Export a model and reimport it. Spot check some synapses to make sure they are the same.
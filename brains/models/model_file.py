@@ -0,0 +1,128 @@
+from brains.network import NetworkDefinition, SynapseArrays
+from brains.models.simple_model_builder import ModelParameters
+
+import dataclasses
+import json
+import numpy as np
+
+# Binary model files. JSON exports spend most of their size and load time on synapse
+# definitions, each a dict repeating every field name. Here synapses are stored as columns.
+#
+# layout
+#   MAGIC
+#   header length as 8 little endian bytes
+#   JSON header: version, model parameters, cell definitions and where each column is
+#   column arrays, the first starting on the ALIGNMENT byte boundary after the header and
+#   each of the rest on the next boundary after the one before
+#
+# Columns are loaded with np.memmap so only the parts that are read come off disk.
+
+MAGIC = b"BRAINS\x00\x01"
+VERSION = 1
+ALIGNMENT = 64
+
+SYNAPSE_COLUMNS = [("pre_cell_index", "<i4"),
+                   ("post_cell_index", "<i4"),
+                   ("starting_strength", "<f8"),
+                   ("starting_inhibitory_strength", "<f8"),
+                   ("unsupervised_stdp", "|u1"),
+                   ("reward_scalar", "<f8"),
+                   ("s_tag_decay_rate", "<f8")]
+
+def is_model_file(file_path):
+    with open(file_path, "rb") as model_file:
+        return model_file.read(len(MAGIC)) == MAGIC
+
+def synapse_columns(network_definition):
+    '''
+    Column arrays for the synapses of a network definition. Synapse labels are only returned
+    when some synapse has its own label rather than the default pre_to_post one.
+    '''
+    synapse_arrays = network_definition.synapse_arrays()
+    columns = {name: getattr(synapse_arrays, name).astype(dtype, copy=False)
+               for name, dtype in SYNAPSE_COLUMNS}
+
+    labels = None
+    if synapse_arrays.labels:
+        labels = [synapse_arrays.labels.get(index) for index in range(len(synapse_arrays))]
+    return columns, labels
+
+def save(file_path, network_definition, model_parameters):
+    network_definition.assign_uuids()
+    columns, labels = synapse_columns(network_definition)
+    header = {"version": VERSION,
+              "model_parameters": dataclasses.asdict(model_parameters),
+              "cell_definitions": [dataclasses.asdict(cell)
+                                   for cell in network_definition.cell_definitions],
+              "synapse_labels": labels,
+              "number_of_synapses": len(columns["pre_cell_index"]),
+              "columns": []}
+
+    # offsets are from the start of the column data which follows the header
+    offset = 0
+    for name, dtype in SYNAPSE_COLUMNS:
+        header["columns"].append({"name": name, "dtype": dtype, "offset": offset})
+        offset = _align(offset + columns[name].nbytes)
+    encoded_header = json.dumps(header).encode("utf-8")
+    data_start = _align(len(MAGIC) + 8 + len(encoded_header))
+
+    with open(file_path, "wb") as model_file:
+        model_file.write(MAGIC)
+        model_file.write(len(encoded_header).to_bytes(8, "little"))
+        model_file.write(encoded_header)
+        for column in header["columns"]:
+            model_file.seek(data_start + column["offset"])
+            model_file.write(columns[column["name"]].tobytes())
+
+def load_columns(file_path):
+    '''
+    The header and a memory mapped array for each synapse column. Writes to the arrays are
+    copy on write and never reach the file.
+    '''
+    with open(file_path, "rb") as model_file:
+        if model_file.read(len(MAGIC)) != MAGIC:
+            raise Exception(f"{file_path} is not a binary model file")
+        header_length = int.from_bytes(model_file.read(8), "little")
+        header = json.loads(model_file.read(header_length).decode("utf-8"))
+
+    data_start = _align(len(MAGIC) + 8 + header_length)
+    if header["version"] != VERSION:
+        raise Exception(f"unsupported model file version {header['version']}")
+
+    columns = {}
+    for column in header["columns"]:
+        if header["number_of_synapses"] == 0:
+            # nothing was written to map
+            columns[column["name"]] = np.zeros(0, dtype=column["dtype"])
+            continue
+        columns[column["name"]] = np.memmap(file_path, dtype=column["dtype"], mode="c",
+                                            offset=data_start + column["offset"],
+                                            shape=(header["number_of_synapses"],))
+    return header, columns
+
+def load(file_path):
+    '''
+    NetworkDefinition and ModelParameters stored in a binary model file.
+    '''
+    header, columns = load_columns(file_path)
+    model_parameters = ModelParameters(**header["model_parameters"])
+    network_definition = columns_network_definition(header["cell_definitions"], columns,
+                                                    header["synapse_labels"])
+    return network_definition, model_parameters
+
+def columns_network_definition(cell_definitions, columns, labels):
+    '''
+    NetworkDefinition from cell definition dicts and the synapse columns and labels given by
+    synapse_columns.
+    '''
+    labels = labels or []
+    synapse_arrays = SynapseArrays(
+        columns["pre_cell_index"], columns["post_cell_index"],
+        columns["starting_strength"], columns["starting_inhibitory_strength"],
+        columns["unsupervised_stdp"].astype(bool), columns["reward_scalar"],
+        columns["s_tag_decay_rate"],
+        labels={index: label for index, label in enumerate(labels) if label is not None})
+    return NetworkDefinition(cell_definitions, synapse_arrays)
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
@@ -0,0 +1,68 @@
+import brains.models.model_file as model_file
+import brains.models.numpy_model as numpy_model
+import brains.models.simple_model_builder as simple_model_builder
+import brains.network_definitions as network_definitions
+from brains.network import network_from_cells, CellDefinition
+
+import dataclasses
+import os
+import tempfile
+import unittest
+
+
+class TestModelFile(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.file_path = tempfile.mkstemp()
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.file_path)
+
+    def test_round_trip(self):
+        network_definition = network_definitions.easy_layer_network()
+        network_definition.synapse_definitions[0].unsupervised_stdp = True
+        network_definition.synapse_definitions[1].reward_scalar = 0.3
+        model_parameters = simple_model_builder.handwriting_model_parameters()
+        model_parameters.synapse_type_parameters.max_strength = 0.4
+
+        model_file.save(self.file_path, network_definition, model_parameters)
+        self.assertTrue(model_file.is_model_file(self.file_path))
+        header, _ = model_file.load_columns(self.file_path)
+        self.assertIsNone(header["synapse_labels"])
+
+        new_network_definition, new_model_parameters = model_file.load(self.file_path)
+        self.assertEqual(dataclasses.asdict(new_network_definition.with_synapse_list()),
+                         dataclasses.asdict(network_definition.with_synapse_list()))
+        self.assertEqual(new_model_parameters, model_parameters)
+
+    def test_custom_labels(self):
+        cells = [CellDefinition("a", 0, 0), CellDefinition("b", 1, 0)]
+        network_definition = network_from_cells(cells, [("a", "b", 0.15)])
+        network_definition.synapse_definitions[0].label = "special"
+        model_parameters = simple_model_builder.ModelParameters()
+
+        model_file.save(self.file_path, network_definition, model_parameters)
+        new_network_definition, _ = model_file.load(self.file_path)
+        self.assertEqual(new_network_definition.synapse_definitions[0].label, "special")
+
+    def test_model_export_import(self):
+        model_parameters = simple_model_builder.ModelParameters()
+        network_definition = network_definitions.stdp_test_network()
+        old_model = numpy_model.SimpleModel(network_definition, model_parameters)
+        old_model.synapses[0].strength = 0.02
+
+        model_file.save(self.file_path, old_model.export_network_definition(),
+                        old_model.model_parameters)
+        new_model = numpy_model.SimpleModel(*model_file.load(self.file_path))
+        self.assertEqual(new_model.export(), old_model.export())
+
+    def test_not_model_file(self):
+        with open(self.file_path, "w") as json_file:
+            json_file.write("{}")
+        self.assertFalse(model_file.is_model_file(self.file_path))
+        with self.assertRaises(Exception):
+            model_file.load(self.file_path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,710 @@
+from brains.utils import decay, integrate_voltage, steps_until_voltages_exceed
+from brains.network import SynapseDefinition, NetworkDefinition, CellType
+from brains.stimuli import ArrayStimuli, InputMapping
+from brains.models.synapse_index import SynapseIndex
+from brains.models.dopamine import DopamineHistory
+from brains.models.fire_counts import FireCounts
+import brains.models.homeostasis as homeostasis
+import brains.models.schedule as step_schedule
+
+from collections import defaultdict
+import dataclasses
+import numpy as np
+import random
+
+# Same model as integrate_model but cell and synapse state is held in arrays indexed by
+# cell and synapse number. Cell and Synapse here are only views into those arrays so the
+# display, tests and export code can keep treating the model like the object based ones.
+
+# arrays saved by checkpoint_state, each held by the model with a leading underscore
+STATE_ARRAYS = ["voltage", "input_current", "calcium", "fired", "active", "fire_trace",
+                "strength", "inhibitory_strength", "s_tag", "last_stag_decay",
+                "pre_cell_synapses_to_update", "post_cell_synapses_to_update",
+                "target_input"]
+
+class Synapse:
+    def __init__(self, model, index):
+        self._model = model
+        self._index = index
+
+    @property
+    def label(self):
+        if self._index in self._model._synapse_labels:
+            return self._model._synapse_labels[self._index]
+        return f"{self.pre_cell.label}_to_{self.post_cell.label}"
+
+    @property
+    def pre_cell(self):
+        return self._model._cells[self._model._pre_cell_indexes[self._index]]
+
+    @property
+    def post_cell(self):
+        return self._model._cells[self._model._post_cell_indexes[self._index]]
+
+    @property
+    def strength(self):
+        self._model._settle_synapses(np.array([self._index]))
+        return float(self._model._strength[self._index])
+
+    @strength.setter
+    def strength(self, value):
+        self._model._settle_synapses(np.array([self._index]))
+        self._model._strength[self._index] = value
+
+    @property
+    def inhibitory_strength(self):
+        return float(self._model._inhibitory_strength[self._index])
+
+    @inhibitory_strength.setter
+    def inhibitory_strength(self, value):
+        self._model._inhibitory_strength[self._index] = value
+
+    def cap(self):
+        self._model._cap_synapses(self._index)
+
+class Synapses:
+    '''
+    List like access to synapse views. Views are created on demand so large networks do
+    not pay for one python object per synapse.
+    '''
+    def __init__(self, model):
+        self._model = model
+
+    def __len__(self):
+        return len(self._model._strength)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("synapse index out of range")
+        return Synapse(self._model, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield Synapse(self._model, index)
+
+class Cell:
+    def __init__(self, cell_definition, model, index):
+        self._cell_definition = cell_definition
+        self.label = cell_definition.label
+        self.layer_id = cell_definition.layer_id
+        self._model = model
+        self.index = index
+
+        self.x_display_position = cell_definition.x_display_position
+        self.y_display_position = cell_definition.y_display_position
+        self.x_layer_position = cell_definition.x_layer_position
+        self.y_layer_position = cell_definition.y_layer_position
+        self._is_input_cell = cell_definition.is_input_cell
+        self._x_input_position = cell_definition.x_input_position
+        self._y_input_position = cell_definition.y_input_position
+        self.is_output_cell = cell_definition.is_output_cell
+        self.output_id = cell_definition.output_id
+        self.cell_type = cell_definition.cell_type
+
+        self._target_fire_rate_per_epoch = cell_definition.target_fire_rate_per_epoch
+        self._fire_history_length = model._fire_history_length
+
+    @property
+    def uuid(self):
+        return self._cell_definition.get_uuid()
+
+    @property
+    def fire_trace(self):
+        return int(self._model._fire_trace[self.index])
+
+    @property
+    def _target_input(self):
+        return float(self._model._target_input[self.index])
+
+    @property
+    def _recent_fires(self):
+        return int(self._model._fire_counts.recent_fires[self.index])
+
+    @property
+    def input_synapses(self):
+        return [Synapse(self._model, index)
+                for index in self._model._incoming.synapses(self.index)]
+
+    @property
+    def output_synapses(self):
+        return [Synapse(self._model, index)
+                for index in self._model._outgoing.synapses(self.index)]
+
+    def weight_totals(self):
+        input_indexes = self._model._incoming.synapses(self.index)
+        output_indexes = self._model._outgoing.synapses(self.index)
+        self._model._settle_synapses(input_indexes)
+        self._model._settle_synapses(output_indexes)
+        positive_in = float(self._model._strength[input_indexes].sum())
+        negative_in = float(self._model._inhibitory_strength[input_indexes].sum())
+        positive_out = float(self._model._strength[output_indexes].sum())
+        negative_out = float(self._model._inhibitory_strength[output_indexes].sum())
+        return positive_in, negative_in, positive_out, negative_out
+
+    def membrane_voltage(self):
+        return float(self._model._voltage[self.index])
+
+    def calcium(self):
+        return float(self._model._calcium[self.index])
+
+    def input_current(self):
+        return float(self._model._input_current[self.index])
+
+    def fired(self):
+        return bool(self._model._fired[self.index])
+
+    def drawable_synapses(self):
+        drawables = []
+        for synapse in self.input_synapses:
+            if synapse.pre_cell.cell_type == CellType.EXCITATORY:
+                strength_text = str(round(synapse.strength, 5))
+                drawable = {"text": strength_text,
+                            "x": synapse.pre_cell.x_layer_position,
+                            "y": synapse.pre_cell.y_layer_position,
+                            "matrix_label": "in_excite"}
+                drawables.append(drawable)
+            elif synapse.pre_cell.cell_type == CellType.INHIBITORY:
+                strength_text = str(round(synapse.inhibitory_strength, 5))
+                drawable = {"text": strength_text,
+                            "x": synapse.pre_cell.x_layer_position,
+                            "y": synapse.pre_cell.y_layer_position,
+                            "matrix_label": "in_inhibit"}
+                drawables.append(drawable)
+        for synapse in self.output_synapses:
+            strength_text = str(round(synapse.strength, 5))
+            drawable = {"text": strength_text,
+                        "x": synapse.post_cell.x_layer_position,
+                        "y": synapse.post_cell.y_layer_position,
+                        "matrix_label": "out_excite"}
+            drawables.append(drawable)
+            if synapse.inhibitory_strength > 0.0:
+                strength_text = str(round(synapse.inhibitory_strength, 5))
+                drawable = {"text": strength_text,
+                            "x": synapse.post_cell.x_layer_position,
+                            "y": synapse.post_cell.y_layer_position,
+                            "matrix_label": "out_inhibit"}
+                drawables.append(drawable)
+        return drawables
+
+class SimpleModel:
+    def __init__(self, network_definition, model_parameters):
+        self.name = "Simple Model"
+        self.network_definition = network_definition
+        self.model_parameters = model_parameters
+        self._dopamine = model_parameters.starting_dopamine
+        self._dopamine_decay = model_parameters.dopamine_decay
+        self._step_size = model_parameters.step_size
+        self._dopamine_history = DopamineHistory(self._dopamine_decay, self._step_size)
+
+        cell_type_parameters = model_parameters.cell_type_parameters
+        self._voltage_factor = (1 - cell_type_parameters.voltage_decay)**self._step_size
+        self._current_factor = (1 - cell_type_parameters.current_decay)**self._step_size
+        self._calcium_factor = (1 - cell_type_parameters.calcium_decay)**self._step_size
+        self._voltage_decay = cell_type_parameters.voltage_decay
+        self._current_decay = cell_type_parameters.current_decay
+        self._calcium_decay = cell_type_parameters.calcium_decay
+        self._max_voltage = cell_type_parameters.max_voltage
+        self._voltage_reset = cell_type_parameters.voltage_reset
+        self._calcium_increment = cell_type_parameters.calcium_increment
+        self._input_current_reset = cell_type_parameters.input_current_reset
+        self._reset_input_current = cell_type_parameters.reset_input_current
+
+        synapse_type_parameters = model_parameters.synapse_type_parameters
+        self._stdp_scalar = synapse_type_parameters.stdp_scalar
+        self._max_strength = synapse_type_parameters.max_strength
+        self._min_strength = synapse_type_parameters.min_strength
+        self._noise_factor = synapse_type_parameters.noise_factor
+        # seeded from random so random.seed makes runs repeatable like the python model
+        self._random = np.random.default_rng(random.getrandbits(64))
+
+        self._fire_rate_balance_scalar = 0.01
+        self._fire_history_length = 20
+        self._input_balance_scalar = 1.0
+
+        self._build_network(cell_type_parameters,
+                            synapse_type_parameters,
+                            network_definition)
+        self.synapses = Synapses(self)
+        self._warping = False
+        self._last_active = 0
+        self._warp_until = 0
+
+        self.epoch_length = model_parameters.epoch_length
+        self._epoch_delay = model_parameters.epoch_delay
+        self.cell_indexes_by_input_position = self._cell_indexes_by_input_position()
+        self._input_mapping = InputMapping(network_definition.cell_definitions)
+
+    def _cell_indexes_by_input_position(self):
+        cell_indexes_by_input_position = defaultdict(lambda: defaultdict(list))
+        for cell in self._cells:
+            if cell._is_input_cell:
+                x_input_position = cell._x_input_position
+                y_input_position = cell._y_input_position
+                cell_indexes_by_input_position[x_input_position][y_input_position].append(
+                    cell.index)
+        return cell_indexes_by_input_position
+
+    def _apply_stimuli(self, stimuli):
+        if stimuli is None:
+            return
+
+        if isinstance(stimuli, ArrayStimuli):
+            cell_indexes, currents = self._input_mapping.resolve(stimuli)
+            np.add.at(self._input_current, cell_indexes, currents)
+            return
+
+        for stimulus in stimuli:
+            x_input_position = stimulus[0]
+            y_input_position = stimulus[1]
+            outside_current = stimulus[2]
+            indexes = self.cell_indexes_by_input_position[x_input_position][y_input_position]
+            self._input_current[indexes] += outside_current
+
+    def _maybe_start_warp(self, step, active_environment, warp_allowed):
+        '''
+        See integrate_model.SimpleModel._maybe_start_warp
+        '''
+        if not warp_allowed:
+            return
+
+        if active_environment or self._dopamine > 0.0001:
+            return
+
+        if self._pre_cell_synapses_to_update.any() or self._post_cell_synapses_to_update.any():
+            return
+
+        steps_until_fire = self._steps_until_fire()
+        soonest = steps_until_fire.min() if len(steps_until_fire) > 0 else np.inf
+        if soonest == 0:
+            return
+
+        self._warping = True
+        self._warp_until = None if np.isinf(soonest) else step + int(soonest)
+
+    def _warp(self, time_steps):
+        '''
+        Same as time_steps cell updates where no cell fires.
+        '''
+        self._active[:] = True
+        self._fired[:] = False
+        self._voltage = integrate_voltage(self._voltage, self._input_current,
+                                          self._voltage_factor, self._current_factor,
+                                          self._step_size, time_steps)
+        self._input_current *= self._current_factor**time_steps
+        self._calcium *= self._calcium_factor**time_steps
+
+    def _steps_until_fire(self):
+        '''
+        Vectorized CellMembrane.steps_until_fire. Cells that will not fire without more input
+        get inf.
+        '''
+        return steps_until_voltages_exceed(self._voltage, self._input_current,
+                                           self._voltage_factor, self._current_factor,
+                                           self._step_size, self._max_voltage)
+
+    def _epoch_updates(self, step):
+        # this step's reward updates would have come after the epoch updates
+        self._settle_synapses(step=step - 1)
+
+        # bad hack(means messing with input delays breaks things
+        self._s_tag[:] = 0.0
+        self._pre_cell_synapses_to_update[:] = False
+        self._post_cell_synapses_to_update[:] = False
+
+        self._output_balance()
+        self._fire_rate_balance(step)
+
+    def step(self, step, stimuli, has_reward, active_environment, warp_allowed=False):
+        self._update_dopamine(step, has_reward)
+
+        # We need a seperate epoch variable for the model
+        real_step = step - self._epoch_delay
+        if real_step % self.epoch_length == 0:
+            self._epoch_updates(step)
+
+        # fires on the step of the epoch updates still count towards the epoch just balanced
+        if (real_step - 1) % self.epoch_length == 0:
+            self._fire_counts.advance()
+
+        if self._warping:
+            next_fire = self._warp_until is not None and step >= self._warp_until
+            if not active_environment and self._dopamine <= 0.0001 and warp_allowed \
+               and not next_fire:
+                # continue warping
+                return
+
+            #come out of warp, cells are brought up to the end of the previous step
+            self._warp(step - self._last_active - 1)
+            self._warping = False
+        else:
+            self._maybe_start_warp(step, active_environment, warp_allowed)
+            if self._warping:
+                return
+
+        self._last_active = step
+        self._apply_stimuli(stimuli)
+        self._update_cells()
+
+        fired_indexes = np.flatnonzero(self._fired)
+        self._fire_trace[self._fire_trace > 0] -= 1
+        self._fire_trace[fired_indexes] = 100
+        self._apply_fire(step, fired_indexes)
+
+        output_ids = []
+        for index in fired_indexes[self._is_output_cell[fired_indexes]]:
+            output_ids.append(self._cells[index].output_id)
+        return output_ids
+
+    def run_steps(self, step, number_of_steps, schedule, warp_allowed=False):
+        '''
+        Steps through a StepSchedule in one call, see schedule.run_steps.
+        '''
+        return step_schedule.run_steps(self, step, number_of_steps, schedule, warp_allowed)
+
+    def run_epoch(self, step, schedule, warp_allowed=False):
+        return self.run_steps(step, self.epoch_length, schedule, warp_allowed)
+
+    def _update_cells(self):
+        '''
+        Vectorized CellMembrane.update from integrate_model.
+        '''
+        voltage_before_update = self._voltage
+        np.greater(self._voltage, self._max_voltage, out=self._fired)
+        self._voltage = np.where(self._fired, self._voltage_reset, self._voltage)
+        self._calcium[self._fired] += self._calcium_increment
+        if self._reset_input_current:
+            self._input_current[self._fired] = self._input_current_reset
+
+        self._voltage *= self._voltage_factor
+        self._voltage += self._input_current * self._step_size
+        self._input_current *= self._current_factor
+        self._calcium *= self._calcium_factor
+
+        self._active = (self._voltage > 0) & (voltage_before_update < self._voltage)
+
+    def _decay_s_tags(self, step, synapse_indexes):
+        steps_since_last_decay = step - self._last_stag_decay[synapse_indexes]
+        self._s_tag[synapse_indexes] *= (
+            1 - self._s_tag_decay_rate[synapse_indexes])**steps_since_last_decay
+        self._last_stag_decay[synapse_indexes] = step
+
+    def _settle_synapses(self, synapse_indexes=None, step=None):
+        '''
+        Vectorized integrate_model.Synapse.settle. Brings the given synapses, or every queued
+        synapse, up to date with the reward updates owed through step.
+
+        A synapse is queued for update by its pre cell and by its post cell separately. Just
+        like the python model it is updated once for each cell that queued it.
+        '''
+        if step is None:
+            step = self._dopamine_history.step
+        if step is None:
+            return
+
+        times_queued = (self._pre_cell_synapses_to_update.astype(np.int64)
+                        + self._post_cell_synapses_to_update)
+        if synapse_indexes is None:
+            synapse_indexes = np.flatnonzero(times_queued)
+        synapse_indexes = synapse_indexes[(times_queued[synapse_indexes] > 0)
+                                          & (self._last_stag_decay[synapse_indexes] < step)]
+        if len(synapse_indexes) == 0:
+            return
+
+        from_steps = self._last_stag_decay[synapse_indexes]
+        s_tags = self._s_tag[synapse_indexes]
+        s_tag_decay_rates = self._s_tag_decay_rate[synapse_indexes]
+        unsupervised_stdp = self._unsupervised_stdp[synapse_indexes]
+        reward_scalars = self._reward_scalar[synapse_indexes]
+        first_rewards = reward_scalars * self._dopamine_history.rewards(
+            s_tags, s_tag_decay_rates, from_steps, from_steps + 1, unsupervised_stdp)
+        total_rewards = reward_scalars * self._dopamine_history.rewards(
+            s_tags, s_tag_decay_rates, from_steps, step, unsupervised_stdp)
+
+        self._decay_s_tags(step, synapse_indexes)
+        self._strength[synapse_indexes] += first_rewards
+        self._cap_synapses(synapse_indexes)
+        self._strength[synapse_indexes] += (total_rewards * times_queued[synapse_indexes]
+                                            - first_rewards)
+        self._cap_synapses(synapse_indexes)
+
+    def _apply_fire(self, step, fired_indexes):
+        if len(fired_indexes) == 0:
+            return
+
+        self._fire_counts.record(fired_indexes)
+
+        # Every synapse touched by this step's spikes is gathered once from the compressed
+        # indexes then current and stdp updates are scattered in bulk.
+        output_indexes = self._outgoing.gather(fired_indexes)
+        input_indexes = self._incoming.gather(fired_indexes)
+        self._settle_synapses(output_indexes)
+        self._settle_synapses(input_indexes)
+
+        # Synapse.pre_fire
+        inhibitory_indexes = output_indexes[self._inhibitory[output_indexes]]
+        self._input_current -= np.bincount(
+            self._post_cell_indexes[inhibitory_indexes],
+            weights=self._inhibitory_strength[inhibitory_indexes],
+            minlength=len(self._input_current))
+
+        excitatory_indexes = output_indexes[self._excitatory[output_indexes]]
+        self._decay_s_tags(step, excitatory_indexes)
+        post_cell_indexes = self._post_cell_indexes[excitatory_indexes]
+        self._s_tag[excitatory_indexes] -= self._stdp_scalar * self._calcium[post_cell_indexes]
+        strength = self._strength[excitatory_indexes]
+        if self._noise_factor > 0:
+            noise = self._noise_factor * self._random.uniform(-1, 1, len(strength)) * strength
+            strength = strength + noise
+        self._input_current += np.bincount(post_cell_indexes, weights=strength,
+                                           minlength=len(self._input_current))
+
+        # Synapse.post_fire
+        post_fire_indexes = input_indexes[self._excitatory[input_indexes]]
+        self._decay_s_tags(step, post_fire_indexes)
+        pre_cell_indexes = self._pre_cell_indexes[post_fire_indexes]
+        self._s_tag[post_fire_indexes] += self._stdp_scalar * self._calcium[pre_cell_indexes]
+
+        self._queue_synapses(step, output_indexes, self._pre_cell_synapses_to_update)
+        self._queue_synapses(step, input_indexes, self._post_cell_synapses_to_update)
+
+    def _queue_synapses(self, step, synapse_indexes, synapses_to_update):
+        synapse_indexes = synapse_indexes[(self._s_tag[synapse_indexes] != 0)
+                                          & ~synapses_to_update[synapse_indexes]]
+        self._decay_s_tags(step, synapse_indexes)
+        synapses_to_update[synapse_indexes] = True
+
+    def _cap_synapses(self, synapse_indexes):
+        self._strength[synapse_indexes] = np.clip(self._strength[synapse_indexes],
+                                                  self._min_strength, self._max_strength)
+        self._inhibitory_strength[synapse_indexes] = np.clip(
+            self._inhibitory_strength[synapse_indexes],
+            self._min_strength, self._max_strength)
+
+    def _output_balance(self):
+        enabled = self._output_balance_enabled
+        homeostasis.output_balance(
+            self._strength, self._inhibitory_strength,
+            self._pre_cell_indexes, self._post_cell_indexes, self._target_input,
+            enabled & self._excitatory_cells,
+            enabled & self._inhibitory_cells & ~self._lock_inhibition_strength)
+
+    def _fire_rate_balance(self, step):
+        cells = self._input_balance
+        if not homeostasis.update_target_input(
+                self._target_input, cells, self._fire_counts.recent_fires,
+                self._target_fire_rate_per_epoch, step, self.epoch_length,
+                self._fire_history_length, self._fire_rate_balance_scalar):
+            return
+
+        homeostasis.input_balance(self._strength, self._inhibitory_strength,
+                                  self._post_cell_indexes, self._target_input,
+                                  cells, self._lock_inhibition_strength,
+                                  self._min_strength, self._max_strength,
+                                  self._input_balance_scalar)
+
+    def _update_dopamine(self, step, has_reward):
+        self._dopamine = decay(self._dopamine, self._dopamine_decay, self._step_size)
+        if has_reward:
+            # the dopamine history only covers steps since the last reward
+            self._settle_synapses(step=step - 1)
+            self._dopamine = 1
+        self._dopamine_history.record(step, self._dopamine, has_reward)
+
+    def export_network_definition(self):
+        '''
+        The network definition with synapse strengths as they are now.
+        '''
+        self._settle_synapses()
+        updated_synapse_definitions = []
+        for index, (pre_cell_index, post_cell_index, strength, inhibitory_strength) in enumerate(
+                zip(self._pre_cell_indexes.tolist(), self._post_cell_indexes.tolist(),
+                    self._strength.tolist(), self._inhibitory_strength.tolist())):
+            definition = SynapseDefinition(
+                pre_cell_index,
+                post_cell_index,
+                strength,
+                inhibitory_strength,
+                label=self._synapse_labels.get(index))
+            updated_synapse_definitions.append(definition)
+
+        return NetworkDefinition(
+            self.network_definition.cell_definitions,
+            updated_synapse_definitions)
+
+    def checkpoint_state(self):
+        '''
+        Everything that changes as the model runs as a dict of JSON values and a dict of
+        arrays, see brains.checkpoint. Unlike exporting nothing is settled.
+        '''
+        state = {"dopamine": self._dopamine,
+                 "dopamine_history": self._dopamine_history.checkpoint_state(),
+                 "fire_count_position": self._fire_counts.position,
+                 "random": self._random.bit_generator.state,
+                 "warping": self._warping,
+                 "last_active": self._last_active,
+                 "warp_until": self._warp_until}
+        arrays = {name: getattr(self, f"_{name}") for name in STATE_ARRAYS}
+        arrays["fire_counts"] = self._fire_counts.counts
+        arrays["recent_fires"] = self._fire_counts.recent_fires
+        return state, arrays
+
+    def restore_state(self, state, arrays):
+        for name in STATE_ARRAYS:
+            setattr(self, f"_{name}",
+                    np.array(arrays[name], dtype=getattr(self, f"_{name}").dtype))
+        self._fire_counts.counts = np.array(arrays["fire_counts"], dtype=np.int64)
+        self._fire_counts.recent_fires = np.array(arrays["recent_fires"], dtype=np.int64)
+        self._fire_counts.position = state["fire_count_position"]
+        self._dopamine = state["dopamine"]
+        self._dopamine_history.restore_state(state["dopamine_history"])
+        self._random.bit_generator.state = state["random"]
+        self._warping = state["warping"]
+        self._last_active = state["last_active"]
+        self._warp_until = state["warp_until"]
+
+    def export(self):
+        updated_network_definition = self.export_network_definition()
+        updated_network_definition.assign_uuids()
+        blob = {"model_parameters": dataclasses.asdict(self.model_parameters),
+                "network_definition": dataclasses.asdict(updated_network_definition),
+                "version": "2"
+                }
+        return blob
+
+    def video_output(self, x, y, layer):
+        '''
+        Used by pygame
+        '''
+        texts = ["dopamine: " + str(round(self._dopamine, 5))]
+        drawables = []
+        for cell in self._cells:
+            spike = cell.fire_trace > 0
+            drawable = {"x": cell.x_display_position,
+                        "y": cell.y_display_position,
+                        "strength": cell.membrane_voltage(),
+                        "spike": spike,
+                        "layer_id": cell.layer_id,
+                        "layer_x": cell.x_layer_position,
+                        "layer_y": cell.y_layer_position}
+            drawables.append(drawable)
+            wanted_position = cell.x_layer_position == x and cell.y_layer_position == y
+            wanted_layer = cell.layer_id == layer
+            if wanted_position and wanted_layer:
+                totals = cell.weight_totals()
+                (positive_in, negative_in, positive_out, negative_out,) = totals
+                texts.append(f"positive_in: {str(round(positive_in, 5))} "\
+                             f"negative_in: {str(round(negative_in, 5))} "\
+                             f"positive_out: {str(round(positive_out, 5))} "\
+                             f"negative_out: {str(round(negative_out, 5))} "\
+                             f"target: {str(round(cell._target_input, 5))} ")
+                drawables += cell.drawable_synapses()
+        return drawables, texts
+
+    def text_output(self):
+        '''
+        Used for command line prints once an epoch
+        '''
+        texts = []
+        for cell in self._cells:
+            # Print information for one cell in the middle layer and one cell in the output layer.
+            if (cell.layer_id == 'b' or cell.layer_id == 'c') and cell.output_id == 0:
+                texts.append(f"layer_id {cell.layer_id} " \
+                    f"running_rate {cell._recent_fires / cell._fire_history_length} " \
+                    f"target_rate {cell._target_fire_rate_per_epoch} " \
+                    f"fires {cell._recent_fires} " \
+                    f"target_input {cell._target_input}")
+        return texts
+
+    def test_outputs(self):
+        self._settle_synapses()
+        outputs = {}
+        for cell in self._cells:
+            outputs[cell.label] = cell.membrane_voltage()
+
+        for index in range(len(self._strength)):
+            pre_cell = self._cells[self._pre_cell_indexes[index]]
+            post_cell = self._cells[self._post_cell_indexes[index]]
+            outputs[f"{pre_cell.label}_to_{post_cell.label}"] = float(self._strength[index])
+        return outputs
+
+    def outputs(self):
+        '''
+        Used by pyplot
+        '''
+        cell_to_print = None
+        for cell in self._cells:
+            correct_position = cell.x_layer_position == 0 and cell.y_layer_position == 0
+            if cell.layer_id == 'b' and correct_position:
+                cell_to_print = cell
+                break
+        if cell_to_print is None:
+            return {}
+
+        (positive_in, negative_in, positive_out, negative_out,) = cell_to_print.weight_totals()
+        return {"positive_in": positive_in,
+                "negative_in": negative_in,
+                "positive_out": positive_out,
+                "negative_out": negative_out,}
+
+    def _build_network(self, cell_type_parameters,
+                       synapse_type_parameters,
+                       network_definition):
+        cell_definitions = network_definition.cell_definitions
+        number_of_cells = len(cell_definitions)
+        self._cells = []
+        for index, cell_definition in enumerate(cell_definitions):
+            self._cells.append(Cell(cell_definition, self, index))
+
+        self._voltage = np.full(number_of_cells, cell_type_parameters.starting_membrane_voltage)
+        self._input_current = np.full(number_of_cells,
+                                      cell_type_parameters.starting_input_current)
+        self._calcium = np.full(number_of_cells, cell_type_parameters.starting_calcium)
+        self._fired = np.zeros(number_of_cells, dtype=bool)
+        self._active = np.ones(number_of_cells, dtype=bool)
+        self._fire_trace = np.zeros(number_of_cells, dtype=np.int64)
+        self._fire_counts = FireCounts(number_of_cells, self._fire_history_length)
+
+        cell_types = np.array([cell.cell_type for cell in cell_definitions], dtype=np.int64)
+        self._is_output_cell = np.array([cell.is_output_cell for cell in cell_definitions],
+                                        dtype=bool)
+        self._input_balance = np.array([cell.input_balance for cell in cell_definitions],
+                                       dtype=bool)
+        self._output_balance_enabled = np.array(
+            [cell.output_balance for cell in cell_definitions], dtype=bool)
+        self._lock_inhibition_strength = np.array(
+            [cell.lock_inhibition_strength for cell in cell_definitions], dtype=bool)
+        self._target_fire_rate_per_epoch = np.array(
+            [cell.target_fire_rate_per_epoch for cell in cell_definitions], dtype=float)
+        self._excitatory_cells = ((cell_types == CellType.EXCITATORY)
+                                  | (cell_types == CellType.MIXED))
+        self._inhibitory_cells = ((cell_types == CellType.INHIBITORY)
+                                  | (cell_types == CellType.MIXED))
+
+        synapse_arrays = network_definition.synapse_arrays()
+        # only labels that are not the default pre_to_post
+        self._synapse_labels = dict(synapse_arrays.labels)
+        self._pre_cell_indexes = synapse_arrays.pre_cell_index.astype(np.int64)
+        self._post_cell_indexes = synapse_arrays.post_cell_index.astype(np.int64)
+        self._strength = synapse_arrays.starting_strength.astype(float)
+        self._inhibitory_strength = synapse_arrays.starting_inhibitory_strength.astype(float)
+        self._unsupervised_stdp = synapse_arrays.unsupervised_stdp.astype(bool)
+        self._reward_scalar = synapse_arrays.reward_scalar.astype(float)
+        self._s_tag_decay_rate = synapse_arrays.s_tag_decay_rate.astype(float)
+
+        number_of_synapses = len(synapse_arrays)
+        # can be though of as recording the firing pattern correlation
+        self._s_tag = np.full(number_of_synapses, synapse_type_parameters.starting_s_tag)
+        self._last_stag_decay = np.zeros(number_of_synapses, dtype=np.int64)
+        self._pre_cell_synapses_to_update = np.zeros(number_of_synapses, dtype=bool)
+        self._post_cell_synapses_to_update = np.zeros(number_of_synapses, dtype=bool)
+
+        self._excitatory = self._excitatory_cells[self._pre_cell_indexes]
+        self._inhibitory = self._inhibitory_cells[self._pre_cell_indexes]
+
+        self._outgoing = SynapseIndex(self._pre_cell_indexes, number_of_cells)
+        self._incoming = SynapseIndex(self._post_cell_indexes, number_of_cells)
+
+        self._target_input = np.bincount(self._post_cell_indexes, weights=self._strength,
+                                         minlength=number_of_cells)
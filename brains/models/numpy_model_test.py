@@ -0,0 +1,182 @@
+import brains.models.integrate_model as integrate_model
+import brains.models.numpy_model as numpy_model
+import brains.models.simple_model_builder as simple_model_builder
+import brains.network_definitions as network_definitions
+from brains.environment.stdp import STDPTestEnvironment
+from brains.environment.parameter import ParameterTestEnvironment
+from brains.environment.handwriting import HandwritingEnvironment
+from brains.environment.base import FakeEnvironment
+from brains.network import CellDefinition, CellType, network_from_cells
+from brains.stimuli import ArrayStimuli
+
+import random
+import unittest
+
+def run_model(model, environment, steps):
+    output_history = []
+    output_ids = []
+    for i in range(steps):
+        environment.step(i, output_ids)
+        output_ids = model.step(i, environment.stimuli(i), environment.has_reward(),
+                                environment.active(i))
+        output_history.append(output_ids)
+    return output_history
+
+def easy_fake_environment(epochs, epoch_length, input_delay):
+    '''
+    Alternates which of the first two inputs is stimulated and which output is rewarded.
+    '''
+    input_points = []
+    reward_ids = []
+    for epoch in range(epochs):
+        input_points.append((epoch * epoch_length + input_delay, 0, epoch % 2, 0.3))
+        input_points.append((epoch * epoch_length + input_delay, 0, 2, 0.3))
+        reward_ids.append(epoch % 2)
+    return FakeEnvironment(input_points, reward_ids + [None], epoch_length, input_delay)
+
+def choice_network():
+    '''
+    Two inputs each wired more strongly to one of two outputs with an inhibitory input
+    shared by both.
+    '''
+    cells = [CellDefinition("a", 0, 0, is_input_cell=True, x_input_position=0,
+                            y_input_position=0, output_balance=True),
+             CellDefinition("b", 0, 1, is_input_cell=True, x_input_position=0,
+                            y_input_position=1, output_balance=True),
+             CellDefinition("i", 0, 2, is_input_cell=True, x_input_position=0,
+                            y_input_position=2, cell_type=CellType.INHIBITORY),
+             CellDefinition("c", 1, 0, is_output_cell=True, output_id=0, input_balance=True,
+                            target_fire_rate_per_epoch=0.5),
+             CellDefinition("d", 1, 1, is_output_cell=True, output_id=1, input_balance=True,
+                            target_fire_rate_per_epoch=0.5),]
+    synapses = [("a", "c", 0.5),
+                ("a", "d", 0.3),
+                ("b", "c", 0.3),
+                ("b", "d", 0.5),
+                ("i", "c", 0.05),
+                ("i", "d", 0.05),]
+    return network_from_cells(cells, synapses)
+
+def run_side_by_side(test_case, network_definition, model_parameters, environment_factory, steps):
+    '''
+    Runs the python and numpy models with the same inputs and checks they end up the same.
+    Returns the python model's environment and output history.
+    '''
+    python_model = integrate_model.SimpleModel(network_definition, model_parameters)
+    numpy_model_ = numpy_model.SimpleModel(network_definition, model_parameters)
+
+    random.seed(0)
+    python_environment = environment_factory()
+    python_output_history = run_model(python_model, python_environment, steps)
+    random.seed(0)
+    numpy_output_history = run_model(numpy_model_, environment_factory(), steps)
+    test_case.assertEqual(python_output_history, numpy_output_history)
+
+    python_outputs = python_model.test_outputs()
+    numpy_outputs = numpy_model_.test_outputs()
+    test_case.assertEqual(python_outputs.keys(), numpy_outputs.keys())
+    for label, value in python_outputs.items():
+        test_case.assertAlmostEqual(value, numpy_outputs[label], places=9)
+    return python_environment, python_output_history
+
+class TupleStimuliEnvironment:
+    '''
+    Passes on an environment with any ArrayStimuli turned into tuples.
+    '''
+    def __init__(self, environment):
+        self._environment = environment
+
+    def __getattr__(self, name):
+        return getattr(self._environment, name)
+
+    def stimuli(self, step):
+        stimuli = self._environment.stimuli(step)
+        if isinstance(stimuli, ArrayStimuli):
+            return stimuli.as_tuples()
+        return stimuli
+
+def handwriting_environment():
+    model_parameters = simple_model_builder.handwriting_model_parameters()
+    return HandwritingEnvironment(model_parameters.epoch_length, 50, {'o': 0, 'x': 1},
+                                  shuffle=True, file_name="o_x_hand_written_short.csv")
+
+class TestNumpyModel(unittest.TestCase):
+
+    def test_array_stimuli_match_tuples(self):
+        model_parameters = simple_model_builder.handwriting_model_parameters()
+        network_definition = network_definitions.layer_based_default_network()
+        for model_module in [integrate_model, numpy_model]:
+            output_histories = []
+            outputs = []
+            for environment_factory in [
+                    handwriting_environment,
+                    lambda: TupleStimuliEnvironment(handwriting_environment())]:
+                random.seed(0)
+                model = model_module.SimpleModel(network_definition, model_parameters)
+                output_histories.append(run_model(model, environment_factory(), 2000))
+                outputs.append(model.test_outputs())
+            self.assertEqual(output_histories[0], output_histories[1])
+            self.assertEqual(outputs[0], outputs[1])
+
+    def test_matches_python_model_stdp(self):
+        model_parameters = simple_model_builder.ModelParameters()
+        model_parameters.synapse_type_parameters.max_strength = 0.4
+        network_definition = network_definitions.stdp_test_network()
+        run_side_by_side(self, network_definition, model_parameters, STDPTestEnvironment, 4000)
+
+    def test_matches_python_model_input_balancing(self):
+        model_parameters = simple_model_builder.ModelParameters()
+        network_definition = network_definitions.stdp_test_network(input_balance=True)
+        run_side_by_side(self, network_definition, model_parameters, STDPTestEnvironment, 4000)
+
+    def test_matches_python_model_choice(self):
+        '''
+        Covers inhibitory cells, rewards and output balancing. Noise is off since the two
+        models draw it from different generators so the outputs have to fire without it.
+        '''
+        model_parameters = simple_model_builder.handwriting_model_parameters()
+        model_parameters.synapse_type_parameters.max_strength = 0.4
+        model_parameters.synapse_type_parameters.noise_factor = 0.0
+        network_definition = choice_network()
+        environment, output_history = run_side_by_side(
+            self, network_definition, model_parameters,
+            lambda: easy_fake_environment(20, 400, 50), 8000)
+        self.assertGreater(sum(len(output_ids) for output_ids in output_history), 0)
+        self.assertGreater(environment._result_tracker.rewarded, 0)
+
+    def test_warp_matches_python_model(self):
+        '''
+        Warping numpy model should agree with the python model stepping every step.
+        '''
+        model_parameters = simple_model_builder.ModelParameters(starting_dopamine=0.0)
+        network_definition = network_definitions.parameter_test_network()
+        python_model = integrate_model.SimpleModel(network_definition, model_parameters)
+        numpy_model_ = numpy_model.SimpleModel(network_definition, model_parameters)
+        test_environment = ParameterTestEnvironment()
+        warped_steps = 0
+        for i in range(1300):
+            stimuli = test_environment.stimuli(i)
+            active = test_environment.active(i)
+            python_model.step(i, stimuli, False, active)
+            numpy_model_.step(i, stimuli, False, active, warp_allowed=True)
+            if numpy_model_._warping:
+                warped_steps += 1
+                continue
+            python_outputs = python_model.test_outputs()
+            for label, value in numpy_model_.test_outputs().items():
+                self.assertAlmostEqual(value, python_outputs[label], places=9)
+        self.assertGreater(warped_steps, 1000)
+
+    def test_export_import(self):
+        model_parameters = simple_model_builder.ModelParameters()
+        network_definition = network_definitions.stdp_test_network()
+        old_model = numpy_model.SimpleModel(network_definition, model_parameters)
+        old_model.synapses[0].strength = 0.02
+        blob = old_model.export()
+        new_model = simple_model_builder.import_model(blob, numpy_model)
+        self.assertEqual(old_model.synapses[0].pre_cell.uuid,
+                         new_model.synapses[0].pre_cell.uuid)
+        self.assertEqual(new_model.synapses[0].strength, 0.02)
+
+if __name__ == '__main__':
+    unittest.main()
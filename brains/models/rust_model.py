@@ -1,10 +1,15 @@
-from brains.utils import decay
+from brains.utils import decay, steps_until_voltages_exceed
 from brains.network import SynapseDefinition, NetworkDefinition, CellType
+from brains.stimuli import ArrayStimuli, InputMapping
+from brains.models.fire_counts import FireCounts
+import brains.models.homeostasis as homeostasis
+import brains.models.schedule as step_schedule
 import iron_brains
 
 from collections import defaultdict
 import random
 import dataclasses
+import numpy as np
 
 class Synapse:
     def __init__(self, pre_cell, post_cell,
@@ -26,8 +31,13 @@ class Synapse:
                                               synapse_definition.starting_inhibitory_strength,
                                               pre_cell_index,
                                               post_cell_index)
-        self.label = synapse_definition.label
+        self._label = synapse_definition.label
 
+    @property
+    def label(self):
+        if self._label is not None:
+            return self._label
+        return f"{self.pre_cell.label}_to_{self.post_cell.label}"
 
     @property
     def strength(self):
@@ -61,8 +71,9 @@ class CellMembrane:
 
 
 class Cell:
-    def __init__(self, cell_definition, cell_membrane, iron_model, index):
-        self.uuid = cell_definition.uuid
+    def __init__(self, cell_definition, cell_membrane, iron_model, index, fire_counts,
+                 target_input):
+        self._cell_definition = cell_definition
         self.label = cell_definition.label
         self.layer_id = cell_definition.layer_id
         self._iron_model = iron_model
@@ -86,200 +97,54 @@ class Cell:
         # I don't like how we initialize these outside constructor
         self.input_synapses = []
         self.output_synapses = []
-        self._target_input = 0.0
-        
-        self._fire_history = []
+
+        # balancing is done by SimpleModel for all cells at once using these shared arrays
+        self._fire_counts = fire_counts
+        self._target_input_array = target_input
         self._target_fire_rate_per_epoch = cell_definition.target_fire_rate_per_epoch
         self._input_balance = cell_definition.input_balance
         self._output_balance = cell_definition.output_balance
         self._lock_inhibition_strength = cell_definition.lock_inhibition_strength
-        
-        self._fire_rate_balance_scalar = 0.01
         self._fire_history_length = 20
-        self._input_balance_scalar = 1.0
+
+    @property
+    def uuid(self):
+        return self._cell_definition.get_uuid()
+
+    @property
+    def _recent_fires(self):
+        return int(self._fire_counts.recent_fires[self.index])
+
+    @property
+    def _target_input(self):
+        return float(self._target_input_array[self.index])
 
     def weight_totals(self):
-        (positive_in, negative_in, positive_out, negative_out,) = (0.0, 0.0, 0.0, 0.0,)
-        for synapse in self.input_synapses:
-            positive_in += synapse.strength
-            negative_in += synapse.inhibitory_strength
-        for synapse in self.output_synapses:
-            positive_out += synapse.strength
-            negative_out += synapse.inhibitory_strength
+        strength = np.array(iron_brains.strengths(self._iron_model))
+        inhibitory_strength = np.array(iron_brains.inhibitory_strengths(self._iron_model))
+        input_indexes = [synapse._index for synapse in self.input_synapses]
+        output_indexes = [synapse._index for synapse in self.output_synapses]
+        positive_in = float(strength[input_indexes].sum())
+        negative_in = float(inhibitory_strength[input_indexes].sum())
+        positive_out = float(strength[output_indexes].sum())
+        negative_out = float(inhibitory_strength[output_indexes].sum())
         return positive_in, negative_in, positive_out, negative_out
 
     def attach_synapses(self, synapses):
         for synapse in synapses:
-            if synapse.pre_cell.uuid == self.uuid:
+            if synapse.pre_cell is self:
                 self.output_synapses.append(synapse)
-            elif synapse.post_cell.uuid == self.uuid:
+            elif synapse.post_cell is self:
                 self.input_synapses.append(synapse)
             else:
                 raise Exception("Attempted to attach synapse to cell "\
                                 "but neither of the synapses "\
                                 "endpoints attach to the cell.")
-        current_positive_strength = self._positive_input_strength()
-        self._target_input = current_positive_strength
-
-    def _normalize_negative_input(self, target):
-        total = self._negative_input_strength()
-        if total > 0.0:
-            scale = target/total
-        else:
-            scale = 1.0
-            
-        new_total = 0.0
-        change_factor = scale * self._input_balance_scalar
-        keep_factor = 1.0 - self._input_balance_scalar
-        for synapse in self.input_synapses:
-            change_part = synapse.inhibitory_strength * change_factor
-            synapse.inhibitory_strength = (change_part) + (synapse.inhibitory_strength * keep_factor)
-            synapse.cap()
-            new_total += synapse.inhibitory_strength
-        return new_total
-
-    def _normalize_positive_input(self, target):
-        return iron_brains.positive_normalize(self._iron_model,
-                                              self.index,
-                                              target)
-
-    def output_balance(self):
-        if not self._output_balance:
-            return
-
-        if len(self.output_synapses) == 0:
-            return
-
-        if self.cell_type == CellType.EXCITATORY or self.cell_type == CellType.MIXED:
-            total_post_cell_strength = 0.0
-            num_cells = 0
-            for synapse in self.output_synapses:
-                total_post_cell_strength += synapse.post_cell._target_input
-                if synapse.post_cell._target_input > 0:
-                    num_cells += 1
-
-            if num_cells > 0:
-                average_post_cell_strength = total_post_cell_strength/num_cells
-                if self._positive_output_strenght() == 0:
-                    reset = average_post_cell_strength/len(self.output_synapses)
-                    for synapse in self.output_synapses:
-                        synapse.strength = reset
-                else:
-                    scale = average_post_cell_strength/self._positive_output_strenght()
-                    for synapse in self.output_synapses:
-                        synapse.strength = synapse.strength * scale
-
-        if self.cell_type == CellType.INHIBITORY or self.cell_type == CellType.MIXED:
-            if self._lock_inhibition_strength:
-                return
-            n_total_post_cell_strength = 0.0
-            num_cells = 0
-            for synapse in self.output_synapses:
-                n_total_post_cell_strength += synapse.post_cell._target_input
-                if synapse.post_cell._target_input > 0:
-                    num_cells += 1
-
-            if num_cells > 0:
-                n_average_post_cell_strength = n_total_post_cell_strength/num_cells
-                n_scale = n_average_post_cell_strength/self._negative_output_strength()
-                for synapse in self.output_synapses:
-                    synapse.inhibitory_strength = synapse.inhibitory_strength * n_scale
-
-    def fire_rate_balance(self, step, epoch_length):
-        if not self._input_balance:
-            return
-
-        target_fire_rate = self._target_fire_rate_per_epoch / epoch_length
-
-        if target_fire_rate == 0:
-            raise Exception("target fire rate should be greater than 0 with input balancing")
-            
-        if step == 0:
-            return
-
-        new_fire_history = []
-        fires = 0
-        for fire_time in self._fire_history:
-            if fire_time > step  - (epoch_length * self._fire_history_length):
-                new_fire_history.append(fire_time)
-                fires += 1
-
-        if step > epoch_length * self._fire_history_length:
-            running_fire_rate = fires / (epoch_length * self._fire_history_length)
-        else:
-            running_fire_rate = fires / step
-            
-        self._fire_history = new_fire_history
-
-        if running_fire_rate > target_fire_rate:
-            rate_based_down_scale_factor = target_fire_rate/running_fire_rate
-            self._target_input -= self._target_strength_reduction(
-                rate_based_down_scale_factor,
-                self._target_input)
-        else:
-            if running_fire_rate == 0:
-                rate_based_up_scale_factor = 2.0
-            else:
-                rate_based_up_scale_factor = target_fire_rate/running_fire_rate
-
-            self._target_input += self._target_strength_increase(rate_based_up_scale_factor,
-                                                     self._target_input)
-
-        real_positive_strength = self._normalize_positive_input(self._target_input)
-
-        if not self._lock_inhibition_strength:
-            real_negative_strength = self._normalize_negative_input(self._target_input)
-        else:
-            real_negative_strength = 0.0
-        
-        if real_negative_strength == 0.0:
-            pass
-        elif real_positive_strength < real_negative_strength:
-            real_positive_strength = self._normalize_positive_input(real_positive_strength)
-            real_negative_strength = self._normalize_negative_input(real_positive_strength)
-
-        else:
-            real_positive_strength = self._normalize_positive_input(real_negative_strength)
-            real_negative_strength = self._normalize_negative_input(real_negative_strength)
-
-    def _target_strength_reduction(self, rate_based_down_scale_factor,
-                                   current_target_strength):
-        rate_based_target = current_target_strength * rate_based_down_scale_factor
-        rate_based_change = current_target_strength - rate_based_target
-        return self._fire_rate_balance_scalar * rate_based_change
-    
-    def _target_strength_increase(self, rate_based_up_scale_factor, current_target_strength):
-        rate_based_target = current_target_strength * rate_based_up_scale_factor
-        rate_based_change = rate_based_target - current_target_strength
-        return self._fire_rate_balance_scalar * rate_based_change
-                
-    def _positive_input_strength(self):
-        return iron_brains.cell_positive_input_strength(self._iron_model,
-                                                        self.index)
-
-    def _negative_input_strength(self):
-        negative_total = 0.0
-        for synapse in self.input_synapses:
-            negative_total += synapse.inhibitory_strength
-        return negative_total
-
-    def _positive_output_strenght(self):
-        total = 0.0
-        for synapse in self.output_synapses:
-            total += synapse.strength
-        return total
-
-    def _negative_output_strength(self):
-        total = 0.0
-        for synapse in self.output_synapses:
-            total += synapse.inhibitory_strength
-        return total
 
     def receive_fire(self, strength):
         self._cell_membrane.receive_input(strength)
 
     def apply_fire(self, step):
-        self._fire_history.append(step)
         iron_brains.apply_fire(self._iron_model,
                                self.index)
   
@@ -351,35 +216,61 @@ class SimpleModel:
         )
         self._iron_model = iron_brains.create(len(network_definition.cell_definitions),
                                               cell_membrane_parameters, synapse_parameters)
+        # the rust membrane update ignores step_size
+        self._voltage_factor = 1 - cell_parameters.voltage_decay
+        self._current_factor = 1 - cell_parameters.current_decay
+        self._max_voltage = cell_parameters.max_voltage
+        self._warping = False
+        self._last_active = 0
+        self._warp_until = 0
         self._firing_indexes = set()
-        
+        number_of_cells = len(network_definition.cell_definitions)
+        self._fire_counts = FireCounts(number_of_cells, 20)
+        self._target_input = np.zeros(number_of_cells)
+        self._fire_rate_balance_scalar = 0.01
+        self._fire_history_length = 20
+        self._input_balance_scalar = 1.0
+        self._min_strength = synapse_type_parameters.min_strength
+        self._max_strength = synapse_type_parameters.max_strength
+
         self._cells, self.synapses = self._build_network(
             model_parameters.cell_type_parameters,
             model_parameters.synapse_type_parameters,
             network_definition,
             self._step_size)
+        self._build_balance_arrays()
 
         self.epoch_length = model_parameters.epoch_length
         self._epoch_delay = model_parameters.epoch_delay
         self.cells_by_input_position = self._cells_by_input_position()
-        
+        self._input_mapping = InputMapping(network_definition.cell_definitions)
+
     def step(self, step, stimuli, has_reward, active_environment, warp_allowed=False):
-        '''
-        Warp parameter ignored
-        '''
-        self._update_dopamine(step, has_reward)
+        self._start_step(step, has_reward)
 
-        # We need a seperate epoch variable for the model
-        real_step = step - self._epoch_delay
-        if real_step % self.epoch_length == 0:
-            self._epoch_updates(step)
+        if self._warping:
+            next_fire = self._warp_until is not None and step >= self._warp_until
+            if not active_environment and self._dopamine <= 0.0001 and warp_allowed \
+               and not next_fire:
+                # continue warping
+                return
 
+            #come out of warp, cells are brought up to the end of the previous step
+            iron_brains.warp_cells(self._iron_model, step - self._last_active - 1)
+            self._warping = False
+        else:
+            self._maybe_start_warp(step, active_environment, warp_allowed)
+            if self._warping:
+                return
+
+        self._last_active = step
         iron_brains.update_synapses(self._iron_model, self._dopamine)
         self._apply_stimuli(stimuli)
         iron_brains.update_cells(self._iron_model)
 
         output_ids = []
         fired_indexes = iron_brains.fired_indexes(self._iron_model);
+        self._fire_counts.record(fired_indexes)
 
         for index in fired_indexes:
             cell = self._cells[index]
@@ -392,6 +283,126 @@ class SimpleModel:
         self._update_fired_display_markers(fired_indexes)
         return output_ids
 
+    def _start_step(self, step, has_reward):
+        '''
+        The part of step done in python whether or not the rest of it is done by
+        iron_brains.run_steps.
+        '''
+        self._update_dopamine(step, has_reward)
+
+        # We need a seperate epoch variable for the model
+        real_step = step - self._epoch_delay
+        if real_step % self.epoch_length == 0:
+            self._epoch_updates(step)
+
+        # fires on the step of the epoch updates still count towards the epoch just balanced
+        if (real_step - 1) % self.epoch_length == 0:
+            self._fire_counts.advance()
+
+    def run_steps(self, step, number_of_steps, schedule, warp_allowed=False):
+        '''
+        Steps through a StepSchedule in one call, see schedule.run_steps. Steps are run by
+        iron_brains.run_steps in one call for each run of steps that python does not have
+        to start with _start_step for a possible reward, balancing or counting fires in a
+        new epoch. Warping is decided step by step so warp_allowed runs go through step.
+        '''
+        if warp_allowed or self._warping:
+            return step_schedule.run_steps(self, step, number_of_steps, schedule, warp_allowed)
+
+        end_step = step + number_of_steps
+        reward_steps = schedule.possible_reward_steps()
+        dopamine_factor = decay(1.0, self._dopamine_decay, self._step_size)
+        output_events = []
+        run_start = step
+        while run_start < end_step:
+            run_end = self._next_python_step(run_start, end_step, reward_steps)
+            has_reward = (run_start in reward_steps
+                          and schedule.has_reward(run_start, output_events))
+            self._start_step(run_start, has_reward)
+
+            stimulus_offsets = [0]
+            stimulus_cells = []
+            stimulus_currents = []
+            for current_step in range(run_start, run_end):
+                cell_indexes, currents = self._stimulus_inputs(schedule.stimuli(current_step))
+                stimulus_cells += cell_indexes
+                stimulus_currents += currents
+                stimulus_offsets.append(len(stimulus_cells))
+
+            self._dopamine, fire_steps, fired_indexes = iron_brains.run_steps(
+                self._iron_model, run_end - run_start, self._dopamine, dopamine_factor,
+                stimulus_offsets, stimulus_cells, stimulus_currents)
+            self._fire_counts.record_many(fired_indexes)
+            self._update_fire_traces(fire_steps, fired_indexes, run_end - run_start)
+            for fire_step, index in zip(fire_steps, fired_indexes):
+                cell = self._cells[index]
+                if cell.is_output_cell:
+                    output_events.append((run_start + fire_step, cell.output_id))
+
+            self._last_active = run_end - 1
+            run_start = run_end
+        return step_schedule.events_array(output_events)
+
+    def _next_python_step(self, step, end_step, reward_steps):
+        '''
+        First step after step that has to start with _start_step, or end_step.
+        '''
+        real_step = step - self._epoch_delay
+        next_steps = [end_step,
+                      step + self.epoch_length - real_step % self.epoch_length,
+                      step + self.epoch_length - (real_step - 1) % self.epoch_length]
+        next_steps += [reward_step for reward_step in reward_steps
+                       if step < reward_step < end_step]
+        return min(next_steps)
+
+    def _update_fire_traces(self, fire_steps, fired_indexes, number_of_steps):
+        '''
+        Leaves fire traces and firing indexes as number_of_steps steps would have. A cell in
+        _firing_indexes loses one from its trace each step until it is 0 and drops out the
+        step after.
+        '''
+        steps_since_fire = {index: number_of_steps for index in self._firing_indexes}
+        for fire_step, index in zip(fire_steps, fired_indexes):
+            self._cells[index].fire_trace = 100
+            steps_since_fire[index] = number_of_steps - 1 - fire_step
+
+        firing_indexes = set()
+        for index, steps in steps_since_fire.items():
+            cell = self._cells[index]
+            if cell.fire_trace >= steps:
+                firing_indexes.add(index)
+            cell.fire_trace = max(cell.fire_trace - steps, 0)
+        self._firing_indexes = firing_indexes
+
+    def run_epoch(self, step, schedule, warp_allowed=False):
+        return self.run_steps(step, self.epoch_length, schedule, warp_allowed)
+
+    def _maybe_start_warp(self, step, active_environment, warp_allowed):
+        '''
+        See integrate_model.SimpleModel._maybe_start_warp. Rust synapses with an s_tag are
+        updated every step rather than settled lazily, so warping waits until the s_tags
+        are cleared by the epoch updates.
+        '''
+        if not warp_allowed:
+            return
+
+        if active_environment or self._dopamine > 0.0001:
+            return
+
+        if iron_brains.has_pending_s_tags(self._iron_model):
+            return
+
+        steps_until_fire = steps_until_voltages_exceed(
+            np.array(iron_brains.voltages(self._iron_model)),
+            np.array(iron_brains.input_currents(self._iron_model)),
+            self._voltage_factor, self._current_factor, 1, self._max_voltage)
+        soonest = steps_until_fire.min() if len(steps_until_fire) > 0 else np.inf
+        if soonest == 0:
+            return
+
+        self._warping = True
+        self._warp_until = None if np.isinf(soonest) else step + int(soonest)
+
     def _update_fired_display_markers(self, fired_indexes):
         new_firing_indexes = []
         for index in self._firing_indexes:
@@ -411,51 +422,148 @@ class SimpleModel:
                 cells_by_input_position[cell._x_input_position][cell._y_input_position].append(cell)
         return cells_by_input_position
 
-    def _apply_stimuli(self, stimuli):
+    def _stimulus_inputs(self, stimuli):
+        '''
+        Lists of the cell indexes stimuli reach and their currents in the order cells
+        receive them.
+        '''
         if stimuli is None:
-            return
-        
+            return [], []
+
+        if isinstance(stimuli, ArrayStimuli):
+            cell_indexes, currents = self._input_mapping.resolve(stimuli)
+            return cell_indexes.tolist(), currents.tolist()
+
+        cell_indexes = []
+        currents = []
         for stimulus in stimuli:
             x_input_position = stimulus[0]
             y_input_position = stimulus[1]
             outside_current = stimulus[2]
             cells = self.cells_by_input_position[x_input_position][y_input_position]
             for cell in cells:
-                cell._cell_membrane.receive_input(outside_current)
+                cell_indexes.append(cell.index)
+                currents.append(outside_current)
+        return cell_indexes, currents
+
+    def _apply_stimuli(self, stimuli):
+        for cell_index, current in zip(*self._stimulus_inputs(stimuli)):
+            self._cells[cell_index]._cell_membrane.receive_input(current)
 
     def _epoch_updates(self, step):
         # bad hack(means messing with input delays breaks things
         iron_brains.clear_positive_s_tags(self._iron_model)
 
-        for cell in self._cells:
-            cell.output_balance()
+        # strengths cross into python once, are balanced for every cell and go back once
+        strength = np.array(iron_brains.strengths(self._iron_model))
+        inhibitory_strength = np.array(iron_brains.inhibitory_strengths(self._iron_model))
+        self._output_balance(strength, inhibitory_strength)
+        self._fire_rate_balance(step, strength, inhibitory_strength)
+        iron_brains.update_strengths(self._iron_model, strength.tolist())
+        iron_brains.update_inhibitory_strengths(self._iron_model, inhibitory_strength.tolist())
+
+    def _output_balance(self, strength, inhibitory_strength):
+        enabled = self._output_balance_enabled
+        homeostasis.output_balance(
+            strength, inhibitory_strength,
+            self._pre_cell_indexes, self._post_cell_indexes, self._target_input,
+            enabled & self._excitatory_cells,
+            enabled & self._inhibitory_cells & ~self._lock_inhibition_strength)
+
+    def _fire_rate_balance(self, step, strength, inhibitory_strength):
+        cells = self._input_balance
+        if not homeostasis.update_target_input(
+                self._target_input, cells, self._fire_counts.recent_fires,
+                self._target_fire_rate_per_epoch, step, self.epoch_length,
+                self._fire_history_length, self._fire_rate_balance_scalar):
+            return
 
-        for cell in self._cells:
-            cell.fire_rate_balance(step, self.epoch_length)
+        homeostasis.input_balance(strength, inhibitory_strength,
+                                  self._post_cell_indexes, self._target_input,
+                                  cells, self._lock_inhibition_strength,
+                                  self._min_strength, self._max_strength,
+                                  self._input_balance_scalar)
 
     def _update_dopamine(self, step, has_reward):
         self._dopamine = decay(self._dopamine, self._dopamine_decay, self._step_size)
         if has_reward:
             self._dopamine = 1
 
-    def export(self):
+    def export_network_definition(self):
+        '''
+        The network definition with synapse strengths as they are now.
+        '''
+        strengths = iron_brains.strengths(self._iron_model)
+        inhibitory_strengths = iron_brains.inhibitory_strengths(self._iron_model)
         updated_synapse_definitions = []
         for synapse in self.synapses:
             definition = SynapseDefinition(
-                synapse.label,
-                synapse.pre_cell.uuid,
-                synapse.post_cell.uuid,
-                synapse.strength,
-                synapse.inhibitory_strength)
+                synapse.pre_cell.index,
+                synapse.post_cell.index,
+                strengths[synapse._index],
+                inhibitory_strengths[synapse._index],
+                label=synapse._label)
             updated_synapse_definitions.append(definition)
         
-        updated_network_definition = NetworkDefinition(
+        return NetworkDefinition(
             self.network_definition.cell_definitions,
             updated_synapse_definitions)
-                                                               
+
+    def checkpoint_state(self):
+        '''
+        Everything that changes as the model runs as a dict of JSON values and a dict of
+        arrays, see brains.checkpoint. Fired flags are not kept so checkpoints should be
+        taken between epochs. Rust draws noise from its own unseeded generator which can't
+        be saved.
+        '''
+        state = {"dopamine": self._dopamine,
+                 "fire_count_position": self._fire_counts.position,
+                 "firing_indexes": sorted(self._firing_indexes),
+                 "warping": self._warping,
+                 "last_active": self._last_active,
+                 "warp_until": self._warp_until}
+        arrays = {"voltage": np.array(iron_brains.voltages(self._iron_model)),
+                  "input_current": np.array(iron_brains.input_currents(self._iron_model)),
+                  "calcium": np.array(iron_brains.calciums(self._iron_model)),
+                  "fire_trace": np.array([cell.fire_trace for cell in self._cells],
+                                         dtype=np.int64),
+                  "fire_counts": self._fire_counts.counts,
+                  "recent_fires": self._fire_counts.recent_fires,
+                  "target_input": self._target_input,
+                  "strength": np.array(iron_brains.strengths(self._iron_model)),
+                  "inhibitory_strength": np.array(
+                      iron_brains.inhibitory_strengths(self._iron_model)),
+                  "s_tag": np.array(iron_brains.s_tags(self._iron_model))}
+        return state, arrays
+
+    def restore_state(self, state, arrays):
+        self._dopamine = state["dopamine"]
+        self._firing_indexes = set(state["firing_indexes"])
+        self._warping = state["warping"]
+        self._last_active = state["last_active"]
+        self._warp_until = state["warp_until"]
+        self._fire_counts.counts = np.array(arrays["fire_counts"], dtype=np.int64)
+        self._fire_counts.recent_fires = np.array(arrays["recent_fires"], dtype=np.int64)
+        self._fire_counts.position = state["fire_count_position"]
+        # cells read the balancing arrays they were built with so these are updated in place
+        self._target_input[:] = arrays["target_input"]
+        for cell, fire_trace in zip(self._cells, arrays["fire_trace"].tolist()):
+            cell.fire_trace = fire_trace
+
+        iron_brains.restore_cells(self._iron_model, arrays["voltage"].tolist(),
+                                  arrays["input_current"].tolist(),
+                                  arrays["calcium"].tolist())
+        iron_brains.update_strengths(self._iron_model, arrays["strength"].tolist())
+        iron_brains.update_inhibitory_strengths(self._iron_model,
+                                                arrays["inhibitory_strength"].tolist())
+        iron_brains.update_s_tags(self._iron_model, arrays["s_tag"].tolist())
+
+    def export(self):
+        updated_network_definition = self.export_network_definition()
+        updated_network_definition.assign_uuids()
         blob = {"model_parameters": dataclasses.asdict(self.model_parameters),
                 "network_definition": dataclasses.asdict(updated_network_definition),
-                "version": "1"
+                "version": "2"
                 }
         return blob
 
@@ -465,11 +573,12 @@ class SimpleModel:
         '''
         texts = ["dopamine: " + str(round(self._dopamine, 5))]
         drawables = []
+        voltages = iron_brains.voltages(self._iron_model)
         for cell in self._cells:
             spike = cell.fire_trace > 0
             drawable = {"x": cell.x_display_position,
                         "y": cell.y_display_position,
-                        "strength": cell.membrane_voltage(),
+                        "strength": voltages[cell.index],
                         "spike": spike,
                         "layer_id": cell.layer_id,
                         "layer_x": cell.x_layer_position,
@@ -497,30 +606,28 @@ class SimpleModel:
             # Print information for one cell in the middle layer and one cell in the output layer.
             if (cell.layer_id == 'b' or cell.layer_id == 'c') and cell.output_id == 0:
                 texts.append(f"layer_id {cell.layer_id} " \
-                    f"running_rate {len(cell._fire_history) / cell._fire_history_length} " \
+                    f"running_rate {cell._recent_fires / cell._fire_history_length} " \
                     f"target_rate {cell._target_fire_rate_per_epoch} " \
-                    f"fires {len(cell._fire_history)} " \
+                    f"fires {cell._recent_fires} " \
                     f"target_input {cell._target_input}")
         return texts
 
     def test_outputs(self):
         outputs = {}
+        voltages = iron_brains.voltages(self._iron_model)
         for cell in self._cells:
-            outputs[cell.label] = cell.membrane_voltage()
+            outputs[cell.label] = voltages[cell.index]
 
+        strengths = iron_brains.strengths(self._iron_model)
         for synapse in self.synapses:
             label = f"{synapse.pre_cell.label}_to_{synapse.post_cell.label}"
-            outputs[label] = synapse.strength
+            outputs[label] = strengths[synapse._index]
         return outputs
 
     def outputs(self):
         '''
         Used by pyplot
         '''
-        total_negative_in = 0.0
-        total_positive_in = 0.0
-        total_negative_out = 0.0
-        total_positive_out = 0.0
         cell_to_print = None
         for cell in self._cells:
             correct_position = cell.x_layer_position == 0 and cell.y_layer_position == 0
@@ -530,13 +637,8 @@ class SimpleModel:
         if cell_to_print is None:
             return {}
 
-        for synapse in cell_to_print.input_synapses:
-            total_positive_in += synapse.strength
-            total_negative_in += synapse.inhibitory_strength
-
-        for synapse in cell_to_print.output_synapses:
-            total_positive_out += synapse.strength
-            total_negative_out += synapse.inhibitory_strength
+        (total_positive_in, total_negative_in,
+         total_positive_out, total_negative_out,) = cell_to_print.weight_totals()
         return {"positive_in": total_positive_in,
                 "negative_in": total_negative_in,
                 "positive_out": total_positive_out,
@@ -546,7 +648,6 @@ class SimpleModel:
                        synapse_type_parameters,
                        network_definition,
                        step_size):
-        cells_by_id = {}
         cells = []
         for cell_definition in network_definition.cell_definitions:
             if cell_definition.cell_type == CellType.EXCITATORY:
@@ -557,26 +658,48 @@ class SimpleModel:
                 raise NotImplemented("rust does not support cell types other than excite and inhibit")
             index = iron_brains.add_cell(self._iron_model, rust_cell_type);
             cell_membrane = CellMembrane(self._iron_model, index)
-            cell = Cell(cell_definition, cell_membrane, self._iron_model, index)
-            cells_by_id[cell.uuid] = cell
+            cell = Cell(cell_definition, cell_membrane, self._iron_model, index,
+                        self._fire_counts, self._target_input)
             cells.append(cell)
 
         synapses = []
-        synapses_by_cell_id = defaultdict(list)
+        synapses_by_cell_index = defaultdict(list)
         for synapse_definition in network_definition.synapse_definitions:
-            pre_cell = cells_by_id[synapse_definition.pre_cell_id]
-            post_cell = cells_by_id[synapse_definition.post_cell_id]
+            pre_cell = cells[synapse_definition.pre_cell_index]
+            post_cell = cells[synapse_definition.post_cell_index]
             synapse = Synapse(pre_cell, post_cell,
                               synapse_definition,
                               self._iron_model,
                               pre_cell.index,
                               post_cell.index)
             synapses.append(synapse)
-            synapses_by_cell_id[synapse_definition.pre_cell_id].append(synapse)
-            synapses_by_cell_id[synapse_definition.post_cell_id].append(synapse)
+            synapses_by_cell_index[synapse_definition.pre_cell_index].append(synapse)
+            synapses_by_cell_index[synapse_definition.post_cell_index].append(synapse)
 
-        for cell_id, cell_synapses in synapses_by_cell_id.items():
-            cell = cells_by_id[cell_id]
-            cell.attach_synapses(cell_synapses)
+        for cell_index, cell_synapses in synapses_by_cell_index.items():
+            cells[cell_index].attach_synapses(cell_synapses)
 
         return cells, synapses
+
+    def _build_balance_arrays(self):
+        self._pre_cell_indexes = np.array([synapse.pre_cell.index for synapse in self.synapses],
+                                          dtype=np.int64)
+        self._post_cell_indexes = np.array(
+            [synapse.post_cell.index for synapse in self.synapses], dtype=np.int64)
+        self._excitatory_cells = np.array(
+            [cell.cell_type == CellType.EXCITATORY for cell in self._cells], dtype=bool)
+        self._inhibitory_cells = np.array(
+            [cell.cell_type == CellType.INHIBITORY for cell in self._cells], dtype=bool)
+        self._output_balance_enabled = np.array([cell._output_balance for cell in self._cells],
+                                                dtype=bool)
+        self._input_balance = np.array([cell._input_balance for cell in self._cells],
+                                       dtype=bool)
+        self._lock_inhibition_strength = np.array(
+            [cell._lock_inhibition_strength for cell in self._cells], dtype=bool)
+        self._target_fire_rate_per_epoch = np.array(
+            [cell._target_fire_rate_per_epoch for cell in self._cells], dtype=float)
+
+        # cells start out targeting the input they were built with
+        strength = np.array(iron_brains.strengths(self._iron_model))
+        self._target_input[:] = homeostasis.segment_sums(strength, self._post_cell_indexes,
+                                                         len(self._cells))
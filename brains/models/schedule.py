@@ -0,0 +1,59 @@
+import numpy as np
+
+# A model normally gets its stimuli, reward and whether the environment is active from the
+# driver loop one step at a time. A StepSchedule holds them for a run of steps worked out
+# ahead of time so a model can advance through the whole run in one call and hand back
+# the output cells that fired as (step, output_id) events.
+
+EMPTY_EVENTS = np.zeros((0, 2), dtype=np.int64)
+
+class StepSchedule:
+    '''
+    stimuli_by_step: stimuli for the steps that have any
+    reward_steps: steps dopamine is released on
+    active_steps: steps the environment is active on, warping stops for them
+    '''
+    def __init__(self, stimuli_by_step=None, reward_steps=(), active_steps=()):
+        self.stimuli_by_step = {} if stimuli_by_step is None else stimuli_by_step
+        self.reward_steps = set(reward_steps)
+        self.active_steps = set(active_steps)
+
+    def stimuli(self, step):
+        return self.stimuli_by_step.get(step)
+
+    def has_reward(self, step, output_events):
+        '''
+        output_events: (step, output_id) events from earlier steps of the run
+        '''
+        return step in self.reward_steps
+
+    def active(self, step):
+        return step in self.active_steps
+
+    def possible_reward_steps(self):
+        '''
+        Steps has_reward can be True on. Models that run through steps natively only stop
+        to ask about rewards on these.
+        '''
+        return self.reward_steps
+
+def events_array(output_events):
+    if not output_events:
+        return EMPTY_EVENTS.copy()
+    return np.array(output_events, dtype=np.int64)
+
+def run_steps(model, step, number_of_steps, schedule, warp_allowed=False):
+    '''
+    Steps model from step for number_of_steps steps taking everything from schedule.
+    Returns an array with a (step, output_id) row for every output cell fire.
+    '''
+    output_events = []
+    for current_step in range(step, step + number_of_steps):
+        output_ids = model.step(current_step,
+                                schedule.stimuli(current_step),
+                                schedule.has_reward(current_step, output_events),
+                                schedule.active(current_step),
+                                warp_allowed=warp_allowed)
+        if output_ids:
+            output_events.extend((current_step, output_id) for output_id in output_ids)
+    return events_array(output_events)
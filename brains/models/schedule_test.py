@@ -0,0 +1,72 @@
+import brains.models.integrate_model as integrate_model
+import brains.models.numpy_model as numpy_model
+import brains.models.simple_model_builder as simple_model_builder
+import brains.network_definitions as network_definitions
+from brains.environment.easy import EasyEnvironment
+from brains.models.schedule import StepSchedule
+
+import random
+import unittest
+
+def record_schedule(model, environment, steps):
+    '''
+    Runs model against environment the way main does and returns a StepSchedule of
+    everything the environment gave the model.
+    '''
+    schedule = StepSchedule()
+    output_ids = []
+    for i in range(steps):
+        environment.step(i, output_ids)
+        stimuli = environment.stimuli(i)
+        has_reward = environment.has_reward()
+        active = environment.active(i)
+        schedule.stimuli_by_step[i] = stimuli
+        if has_reward:
+            schedule.reward_steps.add(i)
+        if active:
+            schedule.active_steps.add(i)
+        output_ids = model.step(i, stimuli, has_reward, active)
+    return schedule
+
+class TestStepSchedule(unittest.TestCase):
+
+    def test_run_steps_matches_step(self):
+        model_parameters = simple_model_builder.handwriting_model_parameters()
+        model_parameters.synapse_type_parameters.max_strength = 0.4
+        network_definition = network_definitions.easy_layer_network()
+        for model_module in [integrate_model, numpy_model]:
+            model = model_module.SimpleModel(network_definition, model_parameters)
+            schedule = record_schedule(model, EasyEnvironment(400, 50), 4000)
+            self.assertTrue(schedule.reward_steps)
+
+            # the environment also draws from random so the models replay without it
+            random.seed(0)
+            model = model_module.SimpleModel(network_definition, model_parameters)
+            output_events = []
+            for i in range(4000):
+                output_ids = model.step(i, schedule.stimuli(i), i in schedule.reward_steps,
+                                        schedule.active(i))
+                output_events.extend([i, output_id] for output_id in output_ids)
+
+            random.seed(0)
+            scheduled_model = model_module.SimpleModel(network_definition, model_parameters)
+            events = scheduled_model.run_steps(0, 50, schedule).tolist()
+            for epoch in range(9):
+                events += scheduled_model.run_epoch(50 + epoch * 400, schedule).tolist()
+            events += scheduled_model.run_steps(3650, 350, schedule).tolist()
+            self.assertEqual(events, output_events)
+            self.assertEqual(scheduled_model.test_outputs(), model.test_outputs())
+
+    def test_possible_reward_steps(self):
+        schedule = StepSchedule(reward_steps=[3, 7])
+        self.assertEqual(schedule.possible_reward_steps(), {3, 7})
+        self.assertEqual(StepSchedule().possible_reward_steps(), set())
+
+    def test_empty_run(self):
+        model_parameters = simple_model_builder.ModelParameters()
+        network_definition = network_definitions.stdp_test_network()
+        model = numpy_model.SimpleModel(network_definition, model_parameters)
+        self.assertEqual(model.run_steps(0, 10, StepSchedule()).shape, (0, 2))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -52,7 +52,11 @@ def handwriting_model_parameters(epoch_length=400,
                            epoch_length=epoch_length,
                            epoch_delay=epoch_delay)
 
-def import_model(blob, model_module):
+def import_definitions(blob):
     network_definition = NetworkDefinition(**blob["network_definition"])
     model_parameters = ModelParameters(**blob["model_parameters"])
+    return network_definition, model_parameters
+
+def import_model(blob, model_module):
+    network_definition, model_parameters = import_definitions(blob)
     return model_module.SimpleModel(network_definition, model_parameters)
@@ -0,0 +1,36 @@
+import numpy as np
+
+class SynapseIndex:
+    '''
+    Compressed index from cells to the synapses attached to them.
+
+    Built from the pre cell index of every synapse it is a compressed sparse row index of
+    outgoing synapses. Built from the post cell index it is the compressed sparse column
+    index of incoming synapses. The synapses of cell i are
+    synapse_indexes[offsets[i]:offsets[i + 1]] in the order they were defined.
+    '''
+    def __init__(self, cell_indexes, number_of_cells):
+        cell_indexes = np.asarray(cell_indexes, dtype=np.int64)
+        self.synapse_indexes = np.argsort(cell_indexes, kind='stable')
+        self.offsets = np.zeros(number_of_cells + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cell_indexes, minlength=number_of_cells), out=self.offsets[1:])
+
+    def synapses(self, cell_index):
+        return self.synapse_indexes[self.offsets[cell_index]:self.offsets[cell_index + 1]]
+
+    def counts(self):
+        return np.diff(self.offsets)
+
+    def gather(self, cell_indexes):
+        '''
+        Synapses of all the given cells in one array. Cells are visited in the order given.
+        '''
+        starts = self.offsets[cell_indexes]
+        lengths = self.offsets[cell_indexes + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        ends = np.cumsum(lengths)
+        positions = np.arange(total) + np.repeat(starts - (ends - lengths), lengths)
+        return self.synapse_indexes[positions]
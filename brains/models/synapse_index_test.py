@@ -0,0 +1,25 @@
+from brains.models.synapse_index import SynapseIndex
+
+import numpy as np
+import unittest
+
+class TestSynapseIndex(unittest.TestCase):
+
+    def test_synapses_by_cell(self):
+        pre_cell_indexes = [2, 0, 2, 1, 0, 2]
+        index = SynapseIndex(pre_cell_indexes, 4)
+        self.assertEqual(list(index.synapses(0)), [1, 4])
+        self.assertEqual(list(index.synapses(1)), [3])
+        self.assertEqual(list(index.synapses(2)), [0, 2, 5])
+        self.assertEqual(list(index.synapses(3)), [])
+        self.assertEqual(list(index.counts()), [2, 1, 3, 0])
+
+    def test_gather(self):
+        pre_cell_indexes = [2, 0, 2, 1, 0, 2]
+        index = SynapseIndex(pre_cell_indexes, 4)
+        self.assertEqual(list(index.gather(np.array([2, 3, 0]))), [0, 2, 5, 1, 4])
+        self.assertEqual(list(index.gather(np.array([3]))), [])
+        self.assertEqual(list(index.gather(np.array([], dtype=np.int64))), [])
+
+if __name__ == '__main__':
+    unittest.main()
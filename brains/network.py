@@ -1,8 +1,9 @@
 import brains.utils as utils
 
-from dataclasses import dataclass, field
+from dataclasses import dataclass
+import copy
+import numpy as np
 import random
-from collections import defaultdict
 from enum import IntEnum
 import uuid
 from collections import namedtuple
@@ -21,7 +22,10 @@ class CellDefinition:
     '''
     Exported to files
 
-    uuid : unique identifier
+    Cells are identified by their index in NetworkDefinition.cell_definitions.
+
+    uuid : unique identifier for use outside the program. Only generated when asked for with
+        get_uuid or when the network is exported.
     label: what is displayed on pyplots
     Grid position: refer to grid of all cells in the model and
         corresponds to locations in the environment. This is different from
@@ -45,7 +49,12 @@ class CellDefinition:
     y_layer_position: int = 0
     output_balance: bool = False
     lock_inhibition_strength: bool = False
-    uuid: str = field(default_factory=lambda:str(uuid.uuid4()))
+    uuid: str = None
+
+    def get_uuid(self):
+        if self.uuid is None:
+            self.uuid = str(uuid.uuid4())
+        return self.uuid
 
     def export_network_information(self):
         return (self.label, self.x_display_position, self.y_display_position)
@@ -54,20 +63,136 @@ class CellDefinition:
 class SynapseDefinition:
     '''
     Exported to files
+
+    pre_cell_index and post_cell_index: indexes into NetworkDefinition.cell_definitions
+    label: only set when it should be something other than "{pre label}_to_{post label}"
     '''
-    label: str
-    pre_cell_id: str
-    post_cell_id: str
+    pre_cell_index: int
+    post_cell_index: int
     starting_strength: float = 0.0
     starting_inhibitory_strength: float = 0.0
     unsupervised_stdp: bool = False
     reward_scalar: float = 0.1
     s_tag_decay_rate: float = 0.002
+    label: str = None
+
+SYNAPSE_FIELDS = [("pre_cell_index", np.int64),
+                  ("post_cell_index", np.int64),
+                  ("starting_strength", float),
+                  ("starting_inhibitory_strength", float),
+                  ("unsupervised_stdp", bool),
+                  ("reward_scalar", float),
+                  ("s_tag_decay_rate", float)]
+
+class SynapseArrays:
+    '''
+    Synapse definitions stored as one array for each SynapseDefinition field. Built in bulk
+    by network_from_layers and by binary model file loading and read directly by the array
+    backends.
+
+    Indexing or iterating gives SynapseViews so code written for lists of SynapseDefinitions
+    still works. Setting a field on a view changes the arrays.
+
+    labels: only the labels that are not the default pre_to_post, by synapse index
+    '''
+    def __init__(self, pre_cell_index, post_cell_index, starting_strength,
+                 starting_inhibitory_strength, unsupervised_stdp, reward_scalar,
+                 s_tag_decay_rate, labels=None):
+        self.pre_cell_index = pre_cell_index
+        self.post_cell_index = post_cell_index
+        self.starting_strength = starting_strength
+        self.starting_inhibitory_strength = starting_inhibitory_strength
+        self.unsupervised_stdp = unsupervised_stdp
+        self.reward_scalar = reward_scalar
+        self.s_tag_decay_rate = s_tag_decay_rate
+        self.labels = {} if labels is None else labels
+
+    @classmethod
+    def from_definitions(cls, synapse_definitions):
+        columns = [np.array([getattr(synapse, name) for synapse in synapse_definitions],
+                            dtype=dtype)
+                   for name, dtype in SYNAPSE_FIELDS]
+        labels = {index: synapse.label for index, synapse in enumerate(synapse_definitions)
+                  if synapse.label is not None}
+        return cls(*columns, labels=labels)
+
+    @classmethod
+    def concatenate(cls, synapse_arrays_list):
+        columns = [np.concatenate([np.zeros(0, dtype=dtype)]
+                                  + [getattr(synapse_arrays, name)
+                                     for synapse_arrays in synapse_arrays_list])
+                   for name, dtype in SYNAPSE_FIELDS]
+        labels = {}
+        offset = 0
+        for synapse_arrays in synapse_arrays_list:
+            for index, label in synapse_arrays.labels.items():
+                labels[index + offset] = label
+            offset += len(synapse_arrays)
+        return cls(*columns, labels=labels)
+
+    def definitions(self):
+        '''
+        A list of SynapseDefinitions with the same values.
+        '''
+        columns = [getattr(self, name).tolist() for name, _ in SYNAPSE_FIELDS]
+        return [SynapseDefinition(*values, label=self.labels.get(index))
+                for index, values in enumerate(zip(*columns))]
+
+    def __len__(self):
+        return len(self.pre_cell_index)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("synapse index out of range")
+        return SynapseView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield SynapseView(self, index)
+
+def _synapse_field(name):
+    def get(self):
+        return getattr(self._synapse_arrays, name)[self._index].item()
+
+    def set(self, value):
+        getattr(self._synapse_arrays, name)[self._index] = value
+    return property(get, set)
+
+class SynapseView:
+    '''
+    One synapse of a SynapseArrays with the attributes of a SynapseDefinition.
+    '''
+    def __init__(self, synapse_arrays, index):
+        self._synapse_arrays = synapse_arrays
+        self._index = index
+
+    pre_cell_index = _synapse_field("pre_cell_index")
+    post_cell_index = _synapse_field("post_cell_index")
+    starting_strength = _synapse_field("starting_strength")
+    starting_inhibitory_strength = _synapse_field("starting_inhibitory_strength")
+    unsupervised_stdp = _synapse_field("unsupervised_stdp")
+    reward_scalar = _synapse_field("reward_scalar")
+    s_tag_decay_rate = _synapse_field("s_tag_decay_rate")
+
+    @property
+    def label(self):
+        return self._synapse_arrays.labels.get(self._index)
+
+    @label.setter
+    def label(self, label):
+        if label is None:
+            self._synapse_arrays.labels.pop(self._index, None)
+        else:
+            self._synapse_arrays.labels[self._index] = label
 
 @dataclass
 class NetworkDefinition:
     '''
     Exported to files
+
+    synapse_definitions: a list of SynapseDefinitions or a SynapseArrays
     '''
     cell_definitions: list
     synapse_definitions: list
@@ -83,25 +208,69 @@ class NetworkDefinition:
             else:
                 new_cell_definitions.append(cell_definition)
         self.cell_definitions = new_cell_definitions
-        
+
+        if isinstance(self.synapse_definitions, SynapseArrays):
+            return
+
         new_synapse_definitions = []
+        cell_indexes_by_uuid = None
         for synapse_definition in self.synapse_definitions:
             if isinstance(synapse_definition, dict):
+                if "pre_cell_id" in synapse_definition:
+                    # older exports refer to cells by uuid
+                    if cell_indexes_by_uuid is None:
+                        cell_indexes_by_uuid = {cell.uuid: index for index, cell
+                                                in enumerate(self.cell_definitions)}
+                    synapse_definition = dict(synapse_definition)
+                    synapse_definition["pre_cell_index"] = cell_indexes_by_uuid[
+                        synapse_definition.pop("pre_cell_id")]
+                    synapse_definition["post_cell_index"] = cell_indexes_by_uuid[
+                        synapse_definition.pop("post_cell_id")]
                 new_synapse_definitions.append(SynapseDefinition(**synapse_definition))
             else:
                 new_synapse_definitions.append(synapse_definition)
         self.synapse_definitions = new_synapse_definitions
 
+    def synapse_arrays(self):
+        '''
+        The synapses as a SynapseArrays. When the network was built from arrays these are
+        the same arrays so changing them changes the network.
+        '''
+        if isinstance(self.synapse_definitions, SynapseArrays):
+            return self.synapse_definitions
+        return SynapseArrays.from_definitions(self.synapse_definitions)
+
+    def with_synapse_list(self):
+        '''
+        The same network with synapses as a list of SynapseDefinitions as json exports need.
+        '''
+        if isinstance(self.synapse_definitions, SynapseArrays):
+            return NetworkDefinition(self.cell_definitions,
+                                     self.synapse_definitions.definitions())
+        return self
+
+    def synapse_label(self, synapse_definition):
+        if synapse_definition.label is not None:
+            return synapse_definition.label
+        pre_cell = self.cell_definitions[synapse_definition.pre_cell_index]
+        post_cell = self.cell_definitions[synapse_definition.post_cell_index]
+        return f"{pre_cell.label}_to_{post_cell.label}"
+
+    def assign_uuids(self):
+        '''
+        Gives every cell a uuid before exporting.
+        '''
+        for cell_definition in self.cell_definitions:
+            cell_definition.get_uuid()
+
     def export_as_tuples(self):
-        cells_by_uuid = {}
         cell_infos = []
         for cell in self.cell_definitions:
-            cells_by_uuid[cell.uuid] = cell
             cell_infos.append(cell.export_network_information())
         synapse_infos = []
         for synapse in self.synapse_definitions:
-            pre_cell = cells_by_uuid[synapse.pre_cell_id]
-            post_cell = cells_by_uuid[synapse.post_cell_id]
+            pre_cell = self.cell_definitions[synapse.pre_cell_index]
+            post_cell = self.cell_definitions[synapse.post_cell_index]
             synapse_info = (pre_cell.label,
                             post_cell.label,
                             synapse.starting_strength,
@@ -149,6 +318,17 @@ class Layer:
         y = cell_number // self.width()
         return (x, y,)
 
+    def cell_layer_positions(self):
+        '''
+        cell_layer_position for every cell in the layer.
+        '''
+        if self.layout == Layout.LINE:
+            return [(0, cell_number,) for cell_number in range(self.size)]
+
+        width = self.width()
+        return [(cell_number % width, cell_number // width,)
+                for cell_number in range(self.size)]
+
     def width(self):
         if self.layout == Layout.LINE:
             return 1
@@ -199,18 +379,50 @@ def add_display_position_to_layers(layers):
         previous_x_position = display_x_position
         previous_width =  layer.width()
 
-def network_from_layers(layers, layer_connections):
+# networks by their layers, connections and seed, None unless keep_built_networks was called
+_built_networks = None
+
+def keep_built_networks():
+    '''
+    Keeps every network built by network_from_layers for the rest of the process so
+    building the same one again only copies it.
+    '''
+    global _built_networks
+    if _built_networks is None:
+        _built_networks = {}
+
+def network_from_layers(layers, layer_connections, seed=None):
+    '''
+    Synapses are generated a whole layer connection at a time as SynapseArrays. Without a
+    seed the generator is seeded from random so random.seed still makes networks repeatable.
+    '''
+    if seed is None:
+        seed = random.getrandbits(64)
+    if _built_networks is None:
+        return _build_network_from_layers(layers, layer_connections, seed)
+
+    key = (repr(layers), repr(layer_connections), seed)
+    if key not in _built_networks:
+        _built_networks[key] = _build_network_from_layers(layers, layer_connections, seed)
+    return copy.deepcopy(_built_networks[key])
+
+def _build_network_from_layers(layers, layer_connections, seed):
+    rng = np.random.default_rng(seed)
+
     cell_definitions = []
-    cell_definitions_by_layer = defaultdict(list)
+    cell_indexes_by_layer = {}
     for layer in layers:
-        for cell_number in range(layer.size):
-            (x_display_position, y_display_position,) = layer.cell_display_position(
-                cell_number)
-            (x_input_position, y_input_position,) = layer.cell_input_position(cell_number)
-            (x_layer_position, y_layer_position,) = layer.cell_layer_position(cell_number)
+        start_index = len(cell_definitions)
+        for cell_number, (x_layer_position, y_layer_position,) in enumerate(
+                layer.cell_layer_positions()):
+            if layer.is_input_layer:
+                x_input_position, y_input_position = x_layer_position, y_layer_position
+            else:
+                x_input_position, y_input_position = 0, 0
             label = f"{layer.id}_{cell_number}"
             cell_definition = CellDefinition(label,
-                                             x_display_position, y_display_position,
+                                             layer.display_x_position + x_layer_position,
+                                             layer.display_y_position + y_layer_position,
                                              layer.is_input_layer,
                                              x_input_position, y_input_position,
                                              layer.is_output_layer,
@@ -222,92 +434,96 @@ def network_from_layers(layers, layer_connections):
                                              layer.output_balance,
                                              layer.lock_inhibition_strength)
             cell_definitions.append(cell_definition)
-            cell_definitions_by_layer[layer.id].append(cell_definition)
+        cell_indexes_by_layer[layer.id] = np.arange(start_index, len(cell_definitions))
 
-    synapse_definitions = []
+    synapse_arrays_list = []
     for layer_connection in layer_connections:
-        synapse_definitions += connect_layers(layer_connection, cell_definitions_by_layer)
+        synapse_arrays_list.append(connect_layers(layer_connection, cell_definitions,
+                                                  cell_indexes_by_layer, rng))
 
     return NetworkDefinition(cell_definitions,
-                             synapse_definitions)
+                             SynapseArrays.concatenate(synapse_arrays_list))
 
-def connect_layers(layer_connection, cell_definitions_by_layer):
+def connect_layers(layer_connection, cell_definitions, cell_indexes_by_layer, rng):
     if layer_connection.define_by_inputs_per_cell:
-        return connect_layers_with_random_selection(layer_connection, cell_definitions_by_layer)
+        return connect_layers_with_random_selection(layer_connection, cell_definitions,
+                                                    cell_indexes_by_layer, rng)
     else:
-        return connect_layers_by_cell(layer_connection, cell_definitions_by_layer)
-
-def connect_cells(layer_connection, cell_definition_pre_layer, cell_definition_post_layer):
-    if cell_definition_pre_layer.cell_type == CellType.MIXED:
-        negative_synapse_strength = layer_connection.synapse_strength
-        positive_synapse_strength = layer_connection.synapse_strength
-    if cell_definition_pre_layer.cell_type == CellType.EXCITATORY:
-        positive_synapse_strength = layer_connection.synapse_strength
-        negative_synapse_strength = 0.0
-    if cell_definition_pre_layer.cell_type == CellType.INHIBITORY:
-        negative_synapse_strength = layer_connection.synapse_strength
-        positive_synapse_strength = 0.0
-    label = f"{cell_definition_pre_layer.label}_to_{cell_definition_post_layer.label}"
-    return SynapseDefinition(
-        label,
-        cell_definition_pre_layer.uuid,
-        cell_definition_post_layer.uuid,
+        return connect_layers_by_cell(layer_connection, cell_definitions,
+                                      cell_indexes_by_layer, rng)
+
+def connect_cells(layer_connection, cell_definitions, pre_cell_indexes, post_cell_indexes):
+    '''
+    SynapseArrays connecting each pre cell to the post cell at the same position.
+    '''
+    pre_cells, synapse_pre_cells = np.unique(pre_cell_indexes, return_inverse=True)
+    pre_cell_types = np.array([cell_definitions[index].cell_type for index in pre_cells.tolist()],
+                              dtype=np.int64)[synapse_pre_cells]
+
+    strength = layer_connection.synapse_strength
+    number_of_synapses = len(pre_cell_indexes)
+    positive_synapse_strength = np.where(pre_cell_types == CellType.INHIBITORY, 0.0, strength)
+    negative_synapse_strength = np.where(pre_cell_types == CellType.EXCITATORY, 0.0, strength)
+    return SynapseArrays(
+        np.asarray(pre_cell_indexes, dtype=np.int64),
+        np.asarray(post_cell_indexes, dtype=np.int64),
         positive_synapse_strength,
         negative_synapse_strength,
-        layer_connection.unsupervised_stdp,
-        layer_connection.reward_scalar,
-        layer_connection.s_tag_decay_rate)
-
+        np.full(number_of_synapses, layer_connection.unsupervised_stdp, dtype=bool),
+        np.full(number_of_synapses, layer_connection.reward_scalar, dtype=float),
+        np.full(number_of_synapses, layer_connection.s_tag_decay_rate, dtype=float))
+
+def connect_layers_by_cell(layer_connection, cell_definitions, cell_indexes_by_layer, rng):
+    pre_layer_cell_indexes = cell_indexes_by_layer[layer_connection.pre_layer]
+    post_layer_cell_indexes = cell_indexes_by_layer[layer_connection.post_layer]
+    connected = layer_connection.probability >= rng.random(
+        (len(pre_layer_cell_indexes), len(post_layer_cell_indexes)))
+    pre_positions, post_positions = np.nonzero(connected)
+    return connect_cells(layer_connection, cell_definitions,
+                         pre_layer_cell_indexes[pre_positions],
+                         post_layer_cell_indexes[post_positions])
+
+def connect_layers_with_random_selection(layer_connection, cell_definitions,
+                                         cell_indexes_by_layer, rng):
+    '''
+    Each post cell gets inputs_per_cell different pre cells. Pre cells are all used once
+    before any is used again.
 
-def connect_layers_by_cell(layer_connection, cell_definitions_by_layer):
-    synapse_definitions = []
-    for cell_definition_pre_layer in cell_definitions_by_layer[layer_connection.pre_layer]:
-        for cell_definition_post_layer in cell_definitions_by_layer[layer_connection.post_layer]:
-            if layer_connection.probability >= random.random():
-                synapse_definition = connect_cells(layer_connection,
-                                                   cell_definition_pre_layer,
-                                                   cell_definition_post_layer)
-                synapse_definitions.append(synapse_definition)
-    return synapse_definitions
-
-def connect_layers_with_random_selection(layer_connection, cell_definitions_by_layer):
-    synapse_definitions = []
-    pre_layer_cells = cell_definitions_by_layer[layer_connection.pre_layer]
-    pre_layer_cell_by_id = {}
-    for pre_layer_cell in pre_layer_cells:
-        pre_layer_cell_by_id[pre_layer_cell.uuid] = pre_layer_cell
-
-    pre_layer_cell_ids = set(pre_layer_cell_by_id.keys())
-    
-    for post_layer_cell in cell_definitions_by_layer[layer_connection.post_layer]:
-        pre_layer_cell_ids_to_connect = random.sample(pre_layer_cell_ids,
-                                                      layer_connection.inputs_per_cell)
-        for pre_layer_cell_id in pre_layer_cell_ids_to_connect:
-            synapse_definition = connect_cells(layer_connection,
-                                               pre_layer_cell_by_id[pre_layer_cell_id],
-                                               post_layer_cell)
-            synapse_definitions.append(synapse_definition)
-        pre_layer_cell_ids = pre_layer_cell_ids - set(pre_layer_cell_ids_to_connect)
-        if len(pre_layer_cell_ids) < layer_connection.inputs_per_cell:
-            pre_layer_cell_ids = set(pre_layer_cell_by_id.keys())
-        
-    return synapse_definitions
+    Post cells take consecutive blocks of a shuffled pre layer. When fewer than
+    inputs_per_cell cells are left the leftovers are dropped and a new shuffle starts, so
+    every shuffle serves pre layer size // inputs_per_cell post cells.
+    '''
+    pre_layer_cell_indexes = cell_indexes_by_layer[layer_connection.pre_layer]
+    post_layer_cell_indexes = cell_indexes_by_layer[layer_connection.post_layer]
+    inputs_per_cell = layer_connection.inputs_per_cell
+    if inputs_per_cell > len(pre_layer_cell_indexes):
+        raise ValueError(f"layer {layer_connection.pre_layer} has fewer than "
+                         f"{inputs_per_cell} cells to connect to each post cell")
+    if inputs_per_cell == 0 or len(post_layer_cell_indexes) == 0:
+        return connect_cells(layer_connection, cell_definitions,
+                             np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+    post_cells_per_shuffle = len(pre_layer_cell_indexes) // inputs_per_cell
+    number_of_shuffles = -(-len(post_layer_cell_indexes) // post_cells_per_shuffle)
+    shuffles = rng.permuted(np.tile(np.arange(len(pre_layer_cell_indexes)),
+                                    (number_of_shuffles, 1)), axis=1)
+    pre_positions = shuffles[:, :post_cells_per_shuffle * inputs_per_cell].reshape(
+        -1)[:len(post_layer_cell_indexes) * inputs_per_cell]
+    return connect_cells(layer_connection, cell_definitions,
+                         pre_layer_cell_indexes[pre_positions],
+                         np.repeat(post_layer_cell_indexes, inputs_per_cell))
 
 
 def network_from_cells(cell_definitions,
                        synapses):
-    cell_definitions_by_label = {}
-    for definition in cell_definitions:
-        cell_definitions_by_label[definition.label] = definition
+    cell_indexes_by_label = {}
+    for index, definition in enumerate(cell_definitions):
+        cell_indexes_by_label[definition.label] = index
 
     synapse_definitions = []
     for (pre_cell_label, post_cell_label, strength) in synapses:
-        pre_cell_definition = cell_definitions_by_label[pre_cell_label]
-        post_cell_definition = cell_definitions_by_label[post_cell_label]
-        label = f"{pre_cell_definition.label}_to_{post_cell_definition.label}"
-        synapse_definition = SynapseDefinition(label,
-                                               pre_cell_definition.uuid,
-                                               post_cell_definition.uuid,
+        synapse_definition = SynapseDefinition(cell_indexes_by_label[pre_cell_label],
+                                               cell_indexes_by_label[post_cell_label],
                                                strength, strength)
         synapse_definitions.append(synapse_definition)
 
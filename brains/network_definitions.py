@@ -70,7 +70,7 @@ def easy_layer_network():
     return network_from_layers(layers, layer_connections)
 
 
-def layer_based_default_network():
+def layer_based_default_network(number_of_outputs=2):
     '''
       Used for the x o world
     '''
@@ -94,7 +94,7 @@ def layer_based_default_network():
                     input_balance = True,
                     output_balance = True,
                     lock_inhibition_strength = False),
-              Layer("c", 2,
+              Layer("c", number_of_outputs,
                     layout = Layout.LINE,
                     is_output_layer = True,
                     target_fire_rate_per_epoch = 0.5,
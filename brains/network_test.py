@@ -1,5 +1,8 @@
 from brains.network import LayerConnection, Layer, CellType, CellDefinition
-from brains.network import network_from_layers, network_from_cells
+from brains.network import network_from_layers, network_from_cells, NetworkDefinition
+from brains.network import SynapseArrays, SynapseDefinition
+import brains.network as network
+import random
 import unittest
 
 
@@ -56,6 +59,114 @@ class TestBuildingNetwork(unittest.TestCase):
                              ("b_1", "c_0", 0.1, False, 0.1, 0.002),]
         self.assertCountEqual(synapses, expected_synapses)
 
+    def test_lazy_identity(self):
+        cells = [CellDefinition("a", 0, 0), CellDefinition("b", 1, 0)]
+        network_definition = network_from_cells(cells, [("a", "b", 0.15)])
+        synapse_definition = network_definition.synapse_definitions[0]
+        self.assertEqual((synapse_definition.pre_cell_index,
+                          synapse_definition.post_cell_index), (0, 1))
+        self.assertEqual(network_definition.synapse_label(synapse_definition), "a_to_b")
+        self.assertIsNone(cells[0].uuid)
+
+        network_definition.assign_uuids()
+        uuid = cells[0].uuid
+        self.assertIsNotNone(uuid)
+        self.assertEqual(cells[0].get_uuid(), uuid)
+
+    def test_import_uuid_references(self):
+        blob = {"cell_definitions": [{"label": "a", "x_display_position": 0,
+                                      "y_display_position": 0, "uuid": "first"},
+                                     {"label": "b", "x_display_position": 1,
+                                      "y_display_position": 0, "uuid": "second"}],
+                "synapse_definitions": [{"label": "a_to_b", "pre_cell_id": "second",
+                                         "post_cell_id": "first",
+                                         "starting_strength": 0.2}]}
+        network_definition = NetworkDefinition(**blob)
+        synapse_definition = network_definition.synapse_definitions[0]
+        self.assertEqual((synapse_definition.pre_cell_index,
+                          synapse_definition.post_cell_index), (1, 0))
+        self.assertEqual(synapse_definition.starting_strength, 0.2)
+        self.assertEqual(network_definition.cell_definitions[1].uuid, "second")
+
+    def test_seeded_layer_connections(self):
+        layers = [Layer("a", 20, is_input_layer=True),
+                  Layer("i", 5, cell_type=CellType.INHIBITORY),
+                  Layer("b", 30)]
+        layer_connections = [LayerConnection("a", "b", 0.1, probability=0.5),
+                             LayerConnection("i", "b", 0.2, unsupervised_stdp=True)]
+        first = network_from_layers(layers, layer_connections, seed=3).synapse_arrays()
+        second = network_from_layers(layers, layer_connections, seed=3).synapse_arrays()
+        self.assertEqual(first.definitions(), second.definitions())
+        self.assertLess(len(first), 20 * 30 + 5 * 30)
+        self.assertGreater(len(first), 5 * 30)
+
+        for synapse in first:
+            if synapse.pre_cell_index < 20:
+                self.assertEqual((synapse.starting_strength,
+                                  synapse.starting_inhibitory_strength), (0.1, 0.0))
+                self.assertFalse(synapse.unsupervised_stdp)
+            else:
+                self.assertEqual((synapse.starting_strength,
+                                  synapse.starting_inhibitory_strength), (0.0, 0.2))
+                self.assertTrue(synapse.unsupervised_stdp)
+
+    def test_inputs_per_cell(self):
+        layers = [Layer("a", 10), Layer("b", 7)]
+        layer_connections = [LayerConnection("a", "b", 0.1, define_by_inputs_per_cell=True,
+                                             inputs_per_cell=3)]
+        synapse_arrays = network_from_layers(layers, layer_connections,
+                                             seed=5).synapse_arrays()
+        self.assertEqual(len(synapse_arrays), 7 * 3)
+        self.assertEqual(synapse_arrays.post_cell_index.tolist(),
+                         sorted(list(range(10, 17)) * 3))
+
+        pre_cell_indexes = synapse_arrays.pre_cell_index.reshape(7, 3)
+        for inputs in pre_cell_indexes:
+            self.assertEqual(len(set(inputs.tolist())), 3)
+        # three post cells use up nine of the ten pre cells before a new shuffle
+        for start in range(0, 7, 3):
+            shuffle_inputs = pre_cell_indexes[start:start + 3].reshape(-1).tolist()
+            self.assertEqual(len(set(shuffle_inputs)), len(shuffle_inputs))
+
+        again = network_from_layers(layers, layer_connections, seed=5).synapse_arrays()
+        self.assertEqual(again.pre_cell_index.tolist(), synapse_arrays.pre_cell_index.tolist())
+
+    def test_synapse_arrays(self):
+        layers = [Layer("a", 2), Layer("b", 2)]
+        network_definition = network_from_layers(layers, [LayerConnection("a", "b", 0.1)])
+        synapse_definition = network_definition.synapse_definitions[-1]
+        synapse_definition.starting_strength = 0.3
+        synapse_definition.label = "special"
+        self.assertEqual(network_definition.synapse_arrays().starting_strength.tolist(),
+                         [0.1, 0.1, 0.1, 0.3])
+        self.assertEqual(network_definition.synapse_label(synapse_definition), "special")
+        first_synapse = network_definition.synapse_definitions[0]
+        self.assertEqual(network_definition.synapse_label(first_synapse), "a_0_to_b_0")
+
+        synapse_list = network_definition.with_synapse_list().synapse_definitions
+        self.assertEqual(synapse_list[-1], SynapseDefinition(1, 3, 0.3, label="special"))
+        self.assertEqual(SynapseArrays.from_definitions(synapse_list).definitions(), synapse_list)
+
+    def test_kept_networks(self):
+        self.addCleanup(setattr, network, "_built_networks", None)
+        layers = [Layer("a", 4, is_input_layer=True), Layer("b", 4, is_output_layer=True)]
+        layer_connections = [LayerConnection("a", "b", 0.1, 0.5)]
+        random.seed(0)
+        built = network_from_layers(layers, layer_connections).export_as_tuples()
+
+        network.keep_built_networks()
+        random.seed(0)
+        first = network_from_layers(layers, layer_connections)
+        first.synapse_definitions[0].starting_strength = 0.3
+        random.seed(0)
+        second = network_from_layers(layers, layer_connections)
+        # a kept network is copied so changes to one build do not reach the next
+        self.assertEqual(second.export_as_tuples(), built)
+        self.assertEqual(len(network._built_networks), 1)
+        random.seed(1)
+        network_from_layers(layers, layer_connections)
+        self.assertEqual(len(network._built_networks), 2)
+
 
 if __name__ == '__main__':
     unittest.main()
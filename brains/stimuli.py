@@ -0,0 +1,75 @@
+from dataclasses import dataclass
+import numpy as np
+
+# Environments give models stimuli either as an iterable of (x, y, current) tuples or as an
+# ArrayStimuli. Models resolve the input positions of an ArrayStimuli to input cells with an
+# InputMapping built once from the network so applying them needs no per stimulus lookups.
+
+@dataclass
+class ArrayStimuli:
+    '''
+    Stimuli as parallel arrays. Stimulus i adds currents[i] to the input cells at input
+    position (x_input_positions[i], y_input_positions[i]).
+    '''
+    x_input_positions: np.ndarray
+    y_input_positions: np.ndarray
+    currents: np.ndarray
+
+    def __len__(self):
+        return len(self.currents)
+
+    def as_tuples(self):
+        '''
+        The same stimuli as a set of (x, y, current) tuples.
+        '''
+        return set(zip(self.x_input_positions.tolist(), self.y_input_positions.tolist(),
+                       self.currents.tolist()))
+
+class InputMapping:
+    '''
+    Input cell indexes grouped by input position. Positions are flattened as
+    x * height + y and offsets give where each position's cells start in cell_indexes.
+    '''
+    def __init__(self, cell_definitions):
+        input_cells = [cell for cell in cell_definitions if cell.is_input_cell]
+        indexes = np.array([index for index, cell in enumerate(cell_definitions)
+                            if cell.is_input_cell], dtype=np.int64)
+        x_input_positions = np.array([cell.x_input_position for cell in input_cells],
+                                     dtype=np.int64)
+        y_input_positions = np.array([cell.y_input_position for cell in input_cells],
+                                     dtype=np.int64)
+
+        self._width = 0
+        self._height = 0
+        if input_cells:
+            self._width = int(x_input_positions.max()) + 1
+            self._height = int(y_input_positions.max()) + 1
+        positions = x_input_positions * self._height + y_input_positions
+        order = np.argsort(positions, kind="stable")
+        self._cell_indexes = indexes[order]
+        self._offsets = np.zeros(self._width * self._height + 1, dtype=np.int64)
+        np.cumsum(np.bincount(positions, minlength=self._width * self._height),
+                  out=self._offsets[1:])
+
+    def resolve(self, stimuli):
+        '''
+        Cell indexes and the current for each from an ArrayStimuli. A cell appears once for
+        every stimulus at its position. Positions without input cells are ignored.
+        '''
+        x_input_positions = np.asarray(stimuli.x_input_positions, dtype=np.int64)
+        y_input_positions = np.asarray(stimuli.y_input_positions, dtype=np.int64)
+        currents = np.asarray(stimuli.currents, dtype=float)
+        inside = ((x_input_positions >= 0) & (x_input_positions < self._width)
+                  & (y_input_positions >= 0) & (y_input_positions < self._height))
+        positions = (x_input_positions[inside] * self._height + y_input_positions[inside])
+        currents = currents[inside]
+
+        starts = self._offsets[positions]
+        counts = self._offsets[positions + 1] - starts
+        if (counts == 1).all():
+            return self._cell_indexes[starts], currents
+
+        # positions with several input cells or none
+        cell_positions = (np.repeat(starts - np.cumsum(counts) + counts, counts)
+                          + np.arange(counts.sum()))
+        return self._cell_indexes[cell_positions], np.repeat(currents, counts)
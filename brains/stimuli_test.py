@@ -0,0 +1,35 @@
+from brains.network import CellDefinition
+from brains.stimuli import ArrayStimuli, InputMapping
+
+import numpy as np
+import unittest
+
+
+class TestInputMapping(unittest.TestCase):
+
+    def test_resolve(self):
+        cells = [CellDefinition("a", 0, 0, True, 0, 0),
+                 CellDefinition("b", 1, 0),
+                 CellDefinition("c", 2, 0, True, 1, 2),
+                 CellDefinition("d", 2, 1, True, 1, 2),
+                 CellDefinition("e", 3, 0, True, 0, 1)]
+        input_mapping = InputMapping(cells)
+
+        stimuli = ArrayStimuli(np.array([0, 0]), np.array([1, 0]), np.array([0.1, 0.2]))
+        cell_indexes, currents = input_mapping.resolve(stimuli)
+        self.assertEqual(cell_indexes.tolist(), [4, 0])
+        self.assertEqual(currents.tolist(), [0.1, 0.2])
+
+        # both cells at (1, 2) get input and positions without input cells are ignored
+        stimuli = ArrayStimuli(np.array([1, 5, 1, 0]), np.array([2, 0, 0, 0]),
+                               np.array([0.1, 0.2, 0.3, 0.4]))
+        cell_indexes, currents = input_mapping.resolve(stimuli)
+        self.assertEqual(cell_indexes.tolist(), [2, 3, 0])
+        self.assertEqual(currents.tolist(), [0.1, 0.1, 0.4])
+
+    def test_as_tuples(self):
+        stimuli = ArrayStimuli(np.array([0, 1]), np.array([2, 3]), np.array([0.3, 0.3]))
+        self.assertEqual(stimuli.as_tuples(), {(0, 2, 0.3), (1, 3, 0.3)})
+
+if __name__ == '__main__':
+    unittest.main()
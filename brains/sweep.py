@@ -0,0 +1,297 @@
+import brains.environment.dataset_cache as dataset_cache
+import brains.main as main
+import brains.models.batched_model as batched_model
+import brains.network as network
+from brains.network import CellType
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import contextlib
+import copy
+import dataclasses
+import itertools
+import json
+import numpy as np
+import os
+import random
+import time
+
+# Runs a world many times with different parameters spread across processes. Each run's
+# result is written as one line of JSON.
+#
+# Overrides are dicts of "section.name": value. Sections are
+#   world: any main.py argument such as epoch_length or input_delay
+#   model_parameters, cell_type_parameters, synapse_type_parameters: fields of those
+#       dataclasses in simple_model_builder
+#   layer_connection: "layer_connection.a.b" sets the strength of every synapse from layer a
+#       to layer b like LayerConnection.synapse_strength does when the network is built
+#
+# An overrides file holds either a list of override dicts to run one after another or a
+# dict of "section.name": [values] where every combination of values is run.
+#
+# Batched sweeps run groups of runs that only differ in model parameters as one
+# batched_model.BatchedModel. Instances share the network and clock so runs are grouped by
+# their world, layer_connection and CLOCK_OVERRIDES. Each run gets the same results it
+# would get from a numpy run on its own. Batched models can not warp.
+
+CLOCK_OVERRIDES = {"model_parameters.step_size",
+                   "model_parameters.epoch_length",
+                   "model_parameters.epoch_delay"}
+
+def expand_overrides(specification):
+    if isinstance(specification, list):
+        return specification
+
+    keys = list(specification.keys())
+    runs = []
+    for values in itertools.product(*(specification[key] for key in keys)):
+        runs.append(dict(zip(keys, values)))
+    return runs
+
+def _split_overrides(overrides):
+    world_overrides = {}
+    model_overrides = {}
+    for key, value in overrides.items():
+        section, name = key.split(".", 1)
+        if section == "world":
+            world_overrides[name] = value
+        else:
+            model_overrides[key] = value
+    return world_overrides, model_overrides
+
+def apply_overrides(network_definition, model_parameters, overrides):
+    '''
+    Copies of network_definition and model_parameters with the non world overrides applied.
+    '''
+    network_definition = copy.deepcopy(network_definition)
+    model_parameters = copy.deepcopy(model_parameters)
+    for key, value in overrides.items():
+        section, name = key.split(".", 1)
+        if section == "layer_connection":
+            pre_layer, post_layer = name.split(".")
+            set_layer_connection_strength(network_definition, pre_layer, post_layer, value)
+            continue
+
+        if section == "model_parameters":
+            target = model_parameters
+        elif section == "cell_type_parameters":
+            target = model_parameters.cell_type_parameters
+        elif section == "synapse_type_parameters":
+            target = model_parameters.synapse_type_parameters
+        else:
+            raise Exception(f"unknown override section {section} in {key}")
+
+        if name not in {field.name for field in dataclasses.fields(target)}:
+            raise Exception(f"unknown override {key}")
+        setattr(target, name, value)
+    return network_definition, model_parameters
+
+def set_layer_connection_strength(network_definition, pre_layer, post_layer, strength):
+    cell_definitions = network_definition.cell_definitions
+    synapse_arrays = network_definition.synapse_arrays()
+    layer_ids = np.array([cell.layer_id for cell in cell_definitions])
+    cell_types = np.array([cell.cell_type for cell in cell_definitions], dtype=np.int64)
+    pre_cell_types = cell_types[synapse_arrays.pre_cell_index]
+    connected = ((layer_ids[synapse_arrays.pre_cell_index] == pre_layer)
+                 & (layer_ids[synapse_arrays.post_cell_index] == post_layer))
+    if not connected.any():
+        raise Exception(f"no synapses connect layer {pre_layer} to layer {post_layer}")
+
+    synapse_arrays.starting_strength[
+        connected & (pre_cell_types != CellType.INHIBITORY)] = strength
+    synapse_arrays.starting_inhibitory_strength[
+        connected & (pre_cell_types != CellType.EXCITATORY)] = strength
+    network_definition.synapse_definitions = synapse_arrays
+
+def batch_runs(runs, batch_size=None):
+    '''
+    Splits runs into lists of runs that can share a BatchedModel, at most batch_size long.
+    '''
+    groups = {}
+    for overrides in runs:
+        shared = {key: value for key, value in overrides.items()
+                  if key.split(".", 1)[0] in ("world", "layer_connection")
+                  or key in CLOCK_OVERRIDES}
+        groups.setdefault(json.dumps(shared, sort_keys=True), []).append(overrides)
+
+    batches = []
+    for group in groups.values():
+        size = batch_size or len(group)
+        batches += [group[start:start + size] for start in range(0, len(group), size)]
+    return batches
+
+def _world_parameters(world_arguments, world_overrides):
+    parameters = main.create_args(world_arguments)
+    for name, value in world_overrides.items():
+        if not hasattr(parameters, name):
+            raise Exception(f"unknown world override {name}")
+        setattr(parameters, name, value)
+    return parameters
+
+def _result(overrides, seed, epochs, environment, wall_time, steps_per_second):
+    result_tracker = getattr(environment, "_result_tracker", None)
+    return {"overrides": overrides,
+            "seed": seed,
+            "epochs": epochs,
+            "accuracy": result_tracker.accuracy if result_tracker is not None else None,
+            "result_tracker": (dataclasses.asdict(result_tracker)
+                               if result_tracker is not None else None),
+            "wall_time": wall_time,
+            "steps_per_second": steps_per_second}
+
+def run_world(world_arguments, overrides, epochs, seed):
+    '''
+    Builds a world with main.create_world with the overrides applied and runs it without a
+    display. Everything the world prints is discarded.
+    '''
+    world_overrides, model_overrides = _split_overrides(overrides)
+    parameters = _world_parameters(world_arguments, world_overrides)
+    steps = parameters.epoch_length * epochs
+
+    random.seed(seed)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        model, environment = main.create_world(parameters, model_overrides)
+        # workers are reused for many runs so each environment's pipeline must be stopped
+        try:
+            start = time.perf_counter()
+            main.run_compiled(model, environment, steps, parameters.attempt_warp)
+            wall_time = time.perf_counter() - start
+        finally:
+            main.close_environment(environment)
+
+    return _result(overrides, seed, epochs, environment, wall_time,
+                   steps / wall_time if wall_time > 0 else None)
+
+def run_batch(world_arguments, runs, epochs, seed):
+    '''
+    run_world for a list of runs from batch_runs stepped together as one BatchedModel. Each
+    run's world is built as a numpy model just as run_world would build it and its
+    environment draws from its own random state. steps_per_second counts the steps of
+    every run in the batch.
+    '''
+    world_overrides, _ = _split_overrides(runs[0])
+    parameters = _world_parameters(world_arguments, world_overrides)
+    if parameters.attempt_warp:
+        raise Exception("batched sweeps can not warp")
+    parameters.execution_type = "numpy"
+    steps = parameters.epoch_length * epochs
+
+    models = []
+    environments = []
+    random_states = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            for overrides in runs:
+                random.seed(seed)
+                model, environment = main.create_world(parameters,
+                                                       _split_overrides(overrides)[1])
+                models.append(model)
+                environments.append(environment)
+                random_states.append(random.getstate())
+            model = batched_model.BatchedModel.from_models(models)
+            del models
+
+            start = time.perf_counter()
+            batched_model.run_compiled_batch(model, environments, steps, random_states)
+            wall_time = time.perf_counter() - start
+        finally:
+            for environment in environments:
+                main.close_environment(environment)
+
+    steps_per_second = len(runs) * steps / wall_time if wall_time > 0 else None
+    return [_result(overrides, seed, epochs, environment, wall_time, steps_per_second)
+            for overrides, environment in zip(runs, environments)]
+
+def _initialize_worker():
+    '''
+    Workers build the same world over and over so they keep the dataset arrays and
+    networks built for one run for the next.
+    '''
+    dataset_cache.keep_loaded_arrays()
+    network.keep_built_networks()
+
+def sweep(world_arguments, runs, epochs, output_path, workers=None, repeats=1, seed=0,
+          batched=False, batch_size=None):
+    '''
+    batched: run the runs batch_runs groups together as BatchedModels
+    batch_size: most runs in one BatchedModel, None for whole groups
+    '''
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initialize_worker) as executor, \
+         open(output_path, "a") as output_file:
+        futures = []
+        for repeat in range(repeats):
+            if batched:
+                for batch in batch_runs(runs, batch_size):
+                    futures.append(executor.submit(run_batch, world_arguments, batch, epochs,
+                                                   seed + repeat))
+            else:
+                for overrides in runs:
+                    futures.append(executor.submit(run_world, world_arguments, overrides,
+                                                   epochs, seed + repeat))
+
+        for future in as_completed(futures):
+            results = future.result() if batched else [future.result()]
+            for result in results:
+                output_file.write(json.dumps(result, sort_keys=True) + "\n")
+                output_file.flush()
+                print(f"accuracy {result['accuracy']} "
+                      f"steps/sec {result['steps_per_second']:.0f} "
+                      f"overrides {result['overrides']}")
+
+def create_args():
+    my_parser = argparse.ArgumentParser(
+        description='Run a world many times with different parameters. Arguments not '\
+        'listed here are passed to main.py to create the world, for example --world easy.')
+    my_parser.add_argument('--overrides',
+                           type=str,
+                           required=True,
+                           help='JSON file of overrides. Either a list of override dicts '\
+                           'or a dict of override names to lists of values to try in every '\
+                           'combination.')
+    my_parser.add_argument('--output',
+                           type=str,
+                           required=True,
+                           help='JSONL file results are appended to.')
+    my_parser.add_argument('--epochs',
+                           type=int,
+                           default=100,
+                           required=False,
+                           help='Number of epochs in each run.')
+    my_parser.add_argument('--workers',
+                           type=int,
+                           default=None,
+                           required=False,
+                           help='Number of processes. Defaults to the number of cpus.')
+    my_parser.add_argument('--repeats',
+                           type=int,
+                           default=1,
+                           required=False,
+                           help='Number of times to run each set of overrides. Each repeat '\
+                           'uses the next seed.')
+    my_parser.add_argument('--seed',
+                           type=int,
+                           default=0,
+                           required=False,
+                           help='Seed for the first repeat.')
+    my_parser.add_argument('--batched',
+                           default=False,
+                           type=bool,
+                           required=False,
+                           help='Run overrides that only change model parameters together '\
+                           'as one batched numpy model. Results match separate numpy runs. '\
+                           'Warping is not supported.')
+    my_parser.add_argument('--batch_size',
+                           type=int,
+                           default=None,
+                           required=False,
+                           help='Most runs in one batched model. Defaults to every run that '\
+                           'can share one.')
+    return my_parser.parse_known_args()
+
+if __name__ == "__main__":
+    parameters, world_arguments = create_args()
+    with open(parameters.overrides) as overrides_file:
+        runs = expand_overrides(json.load(overrides_file))
+    sweep(world_arguments, runs, parameters.epochs, parameters.output,
+          workers=parameters.workers, repeats=parameters.repeats, seed=parameters.seed,
+          batched=parameters.batched, batch_size=parameters.batch_size)
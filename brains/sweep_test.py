@@ -0,0 +1,118 @@
+import brains.environment.dataset_cache as dataset_cache
+import brains.main as main
+import brains.models.simple_model_builder as simple_model_builder
+import brains.network as network
+import brains.network_definitions as network_definitions
+import brains.sweep as sweep
+
+import unittest
+
+
+class TestSweep(unittest.TestCase):
+
+    def test_expand_grid(self):
+        runs = sweep.expand_overrides({"model_parameters.dopamine_decay": [0.1, 0.05],
+                                       "world.input_delay": [25, 50]})
+        self.assertEqual(len(runs), 4)
+        self.assertIn({"model_parameters.dopamine_decay": 0.05, "world.input_delay": 25}, runs)
+
+    def test_expand_list(self):
+        runs = [{"model_parameters.dopamine_decay": 0.1}]
+        self.assertEqual(sweep.expand_overrides(runs), runs)
+
+    def test_apply_overrides(self):
+        network_definition = network_definitions.easy_layer_network()
+        model_parameters = simple_model_builder.ModelParameters()
+        new_network_definition, new_model_parameters = sweep.apply_overrides(
+            network_definition, model_parameters,
+            {"model_parameters.dopamine_decay": 0.2,
+             "cell_type_parameters.voltage_decay": 0.02,
+             "synapse_type_parameters.max_strength": 0.5,
+             "layer_connection.a.b": 0.3,
+             "layer_connection.i.b": 0.4})
+
+        self.assertEqual(new_model_parameters.dopamine_decay, 0.2)
+        self.assertEqual(new_model_parameters.cell_type_parameters.voltage_decay, 0.02)
+        self.assertEqual(new_model_parameters.synapse_type_parameters.max_strength, 0.5)
+        self.assertNotEqual(model_parameters.dopamine_decay, 0.2)
+
+        layers = [cell.layer_id for cell in new_network_definition.cell_definitions]
+        for synapse in new_network_definition.synapse_definitions:
+            pre_layer = layers[synapse.pre_cell_index]
+            post_layer = layers[synapse.post_cell_index]
+            if (pre_layer, post_layer) == ("a", "b"):
+                self.assertEqual(synapse.starting_strength, 0.3)
+            elif (pre_layer, post_layer) == ("i", "b"):
+                self.assertEqual(synapse.starting_inhibitory_strength, 0.4)
+
+    def test_unknown_override(self):
+        network_definition = network_definitions.easy_layer_network()
+        model_parameters = simple_model_builder.ModelParameters()
+        with self.assertRaises(Exception):
+            sweep.apply_overrides(network_definition, model_parameters,
+                                  {"model_parameters.not_a_parameter": 1})
+        with self.assertRaises(Exception):
+            sweep.apply_overrides(network_definition, model_parameters,
+                                  {"layer_connection.c.a": 0.1})
+
+    def test_create_world_overrides(self):
+        parameters = main.create_args(["--world", "easy", "--display_type", "",
+                                       "--execution_type", "numpy"])
+        model, environment = main.create_world(parameters,
+                                               {"model_parameters.dopamine_decay": 0.2,
+                                                "layer_connection.a.b": 0.3})
+        self.assertEqual(model.model_parameters.dopamine_decay, 0.2)
+        layers = [cell.layer_id for cell in model.network_definition.cell_definitions]
+        for synapse in model.network_definition.synapse_definitions:
+            if (layers[synapse.pre_cell_index], layers[synapse.post_cell_index]) == ("a", "b"):
+                self.assertEqual(synapse.starting_strength, 0.3)
+
+    def test_worker_caches_match_fresh_worlds(self):
+        world_arguments = ["--world", "handwriting", "--display_type", "",
+                           "--execution_type", "numpy"]
+        overrides = {"model_parameters.dopamine_decay": 0.2}
+
+        def run():
+            result = sweep.run_world(world_arguments, overrides, 40, 0)
+            return result["result_tracker"]
+
+        fresh_result_tracker = run()
+        self.assertGreater(fresh_result_tracker["total_fires"], 0)
+        self.addCleanup(setattr, dataset_cache, "_loaded_arrays", None)
+        self.addCleanup(setattr, network, "_built_networks", None)
+        sweep._initialize_worker()
+        # the first run fills the caches and the second uses them
+        self.assertEqual(run(), fresh_result_tracker)
+        self.assertEqual(run(), fresh_result_tracker)
+
+    def test_batch_runs(self):
+        runs = [{"model_parameters.dopamine_decay": 0.1, "world.input_delay": 25},
+                {"model_parameters.dopamine_decay": 0.2, "world.input_delay": 25},
+                {"model_parameters.dopamine_decay": 0.1, "world.input_delay": 50},
+                {"synapse_type_parameters.max_strength": 0.5, "world.input_delay": 25},
+                {"model_parameters.epoch_length": 500, "world.input_delay": 25}]
+        self.assertEqual(sweep.batch_runs(runs), [[runs[0], runs[1], runs[3]], [runs[2]],
+                                                  [runs[4]]])
+        self.assertEqual(sweep.batch_runs(runs, 2), [[runs[0], runs[1]], [runs[3]],
+                                                     [runs[2]], [runs[4]]])
+
+    def test_batch_matches_numpy_runs(self):
+        world_arguments = ["--world", "easy", "--display_type", "",
+                           "--execution_type", "numpy"]
+        runs = [{"model_parameters.dopamine_decay": 0.1},
+                {"model_parameters.dopamine_decay": 0.05,
+                 "synapse_type_parameters.max_strength": 0.3},
+                {"cell_type_parameters.voltage_decay": 0.02}]
+        batch_results = sweep.run_batch(world_arguments, runs, 20, 3)
+        for overrides, batch_result in zip(runs, batch_results):
+            result = sweep.run_world(world_arguments, overrides, 20, 3)
+            self.assertEqual(batch_result["overrides"], overrides)
+            self.assertEqual(batch_result["result_tracker"], result["result_tracker"])
+        self.assertGreater(batch_results[0]["result_tracker"]["rewarded"], 0)
+
+        with self.assertRaises(Exception):
+            sweep.run_batch(world_arguments + ["--attempt_warp", "True"], runs, 20, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
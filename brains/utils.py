@@ -1,4 +1,6 @@
 from pathlib import Path
+import math
+import numpy as np
 
 def data_dir_file_path(file_name):
     base_path = Path(__file__).parent / "data"
@@ -15,3 +17,140 @@ def newtons_square_root(n):
         x = y
         y = (x + n // x) // 2
     return x
+
+def integrate_voltage(voltage, input_current, voltage_factor, current_factor, step_size, steps):
+    '''
+    Voltage after steps membrane updates that do not fire. Each update decays voltage by
+    voltage_factor, adds input_current * step_size and then decays input_current by
+    current_factor. Summing the geometric series gives a closed form. Works on floats and
+    on numpy arrays of voltages and currents.
+    '''
+    decayed_voltage = voltage * voltage_factor**steps
+    if voltage_factor == current_factor:
+        return decayed_voltage + input_current * step_size * steps * voltage_factor**(steps - 1)
+    current_sum = (voltage_factor**steps - current_factor**steps) / (voltage_factor - current_factor)
+    return decayed_voltage + input_current * step_size * current_sum
+
+def voltage_peak_step(voltage, input_current, voltage_factor, current_factor, step_size):
+    '''
+    Continuous step count where integrate_voltage has its turning point or None if it has
+    none after the current step. The curve is a sum of two decaying exponentials so it has
+    at most one turning point.
+    '''
+    if input_current == 0:
+        return None
+
+    log_voltage_factor = math.log(voltage_factor)
+    if voltage_factor == current_factor:
+        peak = -1 / log_voltage_factor - voltage * voltage_factor / (input_current * step_size)
+    else:
+        log_current_factor = math.log(current_factor)
+        current_part = input_current * step_size / (voltage_factor - current_factor)
+        voltage_part = voltage + current_part
+        if voltage_part == 0:
+            return None
+        ratio = current_part * log_current_factor / (voltage_part * log_voltage_factor)
+        if ratio <= 0:
+            return None
+        peak = math.log(ratio) / (log_voltage_factor - log_current_factor)
+
+    if peak <= 0:
+        return None
+    return peak
+
+def steps_until_voltage_exceeds(voltage, input_current, voltage_factor, current_factor,
+                                step_size, threshold):
+    '''
+    Smallest number of membrane updates after which voltage is above threshold, assuming
+    no firing and no new input, or None if that never happens. threshold is expected to be
+    positive like max_voltage. Decay factors outside (0, 1) can't be predicted and give 0
+    so callers never skip past a crossing.
+    '''
+    if voltage > threshold:
+        return 0
+
+    if not (0 < voltage_factor < 1 and 0 < current_factor < 1):
+        return 0
+
+    peak = voltage_peak_step(voltage, input_current, voltage_factor, current_factor, step_size)
+    if peak is None:
+        return None
+
+    def voltage_after(steps):
+        return integrate_voltage(voltage, input_current, voltage_factor, current_factor,
+                                 step_size, steps)
+
+    # Voltage only rises on the way to the peak so the first crossing is found by bisection.
+    high = math.floor(peak)
+    if voltage_after(high) <= threshold:
+        high = math.ceil(peak)
+        if voltage_after(high) <= threshold:
+            return None
+
+    low = 0
+    while high - low > 1:
+        middle = (low + high) // 2
+        if voltage_after(middle) > threshold:
+            high = middle
+        else:
+            low = middle
+    return high
+
+def steps_until_voltages_exceed(voltage, input_current, voltage_factor, current_factor,
+                                step_size, threshold):
+    '''
+    steps_until_voltage_exceeds for numpy arrays of voltages and currents. Cells that will
+    not cross threshold without more input get inf.
+    '''
+    steps = np.full(len(voltage), np.inf)
+    if not (0 < voltage_factor < 1 and 0 < current_factor < 1):
+        steps[:] = 0
+        return steps
+    steps[voltage > threshold] = 0
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        if voltage_factor == current_factor:
+            peak = (-1 / np.log(voltage_factor)
+                    - voltage * voltage_factor / (input_current * step_size))
+        else:
+            current_part = input_current * step_size / (voltage_factor - current_factor)
+            ratio = (current_part * np.log(current_factor)
+                     / ((voltage + current_part) * np.log(voltage_factor)))
+            peak = np.log(ratio) / (np.log(voltage_factor) - np.log(current_factor))
+
+    rising = np.isfinite(peak) & (peak > 0) & (voltage <= threshold)
+    cell_indexes = np.flatnonzero(rising)
+    voltage = voltage[cell_indexes]
+    input_current = input_current[cell_indexes]
+    peak = peak[cell_indexes]
+
+    def voltage_after(voltage, input_current, steps):
+        return integrate_voltage(voltage, input_current, voltage_factor, current_factor,
+                                 step_size, steps)
+
+    high = np.floor(peak)
+    high = np.where(voltage_after(voltage, input_current, high) > threshold,
+                    high, np.ceil(peak))
+    crosses = voltage_after(voltage, input_current, high) > threshold
+    cell_indexes = cell_indexes[crosses]
+    voltage = voltage[crosses]
+    input_current = input_current[crosses]
+    high = high[crosses]
+
+    # Voltage only rises on the way to the peak so the first crossing is found by bisection.
+    low = np.zeros(len(high))
+    while np.any(high - low > 1):
+        middle = (low + high) // 2
+        above = voltage_after(voltage, input_current, middle) > threshold
+        high = np.where(above, middle, high)
+        low = np.where(above, low, middle)
+    steps[cell_indexes] = high
+    return steps
+
+def geometric_series(ratio, terms):
+    '''
+    1 + ratio + ratio**2 + ... + ratio**(terms - 1)
+    '''
+    if ratio == 1:
+        return terms
+    return (1 - ratio**terms) / (1 - ratio)
@@ -34,6 +34,16 @@ fn voltage(model: &Model, index: usize) -> PyResult<f64> {
     Ok(model.voltage(index))
 }
 
+#[pyfunction]
+fn voltages(model: &Model) -> PyResult<std::vec::Vec<f64>> {
+    Ok(model.voltages())
+}
+
+#[pyfunction]
+fn fired(model: &Model) -> PyResult<std::vec::Vec<bool>> {
+    Ok(model.fired())
+}
+
 #[pyfunction]
 fn receive_input(model: &mut Model, index: usize, strength: f64){
     model.receive_input(index, strength);
@@ -44,6 +54,55 @@ fn update_cells(model: &mut Model){
     model.update_cells();
 }
 
+#[pyfunction]
+fn input_currents(model: &Model) -> PyResult<std::vec::Vec<f64>> {
+    Ok(model.input_currents())
+}
+
+#[pyfunction]
+fn calciums(model: &Model) -> PyResult<std::vec::Vec<f64>> {
+    Ok(model.calciums())
+}
+
+#[pyfunction]
+fn restore_cells(model: &mut Model, voltages: std::vec::Vec<f64>,
+		 input_currents: std::vec::Vec<f64>,
+		 calciums: std::vec::Vec<f64>) -> PyResult<()> {
+    let size = model.number_of_cells();
+    if voltages.len() != size || input_currents.len() != size || calciums.len() != size {
+	return Err(pyo3::exceptions::PyValueError::new_err("need one value per cell"));
+    }
+    model.restore_cells(voltages, input_currents, calciums);
+    Ok(())
+}
+
+#[pyfunction]
+fn warp_cells(model: &mut Model, time_steps: i32){
+    model.warp_cells(time_steps);
+}
+
+#[pyfunction]
+fn run_steps(model: &mut Model, number_of_steps: usize, dopamine: f64, dopamine_factor: f64,
+	     stimulus_offsets: std::vec::Vec<usize>, stimulus_cells: std::vec::Vec<usize>,
+	     stimulus_currents: std::vec::Vec<f64>)
+	     -> PyResult<(f64, std::vec::Vec<usize>, std::vec::Vec<usize>)> {
+    if stimulus_offsets.len() != number_of_steps + 1
+	|| stimulus_offsets.windows(2).any(|pair| pair[0] > pair[1])
+	|| stimulus_offsets[number_of_steps] > stimulus_cells.len() {
+	return Err(pyo3::exceptions::PyValueError::new_err(
+	    "need increasing stimulus offsets for every step and one more"));
+    }
+    if stimulus_cells.len() != stimulus_currents.len() {
+	return Err(pyo3::exceptions::PyValueError::new_err("need one current per stimulus"));
+    }
+    let number_of_cells = model.number_of_cells();
+    if stimulus_cells.iter().any(|&index| index >= number_of_cells) {
+	return Err(pyo3::exceptions::PyValueError::new_err("stimulus cell out of range"));
+    }
+    Ok(model.run_steps(number_of_steps, dopamine, dopamine_factor,
+		       &stimulus_offsets, &stimulus_cells, &stimulus_currents))
+}
+
 #[pyfunction]
 pub fn fired_indexes(model: &mut Model) -> PyResult<std::vec::Vec<usize>> {
     Ok(model.fired_indexes())
@@ -97,6 +156,49 @@ fn update_inhibitory_strength(model: &mut Model, index: usize, inhibitory_streng
     model.update_inhibitory_strength(index, inhibitory_strength);
 }
 
+#[pyfunction]
+fn strengths(model: &Model) -> PyResult<std::vec::Vec<f64>> {
+    Ok(model.strengths())
+}
+
+#[pyfunction]
+fn inhibitory_strengths(model: &Model) -> PyResult<std::vec::Vec<f64>> {
+    Ok(model.inhibitory_strengths())
+}
+
+#[pyfunction]
+fn update_strengths(model: &mut Model, strengths: std::vec::Vec<f64>) -> PyResult<()> {
+    if strengths.len() != model.number_of_synapses() {
+	return Err(pyo3::exceptions::PyValueError::new_err("need one strength per synapse"));
+    }
+    model.update_strengths(strengths);
+    Ok(())
+}
+
+#[pyfunction]
+fn update_inhibitory_strengths(model: &mut Model,
+			       inhibitory_strengths: std::vec::Vec<f64>) -> PyResult<()> {
+    if inhibitory_strengths.len() != model.number_of_synapses() {
+	return Err(pyo3::exceptions::PyValueError::new_err("need one strength per synapse"));
+    }
+    model.update_inhibitory_strengths(inhibitory_strengths);
+    Ok(())
+}
+
+#[pyfunction]
+fn s_tags(model: &Model) -> PyResult<std::vec::Vec<f64>> {
+    Ok(model.s_tags())
+}
+
+#[pyfunction]
+fn update_s_tags(model: &mut Model, s_tags: std::vec::Vec<f64>) -> PyResult<()> {
+    if s_tags.len() != model.number_of_synapses() {
+	return Err(pyo3::exceptions::PyValueError::new_err("need one s_tag per synapse"));
+    }
+    model.update_s_tags(s_tags);
+    Ok(())
+}
+
 #[pyfunction]
 fn update_synapses(model: &mut Model, dopamine: f64){
     model.update_synapses(dopamine);
@@ -107,6 +209,11 @@ fn cap(model: &mut Model, index: usize){
     model.cap(index);
 }
 
+#[pyfunction]
+fn has_pending_s_tags(model: &Model) -> PyResult<bool> {
+    Ok(model.has_pending_s_tags())
+}
+
 /// A Python module implemented in Rust. The name of this function must match
 /// the `lib.name` setting in the `Cargo.toml`, else Python will not be able to
 /// import the module.
@@ -116,10 +223,17 @@ fn iron_brains(_py: Python, m: &PyModule) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(add_cell, m)?)?;
     m.add_function(wrap_pyfunction!(apply_fire, m)?)?;
     m.add_function(wrap_pyfunction!(voltage, m)?)?;
+    m.add_function(wrap_pyfunction!(voltages, m)?)?;
+    m.add_function(wrap_pyfunction!(fired, m)?)?;
 
     m.add_function(wrap_pyfunction!(receive_input, m)?)?;
     m.add_function(wrap_pyfunction!(update_cells, m)?)?;
     m.add_function(wrap_pyfunction!(fired_indexes, m)?)?;
+    m.add_function(wrap_pyfunction!(run_steps, m)?)?;
+    m.add_function(wrap_pyfunction!(input_currents, m)?)?;
+    m.add_function(wrap_pyfunction!(warp_cells, m)?)?;
+    m.add_function(wrap_pyfunction!(calciums, m)?)?;
+    m.add_function(wrap_pyfunction!(restore_cells, m)?)?;
     
     m.add_function(wrap_pyfunction!(add_synapse, m)?)?;
     m.add_function(wrap_pyfunction!(clear_positive_s_tags, m)?)?;
@@ -130,8 +244,15 @@ fn iron_brains(_py: Python, m: &PyModule) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(inhibitory_strength, m)?)?;
     m.add_function(wrap_pyfunction!(update_strength, m)?)?;
     m.add_function(wrap_pyfunction!(update_inhibitory_strength, m)?)?;
+    m.add_function(wrap_pyfunction!(strengths, m)?)?;
+    m.add_function(wrap_pyfunction!(inhibitory_strengths, m)?)?;
+    m.add_function(wrap_pyfunction!(update_strengths, m)?)?;
+    m.add_function(wrap_pyfunction!(update_inhibitory_strengths, m)?)?;
+    m.add_function(wrap_pyfunction!(s_tags, m)?)?;
+    m.add_function(wrap_pyfunction!(update_s_tags, m)?)?;
     m.add_function(wrap_pyfunction!(update_synapses, m)?)?;
     m.add_function(wrap_pyfunction!(cap, m)?)?;
+    m.add_function(wrap_pyfunction!(has_pending_s_tags, m)?)?;
     
     m.add_class::<CellMembraneParameters>()?;
     m.add_class::<SynapseParameters>()?;
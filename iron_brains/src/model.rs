@@ -84,6 +84,39 @@ impl Model {
 	return indexes;
     }
 
+    pub fn voltages(&self) -> std::vec::Vec<f64> {
+	self.cell_membranes.iter().map(|cell_membrane| cell_membrane.voltage()).collect()
+    }
+
+    pub fn fired(&self) -> std::vec::Vec<bool> {
+	self.cell_membranes.iter().map(|cell_membrane| cell_membrane.fired()).collect()
+    }
+
+    pub fn input_currents(&self) -> std::vec::Vec<f64> {
+	self.cell_membranes.iter().map(|cell_membrane| cell_membrane.input_current()).collect()
+    }
+
+    pub fn calciums(&self) -> std::vec::Vec<f64> {
+	self.cell_membranes.iter().map(|cell_membrane| cell_membrane.calcium()).collect()
+    }
+
+    pub fn restore_cells(&mut self, voltages: std::vec::Vec<f64>,
+			 input_currents: std::vec::Vec<f64>, calciums: std::vec::Vec<f64>) {
+	for (index, cell_membrane) in self.cell_membranes.iter_mut().enumerate() {
+	    cell_membrane.restore(voltages[index], input_currents[index], calciums[index]);
+	};
+    }
+
+    pub fn number_of_cells(&self) -> usize {
+	self.cell_membranes.len()
+    }
+
+    pub fn warp_cells(&mut self, time_steps: i32) {
+	for cell_membrane in self.cell_membranes.iter_mut() {
+	    cell_membrane.warp(&self.cell_membrane_parameters, time_steps);
+	};
+    }
+
     pub fn receive_input(&mut self, index: usize, strength: f64) {
 	self.cell_membranes[index].receive_input(strength);
     }
@@ -94,6 +127,35 @@ impl Model {
 	};
     }
 
+    // the part of python's SimpleModel.step after the dopamine and epoch updates for
+    // number_of_steps steps without warping. dopamine is the first step's, later steps decay
+    // it by dopamine_factor. Stimuli for step i are
+    // stimulus_cells[stimulus_offsets[i]..stimulus_offsets[i + 1]] and their currents.
+    // Returns the last step's dopamine and the step and cell index of every fire.
+    pub fn run_steps(&mut self, number_of_steps: usize,
+		     mut dopamine: f64, dopamine_factor: f64,
+		     stimulus_offsets: &[usize], stimulus_cells: &[usize],
+		     stimulus_currents: &[f64]) -> (f64, std::vec::Vec<usize>, std::vec::Vec<usize>) {
+	let mut fire_steps: std::vec::Vec<usize> = std::vec::Vec::new();
+	let mut fired_cells: std::vec::Vec<usize> = std::vec::Vec::new();
+	for step in 0..number_of_steps {
+	    if step > 0 {
+		dopamine *= dopamine_factor;
+	    }
+	    self.update_synapses(dopamine);
+	    for stimulus in stimulus_offsets[step]..stimulus_offsets[step + 1] {
+		self.receive_input(stimulus_cells[stimulus], stimulus_currents[stimulus]);
+	    }
+	    self.update_cells();
+	    for index in self.fired_indexes() {
+		self.apply_fire(index);
+		fire_steps.push(step);
+		fired_cells.push(index);
+	    }
+	}
+	(dopamine, fire_steps, fired_cells)
+    }
+
     ////////////////
 
     pub fn add_synapse(&mut self,
@@ -156,6 +218,10 @@ impl Model {
 	return total;
     }
 
+    pub fn number_of_synapses(&self) -> usize {
+	self.synapses.len()
+    }
+
     pub fn strength(&self, index: usize,) -> f64 {
 	self.synapses[index].strength
     }
@@ -171,6 +237,37 @@ impl Model {
 	self.synapses[index].inhibitory_strength = inhibitory_strength;
     }
 
+    // bulk versions of the above so python can balance every synapse with one call each way
+    pub fn strengths(&self) -> std::vec::Vec<f64> {
+	self.synapses.iter().map(|synapse| synapse.strength).collect()
+    }
+
+    pub fn inhibitory_strengths(&self) -> std::vec::Vec<f64> {
+	self.synapses.iter().map(|synapse| synapse.inhibitory_strength).collect()
+    }
+
+    pub fn update_strengths(&mut self, strengths: std::vec::Vec<f64>) {
+	for (synapse, strength) in self.synapses.iter_mut().zip(strengths) {
+	    synapse.strength = strength;
+	};
+    }
+
+    pub fn update_inhibitory_strengths(&mut self, inhibitory_strengths: std::vec::Vec<f64>) {
+	for (synapse, inhibitory_strength) in self.synapses.iter_mut().zip(inhibitory_strengths) {
+	    synapse.inhibitory_strength = inhibitory_strength;
+	};
+    }
+
+    pub fn s_tags(&self) -> std::vec::Vec<f64> {
+	self.synapses.iter().map(|synapse| synapse.s_tag).collect()
+    }
+
+    pub fn update_s_tags(&mut self, s_tags: std::vec::Vec<f64>) {
+	for (synapse, s_tag) in self.synapses.iter_mut().zip(s_tags) {
+	    synapse.s_tag = s_tag;
+	};
+    }
+
     pub fn update_synapses(&mut self, dopamine: f64) {
 	for connection in self.network.positive_connections.iter() {
 	    let synapse: &mut Synapse = &mut self.synapses[connection.synapse_index];
@@ -178,6 +275,12 @@ impl Model {
 	};
     }
 
+    // synapses with an s_tag change strength every update_synapses so can't be warped past
+    pub fn has_pending_s_tags(&self) -> bool {
+	self.network.positive_connections.iter().any(
+	    |connection| self.synapses[connection.synapse_index].s_tag != 0.0)
+    }
+
     pub fn cap(&mut self, index: usize) {
 	self.synapses[index].cap(&self.synapse_parameters);
     }